@@ -1,7 +1,11 @@
 import argparse
+import asyncio
+import json
+import sys
 
-from cmd_chat.server import run_server
+from cmd_chat.server import run_server, ServerConfig
 from cmd_chat.client import Client
+from cmd_chat.crypto import SUITES
 
 
 def main():
@@ -11,25 +15,214 @@ def main():
     serve_p = subparsers.add_parser("serve", help="Run server")
     serve_p.add_argument("ip_address")
     serve_p.add_argument("port")
-    serve_p.add_argument("--password", "-p", required=True)
+    serve_p.add_argument("--password", "-p")
+    serve_p.add_argument("--handshake-timeout", type=float, default=10.0)
+    serve_p.add_argument("--handshake-rate", type=float, default=1.0)
+    serve_p.add_argument("--handshake-burst", type=int, default=5)
+    serve_p.add_argument("--max-pending-handshakes", type=int, default=64)
+    serve_p.add_argument("--max-connections", type=int, default=1024)
+    serve_p.add_argument("--max-connections-per-ip", type=int, default=16)
+    serve_p.add_argument("--backlog", type=int, default=128)
+    serve_p.add_argument("--message-rate", type=float, default=5.0, help="msgs/sec per user")
+    serve_p.add_argument("--message-burst", type=int, default=20)
+    serve_p.add_argument(
+        "--byte-rate", type=float, default=512 * 1024, help="inbound bytes/sec per user"
+    )
+    serve_p.add_argument("--byte-burst", type=int, default=2 * 1024 * 1024)
+    serve_p.add_argument(
+        "--inbound-policy", choices=("delay", "drop", "disconnect"), default="delay"
+    )
+    serve_p.add_argument("--metrics-port", type=int, help="serve Prometheus metrics")
+    serve_p.add_argument("--metrics-host", default="127.0.0.1")
+    serve_p.add_argument(
+        "--lag-interval",
+        type=float,
+        default=0.25,
+        help="seconds between event-loop lag samples (0 disables)",
+    )
+    serve_p.add_argument(
+        "--lag-threshold",
+        type=float,
+        default=0.1,
+        help="lag in seconds that is logged as a stall",
+    )
+    serve_p.add_argument(
+        "--heartbeat",
+        type=float,
+        default=15.0,
+        help="seconds between pings to each client (0 disables)",
+    )
+    serve_p.add_argument(
+        "--heartbeat-misses",
+        type=int,
+        default=3,
+        help="silent heartbeat intervals before a client is dropped",
+    )
+    serve_p.add_argument(
+        "--shutdown-timeout",
+        type=float,
+        default=5.0,
+        help="seconds to flush clients on Ctrl-C or drain",
+    )
+    serve_p.add_argument(
+        "--admin-socket", metavar="PATH", help="unix socket for admin commands"
+    )
+    serve_p.add_argument(
+        "--handoff-socket",
+        metavar="PATH",
+        help="unix socket a new process can take this one over through",
+    )
+    serve_p.add_argument(
+        "--takeover",
+        metavar="PATH",
+        help="take the listening socket and history from a running server",
+    )
+    serve_p.add_argument(
+        "--ciphers",
+        default=",".join(SUITES),
+        help="comma-separated cipher suites in order of preference",
+    )
 
     connect_p = subparsers.add_parser("connect", help="Connect to server")
     connect_p.add_argument("ip_address")
     connect_p.add_argument("port")
     connect_p.add_argument("username")
     connect_p.add_argument("password")
+    connect_p.add_argument("--fps", type=float, default=10.0)
+    connect_p.add_argument("--cache-size", type=int, default=10_000)
+    connect_p.add_argument(
+        "--cache-file",
+        help="keep decrypted messages in an encrypted file between sessions",
+    )
+    connect_p.add_argument(
+        "--heartbeat", type=float, default=15.0, help="seconds between pings (0 disables)"
+    )
+    connect_p.add_argument(
+        "--downloads", metavar="DIR", help="save files other users /send here"
+    )
+    connect_p.add_argument(
+        "--reconnect",
+        type=int,
+        default=5,
+        help="attempts to rejoin after losing the server (0 disables)",
+    )
+
+    admin_p = subparsers.add_parser("admin", help="Send a command to a running server")
+    admin_p.add_argument("socket", help="the server's --admin-socket path")
+    admin_p.add_argument("admin_command", nargs="+", help="e.g. stats, kick alice")
+
+    bench_p = subparsers.add_parser("bench", help="Run benchmarks")
+    bench_sub = bench_p.add_subparsers(dest="bench", required=True)
+
+    crypto_p = bench_sub.add_parser("crypto", help="Cipher suite throughput")
+    crypto_p.add_argument("--iterations", type=int, default=2000)
+
+    load_p = bench_sub.add_parser("load", help="Simulated clients against a server")
+    load_p.add_argument("--host", help="target server (default: in-process)")
+    load_p.add_argument("--port", type=int)
+    load_p.add_argument("--password", default="bench")
+    load_p.add_argument("--clients", type=int, default=10)
+    load_p.add_argument("--rate", type=float, default=1.0, help="msgs/sec per client")
+    load_p.add_argument("--duration", type=float, default=10.0)
+    load_p.add_argument("--size", type=int, default=64, help="message padding")
+
+    micro_p = bench_sub.add_parser("micro", help="Server hot-path microbenchmarks")
+    micro_p.add_argument("--filter", help="only run benchmarks containing this")
+    micro_p.add_argument("--min-time", type=float, default=0.05)
+    micro_p.add_argument("--repeat", type=int, default=5)
+    micro_p.add_argument("--save", metavar="PATH", help="write results as a baseline")
+    micro_p.add_argument("--compare", metavar="PATH", help="compare with a baseline")
+    micro_p.add_argument("--threshold", type=float, default=0.10)
 
     args = parser.parse_args()
 
     if args.command == "serve":
-        run_server(host=args.ip_address, port=int(args.port), password=args.password)
+        if not args.password and not args.takeover:
+            parser.error("--password is required unless --takeover is given")
+        ciphers = tuple(c.strip() for c in args.ciphers.split(",") if c.strip())
+        if not ciphers or any(c not in SUITES for c in ciphers):
+            parser.error(f"--ciphers must be a subset of {','.join(SUITES)}")
+        config = ServerConfig(
+            handshake_timeout=args.handshake_timeout,
+            handshake_rate_per_ip=args.handshake_rate,
+            handshake_burst_per_ip=args.handshake_burst,
+            max_pending_handshakes=args.max_pending_handshakes,
+            max_connections=args.max_connections,
+            max_connections_per_ip=args.max_connections_per_ip,
+            listen_backlog=args.backlog,
+            message_rate=args.message_rate,
+            message_burst=args.message_burst,
+            byte_rate=args.byte_rate,
+            byte_burst=args.byte_burst,
+            inbound_policy=args.inbound_policy,
+            cipher_suites=ciphers,
+            metrics_host=args.metrics_host,
+            metrics_port=args.metrics_port,
+            lag_interval=args.lag_interval,
+            lag_threshold=args.lag_threshold,
+            admin_socket=args.admin_socket,
+            shutdown_timeout=args.shutdown_timeout,
+            heartbeat_interval=args.heartbeat,
+            heartbeat_misses=args.heartbeat_misses,
+            handoff_socket=args.handoff_socket,
+            takeover=args.takeover,
+        )
+        run_server(
+            host=args.ip_address,
+            port=int(args.port),
+            password=args.password,
+            config=config,
+        )
     elif args.command == "connect":
         Client(
             server=args.ip_address,
             port=int(args.port),
             username=args.username,
             password=args.password,
+            fps=args.fps,
+            cache_size=args.cache_size,
+            cache_file=args.cache_file,
+            download_dir=args.downloads,
+            heartbeat_interval=args.heartbeat,
+            reconnect_attempts=args.reconnect,
         ).run()
+    elif args.command == "admin":
+        from cmd_chat.server.admin import admin_request
+
+        result = asyncio.run(admin_request(args.socket, " ".join(args.admin_command)))
+        print(json.dumps(result, indent=2, default=str))
+        sys.exit(1 if "error" in result else 0)
+    elif args.command == "bench":
+        from cmd_chat.bench import run_crypto_bench, run_load, run_micro_bench
+
+        if args.bench == "crypto":
+            run_crypto_bench(iterations=args.iterations)
+        elif args.bench == "load":
+            if args.host and args.port is None:
+                parser.error("--port is required with --host")
+            result = asyncio.run(
+                run_load(
+                    host=args.host,
+                    port=args.port,
+                    clients=args.clients,
+                    rate=args.rate,
+                    duration=args.duration,
+                    password=args.password,
+                    size=args.size,
+                )
+            )
+            print(result.summary())
+        elif args.bench == "micro":
+            _, regressions = run_micro_bench(
+                filter=args.filter,
+                min_time=args.min_time,
+                repeat=args.repeat,
+                save=args.save,
+                compare=args.compare,
+                threshold=args.threshold,
+            )
+            if regressions:
+                sys.exit(1)
 
 
 if __name__ == "__main__":
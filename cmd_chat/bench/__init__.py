@@ -0,0 +1,5 @@
+from .crypto import run_crypto_bench
+from .load import run_load
+from .micro import run_micro_bench
+
+__all__ = ["run_crypto_bench", "run_load", "run_micro_bench"]
@@ -0,0 +1,70 @@
+import json
+import os
+import time
+from dataclasses import dataclass
+
+from ..crypto import SUITES, RoomCipher
+
+SIZES = (32, 256, 4096)
+
+
+@dataclass
+class CryptoResult:
+    suite: str
+    size: int
+    encrypt_per_sec: float
+    decrypt_per_sec: float
+    raw_bytes: int
+    wire_bytes: int
+
+
+def _best_rate(fn, iterations: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return iterations / best
+
+
+def bench_suite(
+    suite: str, size: int, iterations: int = 2000, repeat: int = 5
+) -> CryptoResult:
+    cipher = RoomCipher.derive(b"benchmark", os.urandom(0x10), suite)
+    plaintext = os.urandom(size // 2).hex().ljust(size, "x")
+    token = cipher.encrypt_text(plaintext)
+    frame = json.dumps({"type": "message", "text": token})
+
+    return CryptoResult(
+        suite=suite,
+        size=size,
+        encrypt_per_sec=_best_rate(
+            lambda: cipher.encrypt_text(plaintext), iterations, repeat
+        ),
+        decrypt_per_sec=_best_rate(lambda: cipher.decrypt_text(token), iterations, repeat),
+        raw_bytes=len(cipher.encrypt(plaintext.encode())),
+        wire_bytes=len(frame) - len(json.dumps({"type": "message", "text": ""})),
+    )
+
+
+def run_crypto_bench(
+    sizes: tuple[int, ...] = SIZES, iterations: int = 2000, repeat: int = 5
+) -> list[CryptoResult]:
+    results = [
+        bench_suite(suite, size, iterations, repeat)
+        for size in sizes
+        for suite in SUITES
+    ]
+    print(
+        f"{'suite':<20}{'size':>7}{'enc/s':>12}{'dec/s':>12}"
+        f"{'enc MB/s':>10}{'raw B':>8}{'wire B':>8}"
+    )
+    for r in results:
+        print(
+            f"{r.suite:<20}{r.size:>7}{r.encrypt_per_sec:>12,.0f}"
+            f"{r.decrypt_per_sec:>12,.0f}"
+            f"{r.encrypt_per_sec * r.size / 1e6:>10.1f}"
+            f"{r.raw_bytes:>8}{r.wire_bytes:>8}"
+        )
+    return results
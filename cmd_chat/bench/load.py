@@ -0,0 +1,178 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import Optional
+
+from ..client.core import AsyncChatClient
+from ..server.config import ServerConfig
+from ..server.profiling import rss_bytes
+from ..server.server import ChatServer
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@dataclass
+class LoadResult:
+    clients: int
+    duration: float
+    sent: int = 0
+    delivered: int = 0
+    errors: int = 0
+    handshakes: list[float] = field(default_factory=list)
+    latencies: list[float] = field(default_factory=list)
+    rss: Optional[int] = None
+
+    @property
+    def delivered_per_sec(self) -> float:
+        return self.delivered / self.duration if self.duration else 0.0
+
+    def summary(self) -> str:
+        ms = lambda values, p: percentile(values, p) * 1000
+        rss = f"{self.rss / 2**20:.1f} MiB" if self.rss else "n/a"
+        return "\n".join(
+            [
+                f"clients            {self.clients} ({self.errors} failed)",
+                f"sent               {self.sent}",
+                f"delivered          {self.delivered} ({self.delivered_per_sec:,.0f} msg/s)",
+                "handshake ms       p50 {:.1f}  p95 {:.1f}  p99 {:.1f}".format(
+                    *(ms(self.handshakes, p) for p in (50, 95, 99))
+                ),
+                "fan-out ms         p50 {:.1f}  p95 {:.1f}  p99 {:.1f}".format(
+                    *(ms(self.latencies, p) for p in (50, 95, 99))
+                ),
+                f"server rss         {rss}",
+            ]
+        )
+
+
+class SimulatedClient:
+    def __init__(self, host: str, port: int, name: str, password: str, result: LoadResult):
+        self.chat = AsyncChatClient(host, port, name, password, cache_size=0x100)
+        self.result = result
+        self._reader: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        start = time.perf_counter()
+        await self.chat.connect()
+        self.result.handshakes.append(time.perf_counter() - start)
+        self._reader = asyncio.create_task(self._receive())
+
+    async def _receive(self) -> None:
+        async for event in self.chat.events():
+            if event.type != "message" or not event.text:
+                continue
+            sent_at, _, _ = event.text.partition(":")
+            with suppress(ValueError):
+                self.result.latencies.append(time.perf_counter() - float(sent_at))
+                self.result.delivered += 1
+
+    async def send_loop(self, rate: float, deadline: float, size: int) -> None:
+        interval = 1.0 / rate
+        padding = "x" * size
+        next_send = time.perf_counter() + interval * (os.urandom(1)[0] / 255)
+        try:
+            while (now := time.perf_counter()) < deadline:
+                if now < next_send:
+                    await asyncio.sleep(next_send - now)
+                    continue
+                await self.chat.send(f"{time.perf_counter()!r}:{padding}")
+                self.result.sent += 1
+                next_send += interval
+        except (OSError, ConnectionError):
+            self.result.errors += 1
+
+    async def close(self) -> None:
+        if self._reader:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+        await self.chat.close()
+
+
+def _answer_rss(conn) -> None:
+    with suppress(EOFError, OSError):
+        while conn.recv() == "rss":
+            conn.send(rss_bytes())
+
+
+def _serve(password: str, config: ServerConfig, conn) -> None:
+    server = ChatServer(password, config)
+    sock = server.listen("127.0.0.1", 0)
+    conn.send(sock.getsockname()[1])
+    threading.Thread(target=_answer_rss, args=(conn,), daemon=True).start()
+    asyncio.run(server.serve(sock))
+
+
+async def run_load(
+    host: Optional[str] = None,
+    port: Optional[int] = None,
+    clients: int = 10,
+    rate: float = 1.0,
+    duration: float = 10.0,
+    password: str = "bench",
+    size: int = 64,
+    concurrency: int = 32,
+) -> LoadResult:
+    loop = asyncio.get_running_loop()
+    process = pipe = None
+    if host is None:
+        config = ServerConfig(
+            handshake_rate_per_ip=float(clients),
+            handshake_burst_per_ip=clients,
+            handshake_rate_global=float(clients),
+            handshake_burst_global=clients,
+            max_pending_handshakes=clients,
+            max_pending_per_ip=clients,
+            max_connections=clients + 1,
+            max_connections_per_ip=clients + 1,
+            message_rate=max(5.0, rate * 2),
+            message_burst=max(20, int(rate * 4)),
+        )
+        ctx = multiprocessing.get_context("spawn")
+        pipe, child = ctx.Pipe()
+        process = ctx.Process(target=_serve, args=(password, config, child), daemon=True)
+        process.start()
+        host, port = "127.0.0.1", await loop.run_in_executor(None, pipe.recv)
+
+    result = LoadResult(clients=clients, duration=duration)
+    simulated = [
+        SimulatedClient(host, port, f"bench-{os.getpid()}-{i}", password, result)
+        for i in range(clients)
+    ]
+    gate = asyncio.Semaphore(concurrency)
+
+    async def connect(client: SimulatedClient) -> bool:
+        async with gate:
+            try:
+                await client.connect()
+                return True
+            except (OSError, ValueError, ConnectionError, asyncio.TimeoutError):
+                result.errors += 1
+                return False
+
+    try:
+        connected = await asyncio.gather(*(connect(c) for c in simulated))
+        live = [c for c, ok in zip(simulated, connected) if ok]
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(c.send_loop(rate, deadline, size) for c in live))
+        await asyncio.sleep(min(1.0, duration / 4))
+        if pipe:
+            pipe.send("rss")
+            result.rss = await loop.run_in_executor(None, pipe.recv)
+    finally:
+        await asyncio.gather(*(c.close() for c in simulated), return_exceptions=True)
+        if process:
+            process.terminate()
+            await loop.run_in_executor(None, process.join)
+            pipe.close()
+
+    return result
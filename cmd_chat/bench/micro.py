@@ -0,0 +1,321 @@
+import asyncio
+import gc
+import itertools
+import json
+import platform
+import random
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import srp
+from cryptography.fernet import Fernet
+
+from ..server.hooks import Hooks
+from ..server.managers import ConnectionManager
+from ..server.models import Message, UserSession
+from ..server.server import ChatServer
+from ..server.srp_auth import SRPAuthManager
+from ..server.stores import MessageStore, UserSessionStore
+
+STORE_SIZES = (10, 100, 1000, 10000)
+FANOUT_SIZES = (1, 10, 100, 1000)
+PAYLOAD_SIZES = (64, 1024, 16384)
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable[[int], Callable]
+    sizes: tuple[int, ...] = (1,)
+    is_async: bool = False
+
+
+@dataclass
+class Timing:
+    name: str
+    size: int
+    best: float
+    median: float
+    iterations: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.size}]"
+
+
+class NullWriter:
+    __slots__ = ("written",)
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data: bytes) -> None:
+        self.written += len(data)
+
+    async def drain(self) -> None:
+        pass
+
+
+def _messages(count: int) -> list[Message]:
+    rng = random.Random(count)
+    return [
+        Message(
+            text=rng.randbytes(48).hex(),
+            user_ip="10.0.0.1",
+            username=f"user{i % 50}",
+        )
+        for i in range(count)
+    ]
+
+
+def _message_store(count: int) -> MessageStore:
+    store = MessageStore()
+    for m in _messages(count):
+        store.add(m)
+    return store
+
+
+def _session_store(count: int) -> UserSessionStore:
+    store = UserSessionStore()
+    for i in range(count):
+        store.add(UserSession(user_id=f"id-{i}", ip="10.0.0.1", username=f"user{i}"))
+    return store
+
+
+ADD_BATCH = 1024
+
+
+def bench_message_add(size: int) -> Callable:
+    store = _message_store(size)
+    pool = [Message(text="x" * 96, username="bench") for _ in range(ADD_BATCH)]
+    added = 0
+
+    def add():
+        nonlocal added
+        if added == ADD_BATCH:
+            del store._messages[size:]
+            added = 0
+        store.add(pool[added])
+        added += 1
+
+    return add
+
+
+def bench_message_get_all(size: int) -> Callable:
+    return _message_store(size).get_all
+
+
+def bench_username_exists(size: int) -> Callable:
+    store = _session_store(size)
+    return lambda: store.username_exists("missing")
+
+
+def bench_cleanup_stale(size: int) -> Callable:
+    return _session_store(size).cleanup_stale
+
+
+def bench_broadcast(size: int) -> Callable:
+    manager = ConnectionManager()
+    manager.active_connections.update({f"id-{i}": NullWriter() for i in range(size)})
+    frame = json.dumps({"type": "message", "data": {"text": "x" * 96}})
+    return lambda: manager.broadcast(frame)
+
+
+def bench_init_snapshot(size: int) -> Callable:
+    server = ChatServer("bench")
+    server.message_store = _message_store(size)
+    server.session_store = _session_store(min(size, 1000))
+    return lambda: (json.dumps(server.init_payload()) + "\n").encode()
+
+
+def _srp_client(password: bytes) -> tuple[srp.User, bytes]:
+    usr = srp.User(b"chat", password, hash_alg=srp.SHA256)
+    return usr, usr.start_authentication()[1]
+
+
+def bench_srp_init(size: int) -> Callable:
+    manager = SRPAuthManager("bench")
+    _, A = _srp_client(b"bench")
+
+    def run():
+        user_id, _, _ = manager.init_auth("bench", A)
+        manager.remove_session(user_id)
+
+    return run
+
+
+def bench_srp_verify(size: int) -> Callable:
+    manager = SRPAuthManager("bench")
+    pool = []
+    for _ in range(8):
+        usr, A = _srp_client(b"bench")
+        user_id, B, salt = manager.init_auth("bench", A)
+        pool.append((user_id, usr.process_challenge(salt, B)))
+    cycle = itertools.cycle(pool)
+    return lambda: manager.verify_auth(*next(cycle))
+
+
+def bench_fernet_encrypt(size: int) -> Callable:
+    fernet = Fernet(Fernet.generate_key())
+    payload = random.Random(size).randbytes(size)
+    return lambda: fernet.encrypt(payload)
+
+
+def bench_fernet_decrypt(size: int) -> Callable:
+    fernet = Fernet(Fernet.generate_key())
+    token = fernet.encrypt(random.Random(size).randbytes(size))
+    return lambda: fernet.decrypt(token)
+
+
+def bench_hooks_idle(size: int) -> Callable:
+    hooks = Hooks()
+
+    def run():
+        with hooks.span("bench"):
+            pass
+
+    return run
+
+
+def bench_hooks_traced(size: int) -> Callable:
+    hooks = Hooks()
+    hooks.on_span(lambda name, duration, fields: None)
+
+    def run():
+        with hooks.span("bench", size=size):
+            pass
+
+    return run
+
+
+BENCHMARKS = [
+    Benchmark("message_store.add", bench_message_add, STORE_SIZES),
+    Benchmark("message_store.get_all", bench_message_get_all, STORE_SIZES),
+    Benchmark("session_store.username_exists", bench_username_exists, STORE_SIZES),
+    Benchmark("session_store.cleanup_stale", bench_cleanup_stale, STORE_SIZES),
+    Benchmark("connection_manager.broadcast", bench_broadcast, FANOUT_SIZES, True),
+    Benchmark("server.init_snapshot", bench_init_snapshot, STORE_SIZES),
+    Benchmark("srp.init_auth", bench_srp_init),
+    Benchmark("srp.verify_auth", bench_srp_verify),
+    Benchmark("fernet.encrypt", bench_fernet_encrypt, PAYLOAD_SIZES),
+    Benchmark("fernet.decrypt", bench_fernet_decrypt, PAYLOAD_SIZES),
+    Benchmark("hooks.span_idle", bench_hooks_idle),
+    Benchmark("hooks.span_traced", bench_hooks_traced),
+]
+
+
+def _timer(fn: Callable, is_async: bool, loop: asyncio.AbstractEventLoop):
+    if is_async:
+
+        async def batch(n: int) -> None:
+            for _ in range(n):
+                await fn()
+
+        def timed(n: int) -> float:
+            start = time.perf_counter()
+            loop.run_until_complete(batch(n))
+            return time.perf_counter() - start
+
+    else:
+
+        def timed(n: int) -> float:
+            start = time.perf_counter()
+            for _ in range(n):
+                fn()
+            return time.perf_counter() - start
+
+    return timed
+
+
+def measure(
+    bench: Benchmark,
+    size: int,
+    min_time: float = 0.05,
+    repeat: int = 5,
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+) -> Timing:
+    own_loop = loop is None
+    loop = loop or asyncio.new_event_loop()
+    try:
+        timed = _timer(bench.setup(size), bench.is_async, loop)
+
+        iterations = 1
+        while (elapsed := timed(iterations)) < min_time and iterations < 1 << 24:
+            iterations *= 2 if elapsed == 0 else max(2, int(min_time / elapsed * 1.2))
+
+        gc_enabled = gc.isenabled()
+        gc.collect()
+        gc.disable()
+        try:
+            runs = [timed(iterations) / iterations for _ in range(repeat)]
+        finally:
+            if gc_enabled:
+                gc.enable()
+    finally:
+        if own_loop:
+            loop.close()
+
+    return Timing(bench.name, size, min(runs), statistics.median(runs), iterations)
+
+
+def run_micro_bench(
+    filter: Optional[str] = None,
+    min_time: float = 0.05,
+    repeat: int = 5,
+    save: Optional[str] = None,
+    compare: Optional[str] = None,
+    threshold: float = 0.10,
+) -> tuple[list[Timing], list[str]]:
+    baseline = {}
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)["results"]
+
+    loop = asyncio.new_event_loop()
+    timings = []
+    regressions = []
+    print(f"{'benchmark':<40}{'best':>12}{'median':>12}{'ops/s':>14}{'vs base':>10}")
+    try:
+        for bench in BENCHMARKS:
+            if filter and filter not in bench.name:
+                continue
+            for size in bench.sizes:
+                t = measure(bench, size, min_time, repeat, loop)
+                timings.append(t)
+                delta = ""
+                if t.key in baseline:
+                    change = t.best / baseline[t.key] - 1
+                    delta = f"{change:+.1%}"
+                    if change > threshold:
+                        regressions.append(t.key)
+                        delta += " !"
+                print(
+                    f"{t.key:<40}{_fmt(t.best):>12}{_fmt(t.median):>12}"
+                    f"{1 / t.best:>14,.0f}{delta:>10}"
+                )
+    finally:
+        loop.close()
+
+    if save:
+        with open(save, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "results": {t.key: t.best for t in timings},
+                },
+                f,
+                indent=2,
+            )
+    if regressions:
+        print(f"[!] {len(regressions)} regression(s) over {threshold:.0%}")
+    return timings, regressions
+
+
+def _fmt(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
@@ -1,3 +1,4 @@
 from .client import Client
+from .core import AsyncChatClient, ChatEvent
 
-__all__ = ["Client"]
+__all__ = ["Client", "AsyncChatClient", "ChatEvent"]
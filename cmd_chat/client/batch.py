@@ -0,0 +1,57 @@
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Optional, Sequence
+
+
+class BatchDecryptor:
+    def __init__(
+        self,
+        decrypt: Callable[[str], str],
+        chunk_size: int = 256,
+        workers: Optional[int] = None,
+    ):
+        self.decrypt = decrypt
+        self.chunk_size = chunk_size
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _decrypt_chunk(self, tokens: Sequence[Optional[str]]) -> list[Optional[str]]:
+        return [self.decrypt(t) if t else t for t in tokens]
+
+    async def stream(
+        self, tokens: Sequence[Optional[str]]
+    ) -> AsyncIterator[list[Optional[str]]]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix="cmd-chat-decrypt"
+            )
+        loop = asyncio.get_running_loop()
+        chunks = (
+            tokens[i : i + self.chunk_size]
+            for i in range(0, len(tokens), self.chunk_size)
+        )
+        in_flight: deque[asyncio.Future] = deque()
+
+        def submit() -> None:
+            if (chunk := next(chunks, None)) is not None:
+                in_flight.append(
+                    loop.run_in_executor(self._executor, self._decrypt_chunk, chunk)
+                )
+
+        for _ in range(self.workers * 2):
+            submit()
+        try:
+            while in_flight:
+                result = await in_flight.popleft()
+                submit()
+                yield result
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def close(self) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
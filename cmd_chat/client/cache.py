@@ -0,0 +1,83 @@
+import json
+import os
+from collections import OrderedDict
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from ..crypto import NONCE_SIZE, derive_key
+
+CACHE_KEY_INFO = b"cmd-chat-local-cache"
+
+
+class PlaintextCache(OrderedDict):
+    def __init__(self, capacity: int = 10_000, max_bytes: int = 16 << 20):
+        super().__init__()
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+
+    def __getitem__(self, key: str) -> str:
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: str, value: str) -> None:
+        if key in self:
+            self.size_bytes -= len(super().__getitem__(key))
+            self.move_to_end(key)
+        super().__setitem__(key, value)
+        self.size_bytes += len(value)
+        while len(self) > self.capacity or (
+            self.size_bytes > self.max_bytes and len(self) > 1
+        ):
+            self.popitem(last=False)
+
+    def __delitem__(self, key: str) -> None:
+        self.size_bytes -= len(super().__getitem__(key))
+        super().__delitem__(key)
+
+    def popitem(self, last: bool = True) -> tuple[str, str]:
+        key, value = super().popitem(last)
+        self.size_bytes -= len(value)
+        return key, value
+
+    def clear(self) -> None:
+        super().clear()
+        self.size_bytes = 0
+
+
+class EncryptedFileCache(PlaintextCache):
+    def __init__(self, path: str, key: bytes, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._aead = AESGCM(key)
+
+    @classmethod
+    def open(
+        cls, path: str, password: bytes, room_salt: bytes, **kwargs
+    ) -> "EncryptedFileCache":
+        cache = cls(path, derive_key(password, room_salt, CACHE_KEY_INFO), **kwargs)
+        cache.load()
+        return cache
+
+    def load(self) -> int:
+        try:
+            with open(self.path, "rb") as f:
+                blob = f.read()
+            nonce, ciphertext = blob[:NONCE_SIZE], blob[NONCE_SIZE:]
+            entries = json.loads(self._aead.decrypt(nonce, ciphertext, None))
+        except Exception:
+            return 0
+        for msg_id, text in entries:
+            self[msg_id] = text
+        return len(entries)
+
+    def save(self) -> None:
+        nonce = os.urandom(NONCE_SIZE)
+        payload = json.dumps(list(self.items())).encode()
+        blob = nonce + self._aead.encrypt(nonce, payload, None)
+        tmp = f"{self.path}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, self.path)
@@ -1,15 +1,15 @@
 import asyncio
-import json
-import base64
+import time
 from typing import Optional
 
 import srp
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives.kdf.hkdf import HKDF
-from cryptography.hazmat.primitives import hashes
 from rich.console import Console
-from rich.panel import Panel
-from rich.text import Text
+from rich.markup import escape
+
+from .cache import EncryptedFileCache
+from .core import AsyncChatClient, ChatEvent
+from .render import Renderer
+from .terminal import LineEditor, LineReader
 
 srp.rfc5054_enable()
 
@@ -23,200 +23,336 @@ BANNER = """
 [dim]                written by [bold magenta]SNEAKYBEAKY[/] with [bold red]♥[/][/]
 """
 
+VISIBLE_MESSAGES = 15
+TYPING_REFRESH = 2.0
+RECONNECT_DELAY = 0.5
+RECONNECT_MAX_DELAY = 10.0
+
 
-class Client:
+class Client(AsyncChatClient):
     def __init__(
-        self, server: str, port: int, username: str, password: Optional[str] = None
+        self,
+        server: str,
+        port: int,
+        username: str,
+        password: Optional[str] = None,
+        fps: float = 10.0,
+        cache_size: int = 10_000,
+        cache_file: Optional[str] = None,
+        download_dir: Optional[str] = None,
+        heartbeat_interval: float = 15.0,
+        reconnect_attempts: int = 5,
     ):
-        self.server = server
-        self.port = port
-        self.username = username
-        self.password = (password or "").encode()
-        self.user_id: Optional[str] = None
-        self.fernet: Optional[Fernet] = None
-        self.room_fernet: Optional[Fernet] = None
-
+        super().__init__(
+            server,
+            port,
+            username,
+            password,
+            cache_size=cache_size,
+            download_dir=download_dir,
+            heartbeat_interval=heartbeat_interval,
+        )
         self.console = Console()
-        self.messages: list[dict] = []
-        self.users: list[dict] = []
-        self.connected = False
+        self.fps = fps
+        self.renderer: Optional[Renderer] = None
+        self.line_reader: Optional[LineReader] = None
+        self._input_line = ""
+        self.scroll_offset = 0
+        self.cache_file = cache_file
+        self.reconnect_attempts = reconnect_attempts
+        self._uploads: set[asyncio.Task] = set()
+        self._typing_sent = 0.0
         self.running = False
 
-        self.reader: Optional[asyncio.StreamReader] = None
-        self.writer: Optional[asyncio.StreamWriter] = None
-
     def success(self, message: str) -> None:
-        self.console.print(f"[green]✓ {message}[/]")
+        self.notice(f"[green]✓ {message}[/]")
 
     def error(self, message: str) -> None:
-        self.console.print(f"[red]✗ {message}[/]")
+        self.notice(f"[red]✗ {message}[/]")
 
     def info(self, message: str) -> None:
-        self.console.print(f"[cyan]• {message}[/]")
-
-    async def send_json(self, data: dict) -> None:
-        line = json.dumps(data) + "\n"
-        self.writer.write(line.encode())
-        await self.writer.drain()
-
-    async def recv_json(self) -> dict:
-        line = await self.reader.readline()
-        if not line:
-            raise ConnectionError("Connection closed")
-        return json.loads(line.decode())
+        self.notice(f"[cyan]• {message}[/]")
 
     async def srp_authenticate(self) -> None:
+        self.success("Connected")
         self.info("Starting SRP handshake...")
 
-        usr = srp.User(b"chat", self.password, hash_alg=srp.SHA256)
-        _, A = usr.start_authentication()
-
-        await self.send_json(
-            {
-                "cmd": "srp_init",
-                "username": self.username,
-                "A": base64.b64encode(A).decode(),
-            }
-        )
-
-        init_data = await self.recv_json()
-        if "error" in init_data:
-            raise ValueError(init_data["error"])
-
-        self.user_id = init_data["user_id"]
-        B = base64.b64decode(init_data["B"])
-        salt = base64.b64decode(init_data["salt"])
-        room_salt = base64.b64decode(init_data["room_salt"])
+        room_salt = self.room_salt
+        await super().srp_authenticate()
+
+        if self.cache_file and self.room_salt != room_salt:
+            if isinstance(self._plaintext, EncryptedFileCache):
+                self._plaintext.save()
+            self._plaintext = EncryptedFileCache.open(
+                self.cache_file,
+                self.password,
+                self.room_salt,
+                capacity=self._plaintext.capacity,
+            )
+            self.info(f"Loaded {len(self._plaintext)} cached messages")
 
-        hkdf = HKDF(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=room_salt,
-            info=b"cmd-chat-room-key",
-        )
-        room_key = hkdf.derive(self.password)
-        self.room_fernet = Fernet(base64.urlsafe_b64encode(room_key))
-
-        M = usr.process_challenge(salt, B)
-        if M is None:
-            raise ValueError("SRP challenge processing failed")
-
-        await self.send_json(
-            {
-                "cmd": "srp_verify",
-                "user_id": self.user_id,
-                "M": base64.b64encode(M).decode(),
-            }
+        self.success(
+            f"SRP authenticated (session: {self.user_id[:8]}..., "
+            f"cipher: {self.room_cipher.suite})"
         )
 
-        verify_data = await self.recv_json()
-        if "error" in verify_data:
-            raise ValueError(verify_data["error"])
-
-        H_AMK = base64.b64decode(verify_data["H_AMK"])
-        usr.verify_session(H_AMK)
-
-        if not usr.authenticated():
-            raise ValueError("Server authentication failed")
-
-        session_key = base64.b64decode(verify_data["session_key"])
-        self.fernet = Fernet(session_key)
-
-        self.success(f"SRP authenticated (session: {self.user_id[:8]}...)")
-
-    def decrypt_message(self, msg: dict) -> dict:
-        if "text" in msg and msg["text"]:
-            try:
-                decrypted = self.room_fernet.decrypt(msg["text"].encode()).decode()
-                msg["text"] = decrypted
-            except Exception:
-                msg["text"] = "[decrypt failed]"
-        return msg
+    def visible_messages(self, count: int = VISIBLE_MESSAGES) -> list[dict]:
+        end = len(self.messages) - self.scroll_offset
+        window = self.messages[max(0, end - count) : end]
+        return [{**m, "text": self.message_text(m)} for m in window]
+
+    def scroll(self, lines: int) -> None:
+        max_offset = max(0, len(self.messages) - VISIBLE_MESSAGES)
+        self.scroll_offset = min(max(0, self.scroll_offset + lines), max_offset)
+
+    def format_message(self, msg: dict) -> str:
+        username = msg.get("username", "unknown")
+        text = msg.get("text", "")
+        timestamp = str(msg.get("timestamp", ""))[:19].replace("T", " ")
+        style = "green" if username == self.username else "cyan"
+        return f"[dim]{timestamp}[/] [{style}]{username}[/]: {text}"
+
+    def presence_line(self) -> str:
+        users_online = ", ".join(
+            escape(u.get("username", "?"))
+            + (" (away)" if u.get("status") == "away" else "")
+            for u in self.users
+        ) or "none"
+        line = f"[dim]Online: {users_online}[/]"
+        if typing := self.typing_users():
+            names = ", ".join(escape(name) for name in typing[:3])
+            more = f" +{len(typing) - 3}" if len(typing) > 3 else ""
+            line += f"  [italic]{names}{more} typing…[/]"
+        return line
 
     def render_messages(self) -> None:
+        live = self.renderer is not None and self.renderer.active
+
         self.console.clear()
         self.console.print(BANNER)
         self.console.print()
 
-        users_online = ", ".join(u.get("username", "?") for u in self.users) or "none"
-        self.console.print(f"[dim]Online: {users_online}[/]")
+        if not live:
+            self.console.print(self.presence_line())
         self.console.print("─" * 60)
 
-        display_messages = (
-            self.messages[-15:] if len(self.messages) > 15 else self.messages
-        )
+        display_messages = self.visible_messages()
 
         for msg in display_messages:
-            username = msg.get("username", "unknown")
-            text = msg.get("text", "")
-            timestamp = str(msg.get("timestamp", ""))[:19].replace("T", " ")
-            style = "green" if username == self.username else "cyan"
-            self.console.print(f"[dim]{timestamp}[/] [{style}]{username}[/]: {text}")
+            self.console.print(self.format_message(msg))
 
         if not display_messages:
             self.console.print("[dim italic]No messages yet...[/]")
 
-        self.console.print("─" * 60)
-        self.console.print("[dim]Type message and press Enter. 'q' to quit.[/]")
+        if not live:
+            self.console.print("─" * 60)
+            self.console.print("[dim]Type message and press Enter. 'q' to quit.[/]")
+
+    def redraw(self) -> None:
+        if self.renderer:
+            self.renderer.repaint(self.render_messages)
+            self.update_footer()
+        else:
+            self.render_messages()
+
+    def update_footer(self) -> None:
+        if self.renderer:
+            hint = "Type message and press Enter. 'q' to quit."
+            if self.line_reader and self.line_reader.interactive:
+                hint += " PgUp/PgDn to scroll."
+            if self.rtt is not None:
+                hint += f" RTT {self.rtt * 1000:.0f}ms"
+            self.renderer.set_footer(
+                "─" * 60,
+                self.presence_line(),
+                f"[dim]{hint}[/]",
+                f"[bold]>[/] {self._input_line}",
+            )
+        else:
+            self.render_messages()
+
+    def _on_input_change(self, editor: LineEditor) -> None:
+        before = escape(editor.buffer[: editor.cursor])
+        at = escape(editor.buffer[editor.cursor : editor.cursor + 1] or " ")
+        after = escape(editor.buffer[editor.cursor + 1 :])
+        self._input_line = f"{before}[reverse]{at}[/reverse]{after}"
+        self._typing_changed(bool(editor.buffer))
+        self.update_footer()
+
+    def _typing_changed(self, typing: bool) -> None:
+        if not self.writer or not self.connected:
+            return
+        now = time.monotonic()
+        if typing and now - self._typing_sent >= TYPING_REFRESH:
+            self._typing_sent = now
+            asyncio.ensure_future(self.set_typing(True))
+        elif not typing and self._typing_sent:
+            self._typing_sent = 0.0
+            asyncio.ensure_future(self.set_typing(False))
+
+    def _on_key(self, name: str) -> None:
+        self.scroll(VISIBLE_MESSAGES if name == "page_up" else -VISIBLE_MESSAGES)
+        self.redraw()
+
+    def notice(self, line: str) -> None:
+        if self.renderer:
+            self.renderer.notice(line)
+        else:
+            self.console.print(line)
+
+    def show_message(self) -> None:
+        if self.renderer and not self.scroll_offset:
+            self.renderer.append(self.format_message(self.visible_messages(1)[0]))
+        else:
+            self.redraw()
+
+    def on_event(self, event: ChatEvent) -> None:
+        match event.type:
+            case "init" | "cleared":
+                self.scroll_offset = 0
+                self.redraw()
+            case "message":
+                if self.scroll_offset:
+                    self.scroll_offset += 1
+                self.show_message()
+            case "user_joined" | "user_left" | "presence" | "pong":
+                self.update_footer()
+            case "file_offer":
+                who, size = event.data.get("username"), event.data.get("size", 0)
+                where = "" if self.files else " (start with --downloads to receive)"
+                self.notice(
+                    f"[yellow]{escape(str(who))} is sending "
+                    f"{escape(event.text or '')} ({size:,} bytes){where}[/]"
+                )
+            case "file_end" if event.text:
+                self.notice(f"[green]Saved {escape(event.text)}[/]")
+            case "file_cancel" | "file_error":
+                reason = event.data.get("error") or "cancelled"
+                self.notice(f"[red]File transfer failed: {escape(reason)}[/]")
+            case "direct":
+                who = escape(str(event.data.get("username")))
+                self.notice(f"[magenta]{who} → you: {escape(event.text or '')}[/]")
+            case "direct_error":
+                to = escape(str(event.data.get("to")))
+                error = escape(str(event.data.get("error")))
+                self.notice(f"[red]Not delivered to {to}: {error}[/]")
+            case "suite":
+                suite = escape(self.room_cipher.suite) if self.room_cipher else "?"
+                self.notice(f"[yellow]Room cipher is now {suite}[/]")
+            case "not_sent":
+                self.notice(f"[yellow]Not sent: {escape(str(event.data.get('reason')))}[/]")
+            case "rate_limited":
+                self.notice("[yellow]Slow down: the server is dropping your messages[/]")
+            case "kicked":
+                self.notice(f"[red]{escape(event.data.get('reason') or event.type)}[/]")
+                self.running = False
+            case "server_shutdown":
+                self.notice(f"[red]{escape(event.data.get('reason') or event.type)}[/]")
 
     async def receive_loop(self) -> None:
-        try:
-            while self.running:
-                line = await self.reader.readline()
-                if not line:
-                    break
-
-                data = json.loads(line.decode())
-                msg_type = data.get("type", "")
-
-                if msg_type == "init":
-                    self.messages = [
-                        self.decrypt_message(m) for m in data.get("messages", [])
-                    ]
-                    self.users = data.get("users", [])
-                    self.connected = True
-                    self.render_messages()
-                elif msg_type == "message":
-                    msg_data = self.decrypt_message(data.get("data", {}))
-                    self.messages.append(msg_data)
-                    self.render_messages()
-                elif msg_type == "user_joined":
-                    self.users.append(
-                        {
-                            "user_id": data.get("user_id"),
-                            "username": data.get("username"),
-                        }
-                    )
-                    self.render_messages()
-                elif msg_type == "user_left":
-                    left_id = data.get("user_id")
-                    self.users = [u for u in self.users if u.get("user_id") != left_id]
-                    self.render_messages()
-                elif msg_type == "cleared":
-                    self.messages = []
-                    self.render_messages()
-        except asyncio.CancelledError:
-            pass
-        except Exception:
-            self.connected = False
+        while self.running:
+            try:
+                async for event in self.events():
+                    self.on_event(event)
+                    if not self.running:
+                        return
+            except asyncio.CancelledError:
+                return
+            except Exception:
+                self.connected = False
+            if not await self.rejoin():
+                return
+
+    async def rejoin(self) -> bool:
+        delay = RECONNECT_DELAY
+        for attempt in range(1, self.reconnect_attempts + 1):
+            if not self.running:
+                break
+            self.notice(
+                f"[yellow]Connection lost, reconnecting "
+                f"({attempt}/{self.reconnect_attempts})...[/]"
+            )
+            await asyncio.sleep(delay)
+            try:
+                await self.reconnect()
+                return True
+            except (OSError, asyncio.TimeoutError, ValueError) as e:
+                self.notice(f"[red]Reconnect failed: {escape(str(e) or type(e).__name__)}[/]")
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        return False
+
+    async def read_line(self) -> str:
+        if self.line_reader:
+            return await self.line_reader.readline()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, input)
 
     async def input_loop(self) -> None:
-        loop = asyncio.get_event_loop()
         while self.running:
             try:
-                text = await loop.run_in_executor(None, input)
+                text = await self.read_line()
                 if text.lower() in ("q", "quit", "exit"):
                     self.running = False
                     break
+                if text in ("/away", "/back"):
+                    await self.set_status("away" if text == "/away" else "active")
+                    continue
+                if text.startswith("/key "):
+                    self.show_keys(text[5:].strip())
+                    continue
+                if text.startswith("/msg "):
+                    await self.direct_message(text[5:])
+                    continue
+                if text.startswith("/send "):
+                    task = asyncio.create_task(self.upload(text[6:].strip()))
+                    self._uploads.add(task)
+                    task.add_done_callback(self._uploads.discard)
+                    continue
+                if text.startswith("/search "):
+                    found = await self.search(text[8:].strip())
+                    self.notice(f"[yellow]{len(found)} match(es)[/]")
+                    for msg in found[-VISIBLE_MESSAGES:]:
+                        self.notice(self.format_message(msg))
+                    continue
                 if text.strip():
-                    encrypted = self.room_fernet.encrypt(text.encode()).decode()
-                    await self.send_json({"type": "message", "text": encrypted})
+                    self._typing_sent = 0.0
+                    await self.send(text)
+            except ConnectionError:
+                self.notice("[yellow]Not sent: reconnecting to the server[/]")
             except (EOFError, KeyboardInterrupt):
                 self.running = False
                 break
             except asyncio.CancelledError:
                 break
 
+    def show_keys(self, username: str) -> None:
+        try:
+            theirs = self.key_fingerprint(username)
+        except ValueError as e:
+            self.notice(f"[red]{escape(str(e))}[/]")
+            return
+        mine = self.key_fingerprint()
+        self.notice(f"[magenta]you: {mine}  {escape(username)}: {theirs}[/]")
+
+    async def direct_message(self, args: str) -> None:
+        to, _, body = args.strip().partition(" ")
+        if not body.strip():
+            self.notice("[red]Usage: /msg NAME text[/]")
+            return
+        try:
+            await self.send_direct(to, body)
+            self.notice(f"[magenta]→ {escape(to)}: {escape(body)}[/]")
+        except ValueError as e:
+            self.notice(f"[red]{escape(str(e))}[/]")
+
+    async def upload(self, path: str) -> None:
+        try:
+            self.notice(f"[yellow]Sending {escape(path)}...[/]")
+            await self.send_file(path)
+            self.notice(f"[green]Sent {escape(path)}[/]")
+        except (OSError, ValueError) as e:
+            self.notice(f"[red]Send failed: {escape(str(e))}[/]")
+
     async def run_async(self) -> None:
         self.console.clear()
         self.console.print(BANNER)
@@ -224,13 +360,16 @@ class Client:
 
         try:
             self.info(f"Connecting to {self.server}:{self.port}...")
-            self.reader, self.writer = await asyncio.wait_for(
-                asyncio.open_connection(self.server, self.port), timeout=10.0
-            )
-            self.success("Connected")
-
-            await self.srp_authenticate()
+            await self.connect(timeout=10.0)
             self.running = True
+            self.renderer = Renderer(self.console, self.fps)
+            self.renderer.start()
+            self.line_reader = LineReader.open(
+                on_change=self._on_input_change, on_key=self._on_key
+            )
+            if self.line_reader and not self.line_reader.start():
+                self.line_reader = None
+            self.update_footer()
 
             receive_task = asyncio.create_task(self.receive_loop())
             input_task = asyncio.create_task(self.input_loop())
@@ -246,6 +385,7 @@ class Client:
                 except asyncio.CancelledError:
                     pass
 
+            self.renderer.stop()
             self.console.print("\n[yellow]Disconnected[/]")
 
         except asyncio.TimeoutError:
@@ -262,12 +402,18 @@ class Client:
             self.error("Error occurred")
             traceback.print_exc()
         finally:
-            if self.writer:
-                self.writer.close()
+            if isinstance(self._plaintext, EncryptedFileCache):
                 try:
-                    await self.writer.wait_closed()
-                except Exception:
-                    pass
+                    self._plaintext.save()
+                except OSError as e:
+                    self.error(f"Cache not saved: {e}")
+            if self.line_reader:
+                self.line_reader.stop()
+                self.line_reader = None
+            if self.renderer:
+                self.renderer.stop()
+                self.renderer = None
+            await self.close()
 
     def run(self) -> None:
-        asyncio.run(self.run_async())
\ No newline at end of file
+        asyncio.run(self.run_async())
@@ -0,0 +1,476 @@
+import asyncio
+import base64
+import json
+import time
+from contextlib import suppress
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional, Sequence, Union
+from uuid import uuid4
+
+import srp
+from cryptography.fernet import Fernet
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+from ..crypto import (
+    FERNET,
+    SUITES,
+    DirectCipher,
+    RoomCipher,
+    fingerprint,
+    public_key_bytes,
+)
+from .batch import BatchDecryptor
+from .cache import PlaintextCache
+from .files import CHUNK_SIZE, WINDOW, FileReceiver, encrypt_chunk
+
+srp.rfc5054_enable()
+
+MAX_FRAME = 256 * 1024 * 1024
+ACK_BATCH = 32
+ACK_DELAY = 1.0
+
+
+@dataclass
+class ChatEvent:
+    type: str
+    data: dict
+    text: Optional[str] = None
+
+
+class AsyncChatClient:
+    def __init__(
+        self,
+        server: str,
+        port: int,
+        username: str,
+        password: Optional[str] = None,
+        cache_size: int = 10_000,
+        suites: Sequence[str] = SUITES,
+        download_dir: Optional[Union[str, Path]] = None,
+        heartbeat_interval: float = 15.0,
+        heartbeat_misses: int = 3,
+    ):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = (password or "").encode()
+        self.suites = list(suites)
+        self.user_id: Optional[str] = None
+        self.fernet: Optional[Fernet] = None
+        self.room_cipher: Optional[RoomCipher] = None
+        self.room_salt: Optional[bytes] = None
+        self.negotiated_suite = FERNET
+        self.direct_key = X25519PrivateKey.generate()
+        self.direct: Optional[DirectCipher] = None
+
+        self.messages: list[dict] = []
+        self.users: list[dict] = []
+        self.typing: set[str] = set()
+        self._plaintext = PlaintextCache(cache_size)
+        self.batch_decryptor = BatchDecryptor(self._decrypt_text)
+        self.files = FileReceiver(Path(download_dir)) if download_dir else None
+        self._outgoing: dict[str, asyncio.Semaphore] = {}
+        self._file_errors: dict[str, str] = {}
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_misses = heartbeat_misses
+        self.rtt: Optional[float] = None
+        self.server_heartbeat = False
+        self._pinged = 0.0
+        self.last_seq = 0
+        self.epoch: Optional[str] = None
+        self._acked = 0
+        self._received_at = 0.0
+        self.connected = False
+
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def __aenter__(self) -> "AsyncChatClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    @property
+    def room_fernet(self) -> Optional[Fernet]:
+        return self.room_cipher.fernet if self.room_cipher else None
+
+    @room_fernet.setter
+    def room_fernet(self, fernet: Optional[Fernet]) -> None:
+        self.room_cipher = RoomCipher(fernet) if fernet else None
+
+    async def connect(self, timeout: float = 10.0) -> None:
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.server, self.port, limit=MAX_FRAME),
+            timeout=timeout,
+        )
+        await self.srp_authenticate()
+
+    async def reconnect(self, timeout: float = 10.0) -> None:
+        self.connected = False
+        if self.writer:
+            self.writer.close()
+            with suppress(Exception):
+                await self.writer.wait_closed()
+        await self.connect(timeout)
+
+    async def close(self) -> None:
+        self.connected = False
+        self.batch_decryptor.close()
+        if self.files:
+            self.files.close()
+        if self.writer:
+            self.writer.close()
+            with suppress(Exception):
+                await self.writer.wait_closed()
+
+    async def send_json(self, data: dict) -> None:
+        line = json.dumps(data) + "\n"
+        self.writer.write(line.encode())
+        await self.writer.drain()
+
+    async def recv_json(self) -> dict:
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed")
+        return json.loads(line.decode())
+
+    async def srp_authenticate(self) -> None:
+        usr = srp.User(b"chat", self.password, hash_alg=srp.SHA256)
+        _, A = usr.start_authentication()
+
+        request = {
+            "cmd": "srp_init",
+            "username": self.username,
+            "A": base64.b64encode(A).decode(),
+            "suites": self.suites,
+            "public_key": base64.b64encode(public_key_bytes(self.direct_key)).decode(),
+            "heartbeat": self.heartbeat_interval > 0,
+        }
+        if self.last_seq and self.room_salt and self.epoch:
+            request["resume"] = {
+                "room_salt": base64.b64encode(self.room_salt).decode(),
+                "epoch": self.epoch,
+                "seq": self.last_seq,
+            }
+        await self.send_json(request)
+
+        init_data = await self.recv_json()
+        if "error" in init_data:
+            raise ValueError(init_data["error"])
+
+        self.user_id = init_data["user_id"]
+        B = base64.b64decode(init_data["B"])
+        salt = base64.b64decode(init_data["salt"])
+        self.room_salt = base64.b64decode(init_data["room_salt"])
+
+        self.negotiated_suite = init_data.get("suite", FERNET)
+        self.room_cipher = RoomCipher.derive(
+            self.password, self.room_salt, self.negotiated_suite
+        )
+        self.direct = DirectCipher.derive(self.password, self.room_salt, self.direct_key)
+
+        M = usr.process_challenge(salt, B)
+        if M is None:
+            raise ValueError("SRP challenge processing failed")
+
+        await self.send_json(
+            {
+                "cmd": "srp_verify",
+                "user_id": self.user_id,
+                "M": base64.b64encode(M).decode(),
+            }
+        )
+
+        verify_data = await self.recv_json()
+        if "error" in verify_data:
+            raise ValueError(verify_data["error"])
+
+        H_AMK = base64.b64decode(verify_data["H_AMK"])
+        usr.verify_session(H_AMK)
+
+        if not usr.authenticated():
+            raise ValueError("Server authentication failed")
+
+        session_key = base64.b64decode(verify_data["session_key"])
+        self.fernet = Fernet(session_key)
+
+    async def send(self, text: str) -> None:
+        await self.send_json(
+            {"type": "message", "text": self.room_cipher.encrypt_text(text)}
+        )
+
+    def peer_key(self, username: str) -> bytes:
+        peer = next((u for u in self.users if u.get("username") == username), None)
+        if not peer or not peer.get("public_key"):
+            raise ValueError(f"No key for {username}")
+        return base64.b64decode(peer["public_key"])
+
+    def key_fingerprint(self, username: Optional[str] = None) -> str:
+        return fingerprint(self.peer_key(username) if username else self.direct.public)
+
+    async def send_direct(self, username: str, text: str) -> None:
+        token = self.direct.encrypt_text(self.peer_key(username), text)
+        await self.send_json({"type": "direct", "to": username, "text": token})
+
+    def _decrypt_direct(self, data: dict) -> str:
+        peer = next((u for u in self.users if u.get("user_id") == data.get("user_id")), {})
+        try:
+            key = base64.b64decode(peer["public_key"])
+            return self.direct.decrypt_text(key, data.get("text", ""))
+        except Exception:
+            return "[decrypt failed]"
+
+    async def clear(self) -> None:
+        await self.send_json({"type": "clear"})
+
+    async def ping(self) -> None:
+        self._pinged = time.monotonic()
+        await self.send_json({"type": "ping", "ts": self._pinged})
+
+    async def ack(self) -> None:
+        self._acked = self.last_seq
+        await self.send_json(
+            {
+                "type": "ack",
+                "seq": self.last_seq,
+                "held": time.monotonic() - self._received_at,
+            }
+        )
+
+    def _received(self, seq) -> None:
+        if isinstance(seq, int) and seq > self.last_seq:
+            self.last_seq = seq
+            self._received_at = time.monotonic()
+
+    async def set_typing(self, active: bool = True) -> None:
+        await self.send_json({"type": "typing", "active": active})
+
+    async def set_status(self, status: str) -> None:
+        await self.send_json({"type": "presence", "status": status})
+
+    def typing_users(self) -> list[str]:
+        return [
+            u.get("username", "?")
+            for u in self.users
+            if u.get("user_id") in self.typing and u.get("user_id") != self.user_id
+        ]
+
+    async def send_file(self, path: Union[str, Path], window: int = WINDOW) -> str:
+        path = Path(path)
+        size = path.stat().st_size
+        chunks = -(-size // CHUNK_SIZE)
+        file_id = uuid4().hex
+        credit = self._outgoing[file_id] = asyncio.Semaphore(window)
+        try:
+            await self.send_json(
+                {
+                    "type": "file_offer",
+                    "file_id": file_id,
+                    "name": self.room_cipher.encrypt_text(path.name),
+                    "size": size,
+                    "chunks": chunks,
+                }
+            )
+            with open(path, "rb") as f:
+                for seq in range(chunks):
+                    await credit.acquire()
+                    self._raise_file_error(file_id)
+                    data = encrypt_chunk(
+                        self.room_cipher, file_id, seq, f.read(CHUNK_SIZE)
+                    )
+                    await self.send_json(
+                        {"type": "file_chunk", "file_id": file_id, "seq": seq, "data": data}
+                    )
+            for _ in range(window):
+                await credit.acquire()
+            self._raise_file_error(file_id)
+            await self.send_json({"type": "file_end", "file_id": file_id})
+        finally:
+            self._outgoing.pop(file_id, None)
+            self._file_errors.pop(file_id, None)
+        return file_id
+
+    def _raise_file_error(self, file_id: str) -> None:
+        if error := self._file_errors.get(file_id):
+            raise ValueError(error)
+
+    def _apply_file(self, msg_type: str, data: dict) -> ChatEvent:
+        file_id = data.get("file_id")
+        if msg_type in ("file_ack", "file_error"):
+            if msg_type == "file_error":
+                self._file_errors[file_id] = data.get("error") or "Transfer failed"
+            if credit := self._outgoing.get(file_id):
+                credit.release()
+            return ChatEvent(msg_type, data)
+        if msg_type == "file_offer":
+            name = self._decrypt_text(data.get("name", ""))
+            if self.files:
+                self.files.offer(data, name)
+            return ChatEvent(msg_type, data, name)
+        if not self.files:
+            return ChatEvent(msg_type, data)
+        try:
+            match msg_type:
+                case "file_chunk":
+                    self.files.chunk(self.room_cipher, data)
+                case "file_end":
+                    if incoming := self.files.end(file_id):
+                        return ChatEvent(msg_type, data, str(incoming.path))
+                case "file_cancel":
+                    self.files.cancel(file_id)
+        except Exception as e:
+            self.files.cancel(file_id)
+            return ChatEvent("file_error", {"file_id": file_id, "error": str(e)})
+        return ChatEvent(msg_type, data)
+
+    def apply(self, data: dict) -> ChatEvent:
+        msg_type = data.get("type", "")
+
+        if msg_type == "init":
+            if "since" in data:
+                self.messages.extend(data.get("messages", []))
+            else:
+                self.messages = data.get("messages", [])
+                self.last_seq = self._acked = 0
+            self.epoch = data.get("epoch")
+            self.server_heartbeat = data.get("heartbeat") is True
+            self._use_suite(data.get("suite"))
+            self._received(data.get("seq"))
+            self.users = data.get("users", [])
+            self.typing = {u["user_id"] for u in self.users if u.get("typing")}
+            self.connected = True
+        elif msg_type == "message":
+            msg = data.get("data", {})
+            self.messages.append(msg)
+            self._received(msg.get("seq"))
+            return ChatEvent(msg_type, msg, self.message_text(msg))
+        elif msg_type == "user_joined":
+            user = {"user_id": data.get("user_id"), "username": data.get("username")}
+            if data.get("public_key"):
+                user["public_key"] = data["public_key"]
+            self.users.append(user)
+        elif msg_type == "user_left":
+            left_id = data.get("user_id")
+            self.users = [u for u in self.users if u.get("user_id") != left_id]
+            self.typing.discard(left_id)
+        elif msg_type == "presence":
+            users = {u.get("user_id"): u for u in self.users}
+            for change in data.get("changes", []):
+                uid = change.get("user_id")
+                if "typing" in change:
+                    (self.typing.add if change["typing"] else self.typing.discard)(uid)
+                if uid in users and "status" in change:
+                    users[uid]["status"] = change["status"]
+        elif msg_type == "direct":
+            return ChatEvent(msg_type, data, self._decrypt_direct(data))
+        elif msg_type == "suite":
+            self._use_suite(data.get("suite"))
+        elif msg_type == "cleared":
+            self.messages = []
+            self._plaintext.clear()
+        elif msg_type == "server_shutdown":
+            self.connected = False
+        elif msg_type == "pong" and isinstance(data.get("ts"), (int, float)):
+            self.server_heartbeat = True
+            self.rtt = time.monotonic() - data["ts"]
+        elif msg_type == "ping":
+            self.server_heartbeat = True
+        elif msg_type.startswith("file_"):
+            return self._apply_file(msg_type, data)
+
+        return ChatEvent(msg_type, data)
+
+    def _use_suite(self, suite: Optional[str]) -> None:
+        if self.room_cipher:
+            with suppress(ValueError):
+                self.room_cipher.use(suite or self.negotiated_suite)
+
+    async def events(self) -> AsyncIterator[ChatEvent]:
+        interval = self.heartbeat_interval or None
+        missed = 0
+        self._pinged = time.monotonic()
+        while True:
+            pending = self.last_seq != self._acked
+            try:
+                line = await asyncio.wait_for(
+                    self.reader.readline(), ACK_DELAY if pending else interval
+                )
+            except asyncio.TimeoutError:
+                if pending:
+                    await self.ack()
+                    continue
+                missed += self.server_heartbeat
+                if missed >= self.heartbeat_misses:
+                    self.connected = False
+                    raise ConnectionError("Server stopped responding")
+                await self.ping()
+                continue
+            if not line:
+                break
+            missed = 0
+            data = json.loads(line.decode())
+            if data.get("type") == "ping":
+                await self.send_json({"type": "pong", "ts": data.get("ts")})
+            elif interval and time.monotonic() - self._pinged >= interval:
+                await self.ping()
+            event = self.apply(data)
+            if self.last_seq - self._acked >= ACK_BATCH:
+                await self.ack()
+            yield event
+
+    def _decrypt_text(self, text: str) -> str:
+        try:
+            return self.room_cipher.decrypt_text(text)
+        except Exception:
+            return "[decrypt failed]"
+
+    def decrypt_message(self, msg: dict) -> dict:
+        if "text" in msg and msg["text"]:
+            msg["text"] = self._decrypt_text(msg["text"])
+        return msg
+
+    def message_text(self, msg: dict) -> Optional[str]:
+        msg_id = msg.get("id")
+        if msg_id is not None and msg_id in self._plaintext:
+            return self._plaintext[msg_id]
+
+        text = msg.get("text")
+        if not text:
+            return text
+
+        plain = self._decrypt_text(text)
+        if msg_id is not None:
+            self._plaintext[msg_id] = plain
+        return plain
+
+    async def decrypt_history(
+        self, messages: Optional[Sequence[dict]] = None
+    ) -> AsyncIterator[list[dict]]:
+        snapshot = list(self.messages if messages is None else messages)
+        tokens = [
+            None if m.get("id") in self._plaintext else m.get("text") for m in snapshot
+        ]
+        offset = 0
+        async for texts in self.batch_decryptor.stream(tokens):
+            chunk = snapshot[offset : offset + len(texts)]
+            offset += len(texts)
+            decrypted = []
+            for msg, text in zip(chunk, texts):
+                msg_id = msg.get("id")
+                if msg_id in self._plaintext:
+                    text = self._plaintext[msg_id]
+                elif msg_id is not None and text:
+                    self._plaintext[msg_id] = text
+                decrypted.append({**msg, "text": text})
+            yield decrypted
+
+    async def search(self, query: str) -> list[dict]:
+        needle = query.lower()
+        found = []
+        async for chunk in self.decrypt_history():
+            found.extend(m for m in chunk if needle in (m["text"] or "").lower())
+        return found
@@ -0,0 +1,103 @@
+import base64
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from ..crypto import RoomCipher
+
+CHUNK_SIZE = 32 * 1024
+WINDOW = 4
+
+
+def chunk_header(file_id: str, seq: int) -> bytes:
+    return f"{file_id}:{seq}:".encode()
+
+
+def encrypt_chunk(cipher: RoomCipher, file_id: str, seq: int, data: bytes) -> str:
+    return base64.b64encode(cipher.encrypt(chunk_header(file_id, seq) + data)).decode()
+
+
+def decrypt_chunk(cipher: RoomCipher, file_id: str, seq: int, token: str) -> bytes:
+    plain = cipher.decrypt(base64.b64decode(token))
+    header = chunk_header(file_id, seq)
+    if not plain.startswith(header):
+        raise ValueError("Chunk does not belong here")
+    return plain[len(header) :]
+
+
+def safe_name(name: str) -> str:
+    name = os.path.basename(name.replace("\\", "/")).strip().lstrip(".")
+    return name[:200] or "file"
+
+
+@dataclass
+class IncomingFile:
+    file_id: str
+    name: str
+    size: int
+    chunks: int
+    username: str
+    path: Path
+    handle: Optional[BinaryIO] = None
+    received: int = 0
+    written: int = 0
+
+
+class FileReceiver:
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.incoming: dict[str, IncomingFile] = {}
+
+    def offer(self, data: dict, name: str) -> IncomingFile:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / safe_name(name)
+        stem, suffix, n = path.stem, path.suffix, 1
+        while path.exists() or path.with_name(path.name + ".part").exists():
+            path = path.with_name(f"{stem} ({n}){suffix}")
+            n += 1
+        incoming = IncomingFile(
+            file_id=data["file_id"],
+            name=path.name,
+            size=data.get("size", 0),
+            chunks=data.get("chunks", 0),
+            username=data.get("username", ""),
+            path=path,
+        )
+        incoming.handle = open(path.with_name(path.name + ".part"), "wb")
+        self.incoming[incoming.file_id] = incoming
+        return incoming
+
+    def chunk(self, cipher: RoomCipher, data: dict) -> Optional[IncomingFile]:
+        if (incoming := self.incoming.get(data.get("file_id"))) is None:
+            return None
+        if data.get("seq") != incoming.received:
+            self.cancel(incoming.file_id)
+            raise ValueError("Chunk out of order")
+        plain = decrypt_chunk(cipher, incoming.file_id, incoming.received, data["data"])
+        incoming.handle.write(plain)
+        incoming.received += 1
+        incoming.written += len(plain)
+        return incoming
+
+    def end(self, file_id: str) -> Optional[IncomingFile]:
+        if (incoming := self.incoming.pop(file_id, None)) is None:
+            return None
+        incoming.handle.close()
+        part = incoming.path.with_name(incoming.path.name + ".part")
+        if incoming.received != incoming.chunks or incoming.written != incoming.size:
+            part.unlink(missing_ok=True)
+            raise ValueError("Transfer incomplete")
+        part.rename(incoming.path)
+        return incoming
+
+    def cancel(self, file_id: str) -> Optional[IncomingFile]:
+        if (incoming := self.incoming.pop(file_id, None)) is None:
+            return None
+        incoming.handle.close()
+        incoming.path.with_name(incoming.path.name + ".part").unlink(missing_ok=True)
+        return incoming
+
+    def close(self) -> None:
+        for file_id in list(self.incoming):
+            self.cancel(file_id)
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from typing import Callable, Optional
+
+from rich.console import Console, Group
+from rich.live import Live
+from rich.text import Text
+
+
+class Renderer:
+    def __init__(self, console: Console, fps: float = 10.0):
+        self.console = console
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.frames = 0
+        self._lines: list[tuple[str, bool]] = []
+        self._footer: list[str] = []
+        self._repaint: Optional[Callable[[], None]] = None
+        self._live: Optional[Live] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._last_frame = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self._live is not None
+
+    def start(self) -> None:
+        self._live = Live(
+            self._footer_renderable(),
+            console=self.console,
+            auto_refresh=False,
+            redirect_stdout=False,
+            redirect_stderr=False,
+        )
+        self._live.start()
+
+    def stop(self) -> None:
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        if self._live:
+            self._flush()
+            self._live.stop()
+            self._live = None
+
+    def append(self, line: str) -> None:
+        if self._repaint is None:
+            self._lines.append((line, False))
+        self._schedule()
+
+    def notice(self, line: str) -> None:
+        self._lines.append((line, True))
+        self._schedule()
+
+    def set_footer(self, *lines: str) -> None:
+        self._footer = list(lines)
+        self._schedule()
+
+    def repaint(self, render: Callable[[], None]) -> None:
+        self._repaint = render
+        self._lines = [entry for entry in self._lines if entry[1]]
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self._handle is not None:
+            return
+        delay = self._last_frame + self.interval - time.monotonic()
+        self._handle = asyncio.get_running_loop().call_later(
+            max(0.0, delay), self._flush
+        )
+
+    def _flush(self) -> None:
+        self._handle = None
+        self._last_frame = time.monotonic()
+        if self._repaint is not None:
+            render, self._repaint = self._repaint, None
+            render()
+        for line, _ in self._lines:
+            self.console.print(line)
+        self._lines.clear()
+        if self._live:
+            self._live.update(self._footer_renderable(), refresh=True)
+        self.frames += 1
+
+    def _footer_renderable(self) -> Group:
+        return Group(*(Text.from_markup(line) for line in self._footer))
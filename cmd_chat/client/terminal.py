@@ -0,0 +1,224 @@
+import asyncio
+import codecs
+import os
+import sys
+from typing import Callable, Optional
+
+try:
+    import termios
+    import tty
+except ImportError:
+    termios = tty = None
+
+KEYS = {
+    "\x1b[A": "up",
+    "\x1b[B": "down",
+    "\x1b[C": "right",
+    "\x1b[D": "left",
+    "\x1b[H": "home",
+    "\x1b[F": "end",
+    "\x1b[1~": "home",
+    "\x1b[4~": "end",
+    "\x1b[3~": "delete",
+    "\x1b[5~": "page_up",
+    "\x1b[6~": "page_down",
+    "\x1bOA": "up",
+    "\x1bOB": "down",
+    "\x1bOC": "right",
+    "\x1bOD": "left",
+    "\x1bOH": "home",
+    "\x1bOF": "end",
+}
+
+CONTROL = {
+    "\x01": "home",
+    "\x05": "end",
+    "\x02": "left",
+    "\x06": "right",
+    "\x08": "backspace",
+    "\x7f": "backspace",
+    "\x15": "kill_line",
+    "\x17": "kill_word",
+    "\x04": "eof",
+    "\r": "enter",
+    "\n": "enter",
+}
+
+
+class LineEditor:
+    def __init__(self, history_size: int = 100):
+        self.buffer = ""
+        self.cursor = 0
+        self.history: list[str] = []
+        self.history_size = history_size
+        self._history_pos = 0
+
+    def insert(self, text: str) -> None:
+        self.buffer = self.buffer[: self.cursor] + text + self.buffer[self.cursor :]
+        self.cursor += len(text)
+
+    def key(self, name: str) -> Optional[str]:
+        match name:
+            case "enter":
+                line, self.buffer, self.cursor = self.buffer, "", 0
+                if line.strip():
+                    self.history.append(line)
+                    del self.history[: -self.history_size]
+                self._history_pos = len(self.history)
+                return line
+            case "backspace" if self.cursor:
+                self.buffer = self.buffer[: self.cursor - 1] + self.buffer[self.cursor :]
+                self.cursor -= 1
+            case "delete":
+                self.buffer = self.buffer[: self.cursor] + self.buffer[self.cursor + 1 :]
+            case "left":
+                self.cursor = max(0, self.cursor - 1)
+            case "right":
+                self.cursor = min(len(self.buffer), self.cursor + 1)
+            case "home":
+                self.cursor = 0
+            case "end":
+                self.cursor = len(self.buffer)
+            case "kill_line":
+                self.buffer = self.buffer[self.cursor :]
+                self.cursor = 0
+            case "kill_word":
+                head = self.buffer[: self.cursor].rstrip()
+                head = head[: head.rfind(" ") + 1]
+                self.buffer = head + self.buffer[self.cursor :]
+                self.cursor = len(head)
+            case "up" if self._history_pos > 0:
+                self._history_pos -= 1
+                self.buffer = self.history[self._history_pos]
+                self.cursor = len(self.buffer)
+            case "down" if self._history_pos < len(self.history):
+                self._history_pos += 1
+                self.buffer = (
+                    self.history[self._history_pos]
+                    if self._history_pos < len(self.history)
+                    else ""
+                )
+                self.cursor = len(self.buffer)
+        return None
+
+
+class LineReader:
+    def __init__(
+        self,
+        fd: int,
+        on_change: Optional[Callable[[LineEditor], None]] = None,
+        on_key: Optional[Callable[[str], None]] = None,
+    ):
+        self.fd = fd
+        self.editor = LineEditor()
+        self.on_change = on_change
+        self.on_key = on_key
+        self.interactive = termios is not None and os.isatty(fd)
+        self._queue: asyncio.Queue[Optional[str]] = asyncio.Queue()
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._pending = ""
+        self._saved_mode = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def open(cls, **kwargs) -> Optional["LineReader"]:
+        if os.name == "nt":
+            return None
+        try:
+            fd = sys.stdin.fileno()
+        except (AttributeError, ValueError, OSError):
+            return None
+        return cls(fd, **kwargs)
+
+    def start(self) -> bool:
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_reader(self.fd, self._on_readable)
+        except OSError:
+            return False
+        self._loop = loop
+        if self.interactive:
+            self._saved_mode = termios.tcgetattr(self.fd)
+            tty.setcbreak(self.fd)
+        return True
+
+    def stop(self) -> None:
+        if self._loop:
+            self._loop.remove_reader(self.fd)
+            self._loop = None
+        if self._saved_mode is not None:
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self._saved_mode)
+            self._saved_mode = None
+
+    async def readline(self) -> str:
+        line = await self._queue.get()
+        if line is None:
+            raise EOFError
+        return line
+
+    def _on_readable(self) -> None:
+        try:
+            data = os.read(self.fd, 0x1000)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            self._loop.remove_reader(self.fd)
+            self._queue.put_nowait(None)
+            return
+
+        self.feed(self._decoder.decode(data))
+
+    def feed(self, text: str) -> None:
+        if not self.interactive:
+            self._pending += text
+            *lines, self._pending = self._pending.split("\n")
+            for line in lines:
+                self._queue.put_nowait(line.rstrip("\r"))
+            return
+
+        text = self._pending + text
+        self._pending = ""
+        i = 0
+        while i < len(text):
+            ch = text[i]
+            if ch == "\x1b":
+                seq = self._match_escape(text, i)
+                if seq is None:
+                    self._pending = text[i:]
+                    break
+                i += len(seq)
+                if name := KEYS.get(seq):
+                    self._dispatch(name)
+                continue
+            if name := CONTROL.get(ch):
+                self._dispatch(name)
+            elif ch.isprintable():
+                self.editor.insert(ch)
+            i += 1
+        self.on_change and self.on_change(self.editor)
+
+    def _match_escape(self, text: str, start: int) -> Optional[str]:
+        if start + 1 >= len(text):
+            return None
+        if text[start + 1] not in "[O":
+            return "\x1b"
+        for end in range(start + 3, min(len(text), start + 8) + 1):
+            last = text[end - 1]
+            if last.isalpha() or last == "~":
+                return text[start:end]
+        return None if len(text) - start < 8 else text[start : start + 8]
+
+    def _dispatch(self, name: str) -> None:
+        if name == "eof":
+            if not self.editor.buffer:
+                self._queue.put_nowait(None)
+            return
+        if name in ("page_up", "page_down"):
+            self.on_key and self.on_key(name)
+            return
+        line = self.editor.key(name)
+        if line is not None:
+            self._queue.put_nowait(line)
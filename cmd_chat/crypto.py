@@ -0,0 +1,149 @@
+import base64
+import os
+from typing import Iterable, Optional
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric.x25519 import (
+    X25519PrivateKey,
+    X25519PublicKey,
+)
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+ROOM_KEY_INFO = b"cmd-chat-room-key"
+DIRECT_KEY_INFO = b"cmd-chat-direct"
+
+FERNET = "fernet"
+AES_256_GCM = "aes-256-gcm"
+CHACHA20_POLY1305 = "chacha20-poly1305"
+
+SUITES = (AES_256_GCM, CHACHA20_POLY1305, FERNET)
+
+FERNET_VERSION = 0x80
+NONCE_SIZE = 12
+AEADS = {
+    AES_256_GCM: (0x01, AESGCM),
+    CHACHA20_POLY1305: (0x02, ChaCha20Poly1305),
+}
+
+
+def derive_key(password: bytes, salt: bytes, info: bytes) -> bytes:
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=info)
+    return hkdf.derive(password)
+
+
+def derive_room_key(password: bytes, room_salt: bytes, suite: str = FERNET) -> bytes:
+    info = ROOM_KEY_INFO if suite == FERNET else ROOM_KEY_INFO + b"/" + suite.encode()
+    return derive_key(password, room_salt, info)
+
+
+def negotiate(offered: Iterable[str], allowed: Iterable[str] = SUITES) -> str:
+    offered = set(offered)
+    for suite in allowed:
+        if suite in offered:
+            return suite
+    return FERNET
+
+
+class RoomCipher:
+    def __init__(
+        self,
+        fernet: Fernet,
+        suite: str = FERNET,
+        aeads: Optional[dict[str, object]] = None,
+    ):
+        self.fernet = fernet
+        self._aeads = aeads or {}
+        self._by_tag = {AEADS[name][0]: aead for name, aead in self._aeads.items()}
+        self.use(suite)
+
+    def use(self, suite: str) -> None:
+        aead = self._aeads.get(suite)
+        if suite != FERNET and aead is None:
+            raise ValueError(f"No key for suite {suite}")
+        self.suite = suite
+        self._aead = aead
+        self._tag = AEADS[suite][0] if suite in AEADS else FERNET_VERSION
+
+    @classmethod
+    def derive(
+        cls, password: bytes, room_salt: bytes, suite: str = FERNET
+    ) -> "RoomCipher":
+        if suite not in SUITES:
+            raise ValueError(f"Unsupported suite {suite}")
+        fernet = Fernet(base64.urlsafe_b64encode(derive_room_key(password, room_salt)))
+        aeads = {
+            name: factory(derive_room_key(password, room_salt, name))
+            for name, (_, factory) in AEADS.items()
+        }
+        return cls(fernet, suite, aeads)
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        if self._aead is None:
+            return base64.urlsafe_b64decode(self.fernet.encrypt(plaintext))
+        nonce = os.urandom(NONCE_SIZE)
+        return bytes((self._tag,)) + nonce + self._aead.encrypt(nonce, plaintext, None)
+
+    def decrypt(self, token: bytes) -> bytes:
+        if not token:
+            raise InvalidToken
+        if token[0] == FERNET_VERSION:
+            return self.fernet.decrypt(base64.urlsafe_b64encode(token))
+        aead = self._by_tag.get(token[0])
+        if aead is None:
+            raise InvalidToken
+        nonce = token[1 : 1 + NONCE_SIZE]
+        return aead.decrypt(nonce, token[1 + NONCE_SIZE :], None)
+
+    def encrypt_text(self, plaintext: str) -> str:
+        return base64.urlsafe_b64encode(self.encrypt(plaintext.encode())).decode()
+
+    def decrypt_text(self, token: str) -> str:
+        return self.decrypt(base64.urlsafe_b64decode(token)).decode()
+
+
+class DirectCipher:
+    def __init__(self, room_secret: bytes, private: Optional[X25519PrivateKey] = None):
+        self.private = private or X25519PrivateKey.generate()
+        self.public = public_key_bytes(self.private)
+        self.room_secret = room_secret
+        self._peers: dict[bytes, AESGCM] = {}
+
+    @classmethod
+    def derive(
+        cls, password: bytes, room_salt: bytes, private: Optional[X25519PrivateKey] = None
+    ) -> "DirectCipher":
+        return cls(derive_key(password, room_salt, DIRECT_KEY_INFO), private)
+
+    def _aead(self, peer: bytes) -> AESGCM:
+        if (aead := self._peers.get(peer)) is None:
+            shared = self.private.exchange(X25519PublicKey.from_public_bytes(peer))
+            info = DIRECT_KEY_INFO + b"".join(sorted((self.public, peer)))
+            aead = self._peers[peer] = AESGCM(derive_key(shared, self.room_secret, info))
+        return aead
+
+    def encrypt(self, peer: bytes, plaintext: bytes) -> bytes:
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._aead(peer).encrypt(nonce, plaintext, self.public)
+
+    def decrypt(self, peer: bytes, token: bytes) -> bytes:
+        return self._aead(peer).decrypt(token[:NONCE_SIZE], token[NONCE_SIZE:], peer)
+
+    def encrypt_text(self, peer: bytes, plaintext: str) -> str:
+        return base64.urlsafe_b64encode(self.encrypt(peer, plaintext.encode())).decode()
+
+    def decrypt_text(self, peer: bytes, token: str) -> str:
+        return self.decrypt(peer, base64.urlsafe_b64decode(token)).decode()
+
+
+def fingerprint(public: bytes) -> str:
+    digest = hashes.Hash(hashes.SHA256())
+    digest.update(public)
+    digits = digest.finalize()[:10].hex()
+    return " ".join(digits[i : i + 4] for i in range(0, len(digits), 4))
+
+
+def public_key_bytes(private: X25519PrivateKey) -> bytes:
+    return private.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
@@ -1,3 +1,4 @@
 from .server import run_server
+from .config import ServerConfig
 
-__all__ = ["run_server"]
+__all__ = ["run_server", "ServerConfig"]
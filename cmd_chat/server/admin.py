@@ -0,0 +1,217 @@
+import asyncio
+import inspect
+import json
+import os
+import socket
+import stat
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Optional, Union
+
+from .profiling import MemoryTracker, Profiler, ProfilingError
+
+Result = dict[str, Any]
+Command = Callable[..., Union[Result, Awaitable[Result]]]
+
+
+class AdminError(Exception):
+    pass
+
+
+class AdminCommands:
+    def __init__(self, server):
+        self.server = server
+        self.profiler = Profiler()
+        self.memory_tracker = MemoryTracker()
+        self.commands: dict[str, Command] = {
+            "help": self.help,
+            "stats": self.stats,
+            "conn": self.conn,
+            "top": self.top,
+            "profile": self.profile,
+            "memory": self.memory,
+            "sessions": self.sessions,
+            "kick": self.kick,
+            "clear": self.clear,
+            "drain": self.drain,
+        }
+
+    async def execute(self, line: str) -> Result:
+        name, *args = line.split() or ["help"]
+        if (command := self.commands.get(name)) is None:
+            return {"error": f"Unknown command: {name}"}
+        try:
+            result = command(*args)
+            if inspect.isawaitable(result):
+                result = await result
+        except (AdminError, ProfilingError, TypeError, ValueError) as e:
+            return {"error": str(e) or type(e).__name__}
+        return {"ok": True, **result}
+
+    def resolve(self, who: str) -> str:
+        server = self.server
+        if server.session_store.get(who) or who in server.connection_manager.active_connections:
+            return who
+        if user_id := server.session_store.user_id_for(who):
+            return user_id
+        raise AdminError(f"No such user: {who}")
+
+    def help(self) -> Result:
+        return {"commands": sorted(self.commands)}
+
+    def stats(self) -> Result:
+        server = self.server
+        conns = server.connection_manager
+        return {
+            "connections": server.connection_limiter.active,
+            "sessions": server.session_store.count(),
+            "pending_handshakes": server.handshake_limiter.pending,
+            "history": server.message_store.count(),
+            "frames_sent": conns.frames_sent,
+            "bytes_sent": conns.bytes_sent + server.metrics.bytes_out.value,
+            "bytes_received": server.metrics.bytes_in.value,
+            "rejected": {
+                "connections": server.connection_limiter.rejected,
+                "handshakes": server.handshake_limiter.rejected,
+            },
+            "loop": server.loop_monitor.stats(),
+        }
+
+    def conn(self, who: str) -> Result:
+        user_id = self.resolve(who)
+        if (info := self.server.connection_manager.connection_info(user_id)) is None:
+            raise AdminError(f"Not connected: {who}")
+        info["unacked"] = self.server.message_store.last_seq - info["acked"]
+        return {"connection": self._named(info)}
+
+    def top(self, by: str = "senders", n: str = "10") -> Result:
+        if by not in ("senders", "receivers"):
+            raise AdminError("top takes 'senders' or 'receivers'")
+        rows = self.server.connection_manager.top(by, int(n))
+        return {by: [self._named(info) for info in rows]}
+
+    async def profile(self, seconds: str = "5", limit: str = "20", sort: str = "tottime") -> Result:
+        if sort not in ("tottime", "cumtime", "ncalls"):
+            raise AdminError("sort must be tottime, cumtime or ncalls")
+        return {"functions": await self.profiler.run(float(seconds), int(limit), sort)}
+
+    async def memory(self, action: str = "usage", arg: str = "") -> Result:
+        tracker = self.memory_tracker
+        match action:
+            case "start":
+                return await tracker.start(int(arg or 1))
+            case "stop":
+                return tracker.stop()
+            case "usage":
+                return tracker.usage()
+            case "top":
+                return {"top": await tracker.top(int(arg or 10))}
+            case "diff":
+                return {"diff": await tracker.diff(int(arg or 10))}
+        raise AdminError("memory takes start [frames], stop, usage, top [n] or diff [n]")
+
+    def sessions(self) -> Result:
+        return {
+            "sessions": [
+                {
+                    "user_id": s.user_id,
+                    "username": s.username,
+                    "ip": s.ip,
+                    "created_at": s.created_at,
+                    "last_activity": s.last_activity,
+                }
+                for s in self.server.session_store.get_all()
+            ]
+        }
+
+    async def kick(self, who: str, *reason: str) -> Result:
+        user_id = self.resolve(who)
+        if not await self.server.connection_manager.kick(
+            user_id, " ".join(reason) or "Kicked by admin"
+        ):
+            raise AdminError(f"Not connected: {who}")
+        return {"kicked": user_id}
+
+    async def clear(self) -> Result:
+        cleared = self.server.message_store.count()
+        await self.server.clear_room()
+        return {"cleared": cleared}
+
+    def drain(self, timeout: str = "") -> Result:
+        connections = self.server.connection_limiter.active
+        self.server.begin_shutdown(float(timeout) if timeout else None)
+        return {"draining": True, "connections": connections}
+
+    def _named(self, info: Result) -> Result:
+        return {"username": self.server.username_for(info["user_id"]), **info}
+
+
+class AdminServer:
+    def __init__(self, commands: AdminCommands):
+        self.commands = commands
+        self.path: Optional[str] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, path: str) -> str:
+        claim_unix_path(path)
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle, path)
+        finally:
+            os.umask(umask)
+        self.path = path
+        return path
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            with suppress(Exception):
+                await self._server.wait_closed()
+            self._server = None
+        if self.path:
+            with suppress(OSError):
+                os.unlink(self.path)
+            self.path = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                result = await self.commands.execute(line.decode(errors="replace"))
+                writer.write((json.dumps(result, default=str) + "\n").encode())
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+            with suppress(Exception):
+                await writer.wait_closed()
+
+
+def claim_unix_path(path: str) -> None:
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise OSError(f"{path} exists and is not a socket")
+        if _in_use(path):
+            raise OSError(f"{path} is in use by another server")
+        os.unlink(path)
+
+
+def _in_use(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            return False
+        return True
+
+
+async def admin_request(path: str, command: str, timeout: float = 120.0) -> Result:
+    reader, writer = await asyncio.open_unix_connection(path)
+    try:
+        writer.write((command + "\n").encode())
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        return json.loads(line) if line else {"error": "Connection closed"}
+    finally:
+        writer.close()
+        with suppress(Exception):
+            await writer.wait_closed()
@@ -0,0 +1,41 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from ..crypto import SUITES
+
+
+@dataclass
+class ServerConfig:
+    handshake_timeout: float = 10.0
+    handshake_rate_per_ip: float = 1.0
+    handshake_burst_per_ip: int = 5
+    handshake_rate_global: float = 50.0
+    handshake_burst_global: int = 100
+    max_pending_handshakes: int = 64
+    max_pending_per_ip: int = 4
+    max_connections: int = 1024
+    max_connections_per_ip: int = 16
+    listen_backlog: int = 128
+    accept_retry_delay: float = 1.0
+    cipher_suites: tuple[str, ...] = SUITES
+    metrics_host: str = "127.0.0.1"
+    metrics_port: Optional[int] = None
+    lag_interval: float = 0.25
+    lag_threshold: float = 0.1
+    admin_socket: Optional[str] = None
+    shutdown_timeout: float = 5.0
+    message_rate: float = 5.0
+    message_burst: int = 20
+    byte_rate: float = 512 * 1024
+    byte_burst: int = 2 * 1024 * 1024
+    inbound_policy: str = "delay"
+    presence_interval: float = 0.5
+    presence_batch: int = 256
+    typing_ttl: float = 5.0
+    file_chunk_limit: int = 48 * 1024
+    max_file_size: int = 100 * 1024 * 1024
+    max_transfers_per_user: int = 2
+    heartbeat_interval: float = 15.0
+    heartbeat_misses: int = 3
+    handoff_socket: Optional[str] = None
+    takeover: Optional[str] = None
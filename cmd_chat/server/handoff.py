@@ -0,0 +1,154 @@
+import asyncio
+import base64
+import json
+import os
+import socket
+from contextlib import suppress
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from .admin import claim_unix_path
+from .models import Message
+
+HANDOFF_VERSION = 1
+CHUNK_MESSAGES = 1000
+
+
+class HandoffError(Exception):
+    pass
+
+
+@dataclass
+class HandoffState:
+    room_salt: bytes
+    salt: bytes
+    vkey: bytes
+    messages: list[Message] = field(default_factory=list)
+    base: int = 0
+    epochs: dict[str, int] = field(default_factory=dict)
+
+    def header(self) -> bytes:
+        b64 = lambda b: base64.b64encode(b).decode()
+        return (
+            json.dumps(
+                {
+                    "version": HANDOFF_VERSION,
+                    "room_salt": b64(self.room_salt),
+                    "salt": b64(self.salt),
+                    "vkey": b64(self.vkey),
+                    "messages": len(self.messages),
+                    "base": self.base,
+                    "epochs": self.epochs,
+                }
+            )
+            + "\n"
+        ).encode()
+
+
+class HandoffServer:
+    def __init__(self, server, listener: socket.socket):
+        self.server = server
+        self.listener = listener
+        self.path: Optional[str] = None
+        self._sock: Optional[socket.socket] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, path: str) -> str:
+        claim_unix_path(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            sock.bind(path)
+        finally:
+            os.umask(umask)
+        sock.listen(1)
+        sock.setblocking(False)
+        self._sock, self.path = sock, path
+        self._task = asyncio.create_task(self._accept_loop())
+        return path
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._close()
+
+    def _close(self) -> None:
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        if self.path:
+            with suppress(OSError):
+                os.unlink(self.path)
+            self.path = None
+
+    async def _accept_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while 1:
+            conn, _ = await loop.sock_accept(self._sock)
+            try:
+                if await self._hand_over(loop, conn):
+                    return
+            except (HandoffError, OSError) as e:
+                print(f"[!] Handoff aborted: {e}")
+            finally:
+                conn.close()
+
+    async def _hand_over(self, loop: asyncio.AbstractEventLoop, conn: socket.socket) -> bool:
+        self.server.read_only = True
+        try:
+            state = self.server.export_state()
+            print(f"[*] Handing off to a new process ({len(state.messages)} messages)")
+            socket.send_fds(conn, [b"F"], [self.listener.fileno()])
+            await loop.sock_sendall(conn, state.header())
+            for i in range(0, len(state.messages), CHUNK_MESSAGES):
+                chunk = state.messages[i : i + CHUNK_MESSAGES]
+                await loop.sock_sendall(
+                    conn, "".join(json.dumps(asdict(m)) + "\n" for m in chunk).encode()
+                )
+            ack = await asyncio.wait_for(loop.sock_recv(conn, 16), 30)
+            if ack != b"OK\n":
+                raise HandoffError("new process did not acknowledge")
+        except BaseException:
+            self.server.read_only = False
+            raise
+        self._close()
+        await loop.sock_sendall(conn, b"DONE\n")
+        self.server.begin_shutdown()
+        return True
+
+
+def receive_handoff(path: str, timeout: float = 30.0) -> tuple[socket.socket, HandoffState]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(path)
+        marker, fds, _, _ = socket.recv_fds(conn, 1, 1)
+        if marker != b"F" or not fds:
+            raise HandoffError("no listening socket received")
+        listener = socket.socket(fileno=fds[0])
+        try:
+            stream = conn.makefile("rb")
+            header = json.loads(stream.readline() or b"null")
+            if not header or header.get("version") != HANDOFF_VERSION:
+                raise HandoffError(f"unsupported handoff header: {header!r}")
+            b64d = base64.b64decode
+            state = HandoffState(
+                room_salt=b64d(header["room_salt"]),
+                salt=b64d(header["salt"]),
+                vkey=b64d(header["vkey"]),
+                base=header.get("base", 0),
+                epochs=header.get("epochs", {}),
+            )
+            for _ in range(header["messages"]):
+                line = stream.readline()
+                if not line:
+                    raise HandoffError("history stream ended early")
+                state.messages.append(Message(**json.loads(line)))
+            conn.sendall(b"OK\n")
+            if stream.readline() != b"DONE\n":
+                raise HandoffError("old process did not confirm")
+        except BaseException:
+            listener.close()
+            raise
+    listener.setblocking(False)
+    return listener, state
@@ -0,0 +1,93 @@
+import time
+from contextlib import AbstractContextManager, nullcontext
+from typing import Any, Callable
+
+SpanListener = Callable[[str, float, dict[str, Any]], None]
+EventListener = Callable[[str, dict[str, Any]], None]
+TracerFactory = Callable[[str, dict[str, Any]], AbstractContextManager]
+
+NULL_SPAN = nullcontext()
+
+
+class Span:
+    __slots__ = ("hooks", "name", "fields", "started", "_contexts")
+
+    def __init__(self, hooks: "Hooks", name: str, fields: dict[str, Any]):
+        self.hooks = hooks
+        self.name = name
+        self.fields = fields
+        self.started = 0.0
+        self._contexts: list[AbstractContextManager] = []
+
+    def __enter__(self) -> "Span":
+        for factory in self.hooks._tracers:
+            context = factory(self.name, self.fields)
+            context.__enter__()
+            self._contexts.append(context)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        duration = time.perf_counter() - self.started
+        for context in reversed(self._contexts):
+            context.__exit__(*exc)
+        if exc[0] is not None:
+            self.fields["error"] = exc[0].__name__
+        for listener in self.hooks._span_listeners:
+            listener(self.name, duration, self.fields)
+
+
+class Hooks:
+    __slots__ = (
+        "_span_listeners",
+        "_tracers",
+        "_event_listeners",
+        "_coarse",
+        "tracing",
+        "detail",
+    )
+
+    def __init__(self):
+        self._span_listeners: list[SpanListener] = []
+        self._tracers: list[TracerFactory] = []
+        self._event_listeners: dict[str, list[EventListener]] = {}
+        self._coarse: set[SpanListener] = set()
+        self.tracing = False
+        self.detail = False
+
+    def on_span(self, listener: SpanListener, detail: bool = True) -> Callable[[], None]:
+        detail or self._coarse.add(listener)
+        return self._add(self._span_listeners, listener)
+
+    def add_tracer(self, factory: TracerFactory) -> Callable[[], None]:
+        return self._add(self._tracers, factory)
+
+    def on(self, event: str, listener: EventListener) -> Callable[[], None]:
+        return self._add(self._event_listeners.setdefault(event, []), listener)
+
+    def span(self, name: str, **fields) -> AbstractContextManager:
+        if not self.tracing:
+            return NULL_SPAN
+        return Span(self, name, fields)
+
+    def emit(self, event: str, **fields) -> None:
+        for listener in self._event_listeners.get(event, ()):
+            listener(event, fields)
+
+    def _add(self, listeners: list, listener: Callable) -> Callable[[], None]:
+        listeners.append(listener)
+        self._refresh()
+
+        def remove() -> None:
+            if listener in listeners:
+                listeners.remove(listener)
+                self._refresh()
+
+        return remove
+
+    def _refresh(self) -> None:
+        self._coarse.intersection_update(self._span_listeners)
+        self.tracing = bool(self._span_listeners or self._tracers)
+        self.detail = bool(self._tracers) or any(
+            listener not in self._coarse for listener in self._span_listeners
+        )
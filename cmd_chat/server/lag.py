@@ -0,0 +1,101 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+
+from .hooks import Hooks
+
+QUANTILES = (0.5, 0.95, 0.99)
+WAITING_SPANS = frozenset({"handshake", "broadcast.fanout", "broadcast.drain"})
+
+
+def quantile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LoopMonitor:
+    def __init__(
+        self,
+        hooks: Hooks,
+        interval: float = 0.25,
+        threshold: float = 0.1,
+        samples: int = 1200,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.hooks = hooks
+        self.interval = interval
+        self.threshold = threshold
+        self.clock = clock
+        self.lags: deque[float] = deque(maxlen=samples)
+        self.stalls = 0
+        self.stalled_seconds = 0.0
+        self.offenders: deque[dict[str, Any]] = deque(maxlen=32)
+        self._spans: deque[tuple[float, float, str, dict]] = deque(maxlen=64)
+        self._remove: Optional[Callable[[], None]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._remove = self.hooks.on_span(self._on_span, detail=False)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._remove and self._remove()
+        self._task and (
+            self._task.cancel(),
+            await asyncio.gather(self._task, return_exceptions=1),
+        )
+
+    def _on_span(self, name: str, duration: float, fields: dict) -> None:
+        if duration >= self.threshold / 4:
+            self._spans.append((self.clock(), duration, name, fields))
+
+    async def _run(self) -> None:
+        while 1:
+            started = self.clock()
+            await asyncio.sleep(self.interval)
+            self.record(self.clock() - started - self.interval)
+
+    def record(self, lag: float) -> None:
+        lag = max(0.0, lag)
+        self.lags.append(lag)
+        if lag >= self.threshold:
+            self._stall(lag)
+
+    def culprit(self, lag: float) -> Optional[tuple[float, str, dict]]:
+        window = self.clock() - lag - self.interval
+        inside = [
+            (duration, name, fields)
+            for ended, duration, name, fields in self._spans
+            if ended - duration >= window and name not in WAITING_SPANS
+        ]
+        return max(inside, key=lambda span: span[0], default=None)
+
+    def _stall(self, lag: float) -> None:
+        self.stalls += 1
+        self.stalled_seconds += lag
+        offender = {"lag": lag, "at": time.time(), "span": None}
+        detail = ""
+        if found := self.culprit(lag):
+            duration, name, fields = found
+            offender.update(span=name, duration=duration, fields=fields)
+            extra = " ".join(f"{k}={v}" for k, v in fields.items())
+            detail = f" in {name} ({duration * 1000:.0f}ms{' ' + extra if extra else ''})"
+        self.offenders.append(offender)
+        print(f"[!] Event loop stalled {lag * 1000:.0f}ms{detail}")
+
+    def percentiles(self) -> dict[float, float]:
+        lags = list(self.lags)
+        return {q: quantile(lags, q) for q in QUANTILES}
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "samples": len(self.lags),
+            "lag": {f"p{int(q * 100)}": v for q, v in self.percentiles().items()},
+            "max": max(self.lags, default=0.0),
+            "stalls": self.stalls,
+            "stalled_seconds": self.stalled_seconds,
+            "offenders": list(self.offenders),
+        }
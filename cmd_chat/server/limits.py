@@ -0,0 +1,203 @@
+import time
+from typing import Callable, Optional
+
+Clock = Callable[[], float]
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "_clock")
+
+    def __init__(self, rate: float, capacity: float, clock: Clock = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._clock = clock
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def consume(self, amount: float = 1.0) -> bool:
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def wait(self, amount: float = 1.0) -> float:
+        amount = min(amount, self.capacity)
+        if self.consume(amount):
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def refund(self, amount: float = 1.0) -> None:
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class InboundLimiter:
+    __slots__ = ("messages", "bytes", "notified")
+
+    def __init__(
+        self,
+        message_rate: float,
+        message_burst: int,
+        byte_rate: float,
+        byte_burst: int,
+        clock: Clock = time.monotonic,
+    ):
+        self.messages = (
+            TokenBucket(message_rate, message_burst, clock) if message_rate > 0 else None
+        )
+        self.bytes = TokenBucket(byte_rate, byte_burst, clock) if byte_rate > 0 else None
+        self.notified = float("-inf")
+
+    def message_wait(self) -> float:
+        return self.messages.wait() if self.messages else 0.0
+
+    def bytes_wait(self, size: int) -> float:
+        return self.bytes.wait(size) if self.bytes else 0.0
+
+
+class HandshakeLimiter:
+    MAX_TRACKED_IPS = 0x1000
+
+    def __init__(
+        self,
+        per_ip_rate: float = 1.0,
+        per_ip_burst: int = 5,
+        global_rate: float = 50.0,
+        global_burst: int = 100,
+        max_pending: int = 64,
+        max_pending_per_ip: int = 4,
+        clock: Clock = time.monotonic,
+    ):
+        self.per_ip_rate = per_ip_rate
+        self.per_ip_burst = per_ip_burst
+        self.max_pending = max_pending
+        self.max_pending_per_ip = max_pending_per_ip
+        self._clock = clock
+        self._global = TokenBucket(global_rate, global_burst, clock)
+        self._buckets: dict[str, TokenBucket] = {}
+        self._pending: dict[str, int] = {}
+        self.pending = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def admit(self, ip: str) -> Optional[str]:
+        if self.pending >= self.max_pending:
+            return self._reject("Server busy")
+        if self._pending.get(ip, 0) >= self.max_pending_per_ip:
+            return self._reject("Too many pending handshakes")
+
+        bucket = self._buckets.get(ip)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_TRACKED_IPS:
+                self._prune()
+            bucket = self._buckets[ip] = TokenBucket(
+                self.per_ip_rate, self.per_ip_burst, self._clock
+            )
+
+        if not bucket.consume():
+            return self._reject("Too many handshakes")
+        if not self._global.consume():
+            bucket.refund()
+            return self._reject("Server busy")
+
+        self.pending += 1
+        self._pending[ip] = self._pending.get(ip, 0) + 1
+        self.admitted += 1
+        return None
+
+    def release(self, ip: str) -> None:
+        count = self._pending.get(ip, 0)
+        if count <= 0:
+            return
+        self.pending -= 1
+        if count == 1:
+            del self._pending[ip]
+        else:
+            self._pending[ip] = count - 1
+
+    def _reject(self, reason: str) -> str:
+        self.rejected += 1
+        return reason
+
+    def _prune(self) -> None:
+        idle = [
+            ip
+            for ip, b in self._buckets.items()
+            if ip not in self._pending and b.is_full()
+        ]
+        for ip in idle:
+            del self._buckets[ip]
+
+
+class ConnectionLimiter:
+    def __init__(
+        self,
+        max_connections: int = 1024,
+        max_per_ip: int = 16,
+        clock: Clock = time.monotonic,
+    ):
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self._clock = clock
+        self._per_ip: dict[str, int] = {}
+        self.active = 0
+        self.rejected = 0
+        self.saturations = 0
+        self._saturated_since: Optional[float] = None
+        self._saturated_total = 0.0
+
+    @property
+    def saturated(self) -> bool:
+        return self.active >= self.max_connections
+
+    def acquire(self, ip: str) -> Optional[str]:
+        if self.saturated:
+            self.rejected += 1
+            return "Server full"
+        if self._per_ip.get(ip, 0) >= self.max_per_ip:
+            self.rejected += 1
+            return "Too many connections"
+
+        self.active += 1
+        self._per_ip[ip] = self._per_ip.get(ip, 0) + 1
+        if self.saturated:
+            self.saturations += 1
+            self._saturated_since = self._clock()
+        return None
+
+    def release(self, ip: str) -> Optional[float]:
+        count = self._per_ip.get(ip, 0)
+        if count <= 0:
+            return None
+        if count == 1:
+            del self._per_ip[ip]
+        else:
+            self._per_ip[ip] = count - 1
+        self.active -= 1
+
+        if self._saturated_since is not None and not self.saturated:
+            duration = self._clock() - self._saturated_since
+            self._saturated_total += duration
+            self._saturated_since = None
+            return duration
+        return None
+
+    def connections_from(self, ip: str) -> int:
+        return self._per_ip.get(ip, 0)
+
+    def saturated_seconds(self) -> float:
+        total = self._saturated_total
+        if self._saturated_since is not None:
+            total += self._clock() - self._saturated_since
+        return total
@@ -1,46 +1,215 @@
 import asyncio
-from typing import Optional
+import json
+import time
+from contextlib import suppress
+from dataclasses import asdict
+from typing import Any, Optional
 from asyncio import StreamWriter
 
+from .hooks import Hooks
+from .models import ConnectionStats
+
+
+def buffer_size(writer: StreamWriter) -> int:
+    transport = getattr(writer, "transport", None)
+    return transport.get_write_buffer_size() if transport else 0
+
+
+async def _wait_closed(writer: StreamWriter) -> None:
+    with suppress(Exception):
+        await writer.wait_closed()
+
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, hooks: Optional[Hooks] = None):
+        self.hooks = hooks or Hooks()
         self.active_connections: dict[str, StreamWriter] = {}
+        self.stats: dict[str, ConnectionStats] = {}
         self._lock = asyncio.Lock()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.broadcast_frames = 0
+        self.broadcast_bytes = 0
 
     async def connect(self, user_id: str, writer: StreamWriter) -> None:
         async with self._lock:
             self.active_connections[user_id] = writer
+            self.stats[user_id] = self._new_stats()
 
     async def disconnect(self, user_id: str) -> None:
         async with self._lock:
             if user_id in self.active_connections:
                 del self.active_connections[user_id]
+            self.stats.pop(user_id, None)
+
+    def _new_stats(self) -> ConnectionStats:
+        return ConnectionStats(mark=(self.broadcast_frames, self.broadcast_bytes))
+
+    def stats_for(self, user_id: str) -> ConnectionStats:
+        if (stats := self.stats.get(user_id)) is None:
+            stats = self.stats[user_id] = self._new_stats()
+        return stats
+
+    def settle(self, stats: ConnectionStats) -> ConnectionStats:
+        frames, size = stats.mark
+        stats.frames_out += self.broadcast_frames - frames
+        stats.bytes_out += self.broadcast_bytes - size
+        stats.mark = (self.broadcast_frames, self.broadcast_bytes)
+        return stats
+
+    def record_in(self, user_id: str, size: int) -> None:
+        stats = self.stats_for(user_id)
+        stats.frames_in += 1
+        stats.bytes_in += size
+        stats.last_seen = time.monotonic()
+
+    def silent(self, timeout: float) -> list[str]:
+        cutoff = time.monotonic() - timeout
+        return [
+            uid for uid, s in self.stats.items() if s.heartbeat and s.last_seen < cutoff
+        ]
+
+    def ping(self) -> int:
+        data = (json.dumps({"type": "ping", "ts": time.monotonic()}) + "\n").encode()
+        for writer in self.active_connections.values():
+            with suppress(Exception):
+                writer.write(data)
+        sent = len(self.active_connections)
+        self.broadcast_frames += 1
+        self.broadcast_bytes += len(data)
+        self.frames_sent += sent
+        self.bytes_sent += sent * len(data)
+        return sent
+
+    def abort(self, user_id: str) -> bool:
+        self.stats.pop(user_id, None)
+        if (writer := self.active_connections.pop(user_id, None)) is None:
+            return False
+        if transport := getattr(writer, "transport", None):
+            transport.abort()
+        else:
+            writer.close()
+        return True
 
     async def broadcast(self, message: str, exclude_user: Optional[str] = None) -> None:
         data = (message + "\n").encode()
+        size = len(data)
+        detail = self.hooks.detail
+        clock = time.perf_counter
+        stats_map = self.stats
         async with self._lock:
             disconnected = []
-            for user_id, writer in list(self.active_connections.items()):
-                if exclude_user and user_id == exclude_user:
-                    continue
-                try:
-                    writer.write(data)
-                    await writer.drain()
-                except Exception:
-                    disconnected.append(user_id)
+            recipients = len(self.active_connections)
+            excluded = exclude_user and stats_map.get(exclude_user)
+            excluded and self.settle(excluded)
+            self.broadcast_frames += 1
+            self.broadcast_bytes += size
+            if excluded:
+                excluded.mark = (self.broadcast_frames, self.broadcast_bytes)
+            with self.hooks.span("broadcast.fanout", recipients=recipients):
+                last = clock()
+                for user_id, writer in list(self.active_connections.items()):
+                    if exclude_user and user_id == exclude_user:
+                        continue
+                    try:
+                        writer.write(data)
+                        if detail:
+                            with self.hooks.span("broadcast.drain", user_id=user_id):
+                                await writer.drain()
+                        else:
+                            await writer.drain()
+                    except Exception:
+                        disconnected.append(user_id)
+                        continue
+                    if (stats := stats_map.get(user_id)) is None:
+                        stats = self.stats_for(user_id)
+                    now = clock()
+                    stats.last_drain = elapsed = now - last
+                    if elapsed > stats.max_drain:
+                        stats.max_drain = elapsed
+                    last = now
+            sent = recipients - len(disconnected) - (exclude_user in self.active_connections)
+            self.frames_sent += sent
+            self.bytes_sent += sent * size
 
             for user_id in disconnected:
                 self.active_connections.pop(user_id, None)
+                self.stats.pop(user_id, None)
 
     async def send_personal(self, user_id: str, message: str) -> bool:
         data = (message + "\n").encode()
         async with self._lock:
             if writer := self.active_connections.get(user_id):
                 try:
+                    stats = self.stats_for(user_id)
                     writer.write(data)
+                    stats.frames_out += 1
+                    stats.bytes_out += len(data)
+                    self.frames_sent += 1
+                    self.bytes_sent += len(data)
+                    started = time.perf_counter()
                     await writer.drain()
+                    stats.drained(time.perf_counter() - started)
                     return True
                 except Exception:
                     return False
         return False
+
+    async def kick(self, user_id: str, reason: str, timeout: float = 1.0) -> bool:
+        self.stats.pop(user_id, None)
+        if (writer := self.active_connections.pop(user_id, None)) is None:
+            return False
+        with suppress(Exception):
+            writer.write((json.dumps({"type": "kicked", "reason": reason}) + "\n").encode())
+            writer.close()
+        try:
+            await asyncio.wait_for(_wait_closed(writer), timeout)
+        except asyncio.TimeoutError:
+            if transport := getattr(writer, "transport", None):
+                transport.abort()
+        return True
+
+    async def close_all(self, message: str, timeout: float) -> int:
+        data = (message + "\n").encode()
+        writers = list(self.active_connections.values())
+        self.active_connections.clear()
+        self.stats.clear()
+        for writer in writers:
+            with suppress(Exception):
+                writer.write(data)
+                writer.close()
+        if not writers:
+            return 0
+        closing = [asyncio.ensure_future(_wait_closed(w)) for w in writers]
+        _, pending = await asyncio.wait(closing, timeout=timeout)
+        for writer, task in zip(writers, closing):
+            if task in pending:
+                task.cancel()
+                if transport := getattr(writer, "transport", None):
+                    transport.abort()
+        return len(pending)
+
+    def buffer_sizes(self) -> dict[str, int]:
+        return {uid: buffer_size(w) for uid, w in self.active_connections.items()}
+
+    def connection_info(self, user_id: str) -> Optional[dict[str, Any]]:
+        if (writer := self.active_connections.get(user_id)) is None:
+            return None
+        stats = self.settle(self.stats_for(user_id))
+        info = asdict(stats)
+        del info["mark"]
+        return {
+            "user_id": user_id,
+            **info,
+            "age": stats.age(),
+            "idle": time.monotonic() - stats.last_seen,
+            "buffer": buffer_size(writer),
+        }
+
+    def top(self, by: str, n: int = 10) -> list[dict[str, Any]]:
+        keys = {
+            "senders": lambda c: c["bytes_in"],
+            "receivers": lambda c: (c["buffer"], c["last_drain"]),
+        }
+        infos = [self.connection_info(uid) for uid in list(self.active_connections)]
+        return sorted(infos, key=keys[by], reverse=True)[:n]
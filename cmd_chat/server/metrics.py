@@ -0,0 +1,299 @@
+import asyncio
+import bisect
+from contextlib import suppress
+from typing import Callable, Iterable, Optional
+
+Samples = Callable[[], dict[tuple[tuple[str, str], ...], float]]
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+def _labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+
+def _value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help)
+        self.value = 0.0
+        self._fn = fn
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def samples(self) -> Iterable[str]:
+        yield f"{self.name} {_value(self._fn() if self._fn else self.value)}"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        fn: Optional[Callable[[], float]] = None,
+        labeled: Optional[Samples] = None,
+    ):
+        super().__init__(name, help)
+        self.value = 0.0
+        self._fn = fn
+        self._labeled = labeled
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def samples(self) -> Iterable[str]:
+        if self._labeled:
+            for labels, value in self._labeled().items():
+                yield f"{self.name}{_labels(labels)} {_value(value)}"
+        else:
+            yield f"{self.name} {_value(self._fn() if self._fn else self.value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> Iterable[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{self.name}_bucket{{le="{bound}"}} {cumulative}'
+        yield f'{self.name}_bucket{{le="+Inf"}} {self.count}'
+        yield f"{self.name}_sum {_value(self.sum)}"
+        yield f"{self.name}_count {self.count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, **kwargs) -> Counter:
+        return self.register(Counter(name, help, **kwargs))
+
+    def gauge(self, name: str, help: str, **kwargs) -> Gauge:
+        return self.register(Gauge(name, help, **kwargs))
+
+    def histogram(self, name: str, help: str, **kwargs) -> Histogram:
+        return self.register(Histogram(name, help, **kwargs))
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self.metrics.values()) + "\n"
+
+
+class MetricsServer:
+    def __init__(self, registry: Registry):
+        self.registry = registry
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str, port: int) -> tuple[str, int]:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            with suppress(Exception):
+                await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (line := await asyncio.wait_for(reader.readline(), 5)) not in (
+                b"\r\n",
+                b"\n",
+                b"",
+            ):
+                pass
+            parts = request.decode(errors="replace").split()
+            path = parts[1] if len(parts) > 1 else "/"
+            if path.split("?")[0] in ("/", "/metrics"):
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.0 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+            with suppress(Exception):
+                await writer.wait_closed()
+
+
+class ServerMetrics:
+    def __init__(self, server):
+        self.registry = r = Registry()
+        conns = lambda: server.connection_manager
+
+        self.messages_received = r.counter(
+            "chat_messages_received_total", "Chat messages received from clients"
+        )
+        self.direct_messages = r.counter(
+            "chat_direct_messages_total", "Direct messages delivered to one recipient"
+        )
+        self.broadcasts = r.counter("chat_broadcasts_total", "Frames broadcast to the room")
+        r.counter(
+            "chat_frames_sent_total",
+            "Frames written to client connections by broadcast and direct sends",
+            fn=lambda: conns().frames_sent,
+        )
+        self.rate_limited = r.counter(
+            "chat_inbound_rate_limited_total",
+            "Client frames that hit the per-user message or byte limit",
+        )
+        self.dead_peers = r.counter(
+            "chat_dead_peers_total", "Connections dropped after missing heartbeats"
+        )
+        self.bytes_in = r.counter("chat_bytes_received_total", "Bytes read from clients")
+        self.bytes_out = Counter("chat_bytes_sent_direct", "")
+        r.counter(
+            "chat_bytes_sent_total",
+            "Bytes written to clients",
+            fn=lambda: self.bytes_out.value + conns().bytes_sent,
+        )
+        r.counter(
+            "chat_presence_updates_total",
+            "Typing and status updates received from clients",
+            fn=lambda: server.presence.updates,
+        )
+        r.counter(
+            "chat_presence_frames_total",
+            "Coalesced presence frames broadcast",
+            fn=lambda: server.presence.frames,
+        )
+        r.counter(
+            "chat_connections_rejected_total",
+            "Connections refused by connection limits",
+            fn=lambda: server.connection_limiter.rejected,
+        )
+        r.counter(
+            "chat_handshakes_rejected_total",
+            "Handshakes refused by admission control",
+            fn=lambda: server.handshake_limiter.rejected,
+        )
+        r.counter(
+            "chat_accept_saturated_seconds_total",
+            "Seconds spent with accept() paused at the connection limit",
+            fn=lambda: server.connection_limiter.saturated_seconds(),
+        )
+        r.gauge(
+            "chat_connections_active",
+            "Open client connections",
+            fn=lambda: server.connection_limiter.active,
+        )
+        r.gauge(
+            "chat_sessions_authenticated",
+            "Authenticated user sessions",
+            fn=lambda: server.session_store.count(),
+        )
+        r.gauge(
+            "chat_handshakes_pending",
+            "Connections that have not finished SRP",
+            fn=lambda: server.handshake_limiter.pending,
+        )
+        r.gauge(
+            "chat_history_messages",
+            "Messages held in the room history",
+            fn=lambda: server.message_store.count(),
+        )
+        r.gauge(
+            "chat_connection_outbound_buffer_bytes",
+            "Bytes queued in each connection's write buffer",
+            labeled=lambda: {
+                (("user", server.username_for(uid)),): size
+                for uid, size in conns().buffer_sizes().items()
+            },
+        )
+        r.gauge(
+            "chat_event_loop_lag_seconds",
+            "Event-loop scheduling lag over the recent sample window",
+            labeled=lambda: {
+                (("quantile", str(q)),): v
+                for q, v in server.loop_monitor.percentiles().items()
+            },
+        )
+        r.counter(
+            "chat_event_loop_stalls_total",
+            "Lag samples above the slow-callback threshold",
+            fn=lambda: server.loop_monitor.stalls,
+        )
+        r.counter(
+            "chat_event_loop_stalled_seconds_total",
+            "Lag accumulated by stalled samples",
+            fn=lambda: server.loop_monitor.stalled_seconds,
+        )
+        self.broadcast_seconds = r.histogram(
+            "chat_broadcast_duration_seconds", "Time to fan a frame out to the room"
+        )
+        self.delivery_lag = r.histogram(
+            "chat_delivery_lag_seconds",
+            "Time from a message reaching the server to a client acknowledging it",
+            buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+        )
+        self.handshake_seconds = r.histogram(
+            "chat_handshake_duration_seconds",
+            "Time from admission to a completed SRP handshake",
+            buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+        )
@@ -1,3 +1,4 @@
+import time
 from dataclasses import dataclass, field
 from uuid import uuid4
 from datetime import datetime, timezone
@@ -13,6 +14,7 @@ class Message:
     )
     user_ip: str = ""
     username: str = ""
+    seq: int = 0
 
 
 @dataclass
@@ -28,6 +30,10 @@ class UserSession:
         default_factory=lambda: datetime.now(timezone.utc).isoformat()
     )
     active: bool = True
+    since: Optional[int] = None
+    public_key: Optional[str] = None
+    heartbeat: bool = False
+    legacy: bool = False
 
     def update_activity(self):
         self.last_activity = datetime.now(timezone.utc).isoformat()
@@ -35,3 +41,28 @@ class UserSession:
     def is_stale(self, timeout_seconds: int = 3600) -> bool:
         last = datetime.fromisoformat(self.last_activity)
         return (datetime.now(timezone.utc) - last).total_seconds() > timeout_seconds
+
+
+@dataclass(slots=True)
+class ConnectionStats:
+    connected_at: float = field(default_factory=time.monotonic)
+    bytes_in: int = 0
+    frames_in: int = 0
+    bytes_out: int = 0
+    frames_out: int = 0
+    last_drain: float = 0.0
+    max_drain: float = 0.0
+    rate_limited: int = 0
+    last_seen: float = field(default_factory=time.monotonic)
+    rtt: Optional[float] = None
+    heartbeat: bool = False
+    acked: int = 0
+    mark: tuple[int, int] = (0, 0)
+
+    def age(self) -> float:
+        return time.monotonic() - self.connected_at
+
+    def drained(self, seconds: float) -> None:
+        self.last_drain = seconds
+        if seconds > self.max_drain:
+            self.max_drain = seconds
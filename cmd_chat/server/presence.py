@@ -0,0 +1,69 @@
+import time
+from typing import Any, Callable, Optional
+
+STATUSES = ("active", "away")
+
+
+class Presence:
+    def __init__(
+        self,
+        typing_ttl: float = 5.0,
+        max_batch: int = 256,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.typing_ttl = typing_ttl
+        self.max_batch = max_batch
+        self.clock = clock
+        self.typing: dict[str, float] = {}
+        self.status: dict[str, str] = {}
+        self._changes: dict[str, dict[str, Any]] = {}
+        self.updates = 0
+        self.frames = 0
+
+    def set_typing(self, user_id: str, active: bool = True) -> None:
+        self.updates += 1
+        was = user_id in self.typing
+        if active:
+            self.typing[user_id] = self.clock() + self.typing_ttl
+        else:
+            self.typing.pop(user_id, None)
+        if was != active:
+            self._change(user_id, typing=active)
+
+    def set_status(self, user_id: str, status: str) -> None:
+        if status not in STATUSES:
+            return
+        self.updates += 1
+        if self.status.get(user_id, "active") != status:
+            self.status[user_id] = status
+            self._change(user_id, status=status)
+
+    def remove(self, user_id: str) -> None:
+        self.typing.pop(user_id, None)
+        self.status.pop(user_id, None)
+        self._changes.pop(user_id, None)
+
+    def state(self, user_id: str) -> dict[str, Any]:
+        return {
+            "status": self.status.get(user_id, "active"),
+            "typing": user_id in self.typing,
+        }
+
+    def expire(self) -> None:
+        now = self.clock()
+        for user_id, until in list(self.typing.items()):
+            if until <= now:
+                del self.typing[user_id]
+                self._change(user_id, typing=False)
+
+    def flush(self) -> Optional[dict[str, Any]]:
+        self.expire()
+        if not self._changes:
+            return None
+        batch = list(self._changes)[: self.max_batch]
+        changes = [self._changes.pop(user_id) for user_id in batch]
+        self.frames += 1
+        return {"type": "presence", "changes": changes}
+
+    def _change(self, user_id: str, **fields) -> None:
+        self._changes.setdefault(user_id, {"user_id": user_id}).update(fields)
@@ -0,0 +1,123 @@
+import asyncio
+import cProfile
+import pstats
+import tracemalloc
+from typing import Any, Optional
+
+MAX_PROFILE_SECONDS = 60.0
+
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ProfilingError(Exception):
+    pass
+
+
+def _where(filename: str, lineno: int, name: str) -> str:
+    return f"{filename}:{lineno}({name})" if lineno else name
+
+
+class Profiler:
+    def __init__(self):
+        self.running = False
+
+    async def run(self, seconds: float, limit: int = 20, sort: str = "tottime") -> list[dict]:
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            raise ProfilingError(f"seconds must be in (0, {MAX_PROFILE_SECONDS:g}]")
+        if self.running:
+            raise ProfilingError("A profile is already running")
+        profiler = cProfile.Profile()
+        self.running = True
+        try:
+            profiler.enable()
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+            self.running = False
+        stats = pstats.Stats(profiler).sort_stats(sort)
+        return [
+            {"function": _where(*func), "calls": nc, "tottime": tt, "cumtime": ct}
+            for func in stats.fcn_list[:limit]
+            for _, nc, tt, ct, _ in [stats.stats[func]]
+        ]
+
+
+class MemoryTracker:
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    async def start(self, frames: int = 1) -> dict[str, Any]:
+        if not self.tracing:
+            tracemalloc.start(frames)
+        self.baseline = await asyncio.to_thread(self._snapshot)
+        return self.usage()
+
+    def stop(self) -> dict[str, Any]:
+        self.baseline = None
+        tracemalloc.stop()
+        return {"tracing": False}
+
+    def usage(self) -> dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "rss": rss_bytes(),
+            "tracing": self.tracing,
+            "current": current,
+            "peak": peak,
+        }
+
+    async def top(self, limit: int = 10) -> list[dict[str, Any]]:
+        self._require()
+        stats = await asyncio.to_thread(
+            lambda: self._snapshot().statistics("lineno")[:limit]
+        )
+        return [
+            {"where": str(s.traceback), "size": s.size, "count": s.count}
+            for s in stats
+        ]
+
+    async def diff(self, limit: int = 10) -> list[dict[str, Any]]:
+        self._require()
+        baseline = self.baseline
+        snapshot = await asyncio.to_thread(self._snapshot)
+        stats = await asyncio.to_thread(snapshot.compare_to, baseline, "lineno")
+        self.baseline = snapshot
+        stats = stats[:limit]
+        return [
+            {
+                "where": str(s.traceback),
+                "size": s.size,
+                "size_diff": s.size_diff,
+                "count_diff": s.count_diff,
+            }
+            for s in stats
+        ]
+
+    def _require(self) -> None:
+        if not self.tracing or self.baseline is None:
+            raise ProfilingError("tracemalloc is not running; use 'memory start'")
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
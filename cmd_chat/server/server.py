@@ -1,80 +1,377 @@
 import asyncio
 import json
 import base64
+import errno
 import os
+import signal
+import socket
+import time
+from datetime import datetime, timezone
 from dataclasses import asdict
 from contextlib import suppress
-from typing import Optional
+from typing import Callable, Optional
 from asyncio import StreamReader, StreamWriter
 
+from ..crypto import FERNET, negotiate
+from .config import ServerConfig
 from .models import Message, UserSession
 from .stores import MessageStore, UserSessionStore
 from .managers import ConnectionManager
 from .srp_auth import SRPAuthManager
+from .admin import AdminCommands, AdminServer
+from .handoff import HandoffServer, HandoffState, receive_handoff
+from .hooks import Hooks
+from .lag import LoopMonitor
+from .limits import HandshakeLimiter, ConnectionLimiter, InboundLimiter
+from .presence import Presence
+from .transfers import TransferError, TransferManager
+from .metrics import MetricsServer, ServerMetrics
 
 b64e = lambda x: base64.b64encode(x).decode()
 b64d = base64.b64decode
 b64u = base64.urlsafe_b64encode
 
+ACCEPT_RESOURCE_ERRORS = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM)
+
 
 class ChatServer:
     __slots__ = (
         "message_store",
         "session_store",
         "connection_manager",
+        "transfers",
+        "presence",
         "srp_manager",
         "room_salt",
+        "epoch",
+        "epochs",
+        "config",
+        "hooks",
+        "loop_monitor",
+        "handshake_limiter",
+        "connection_limiter",
+        "metrics",
+        "admin",
+        "_metrics_server",
+        "_admin_server",
+        "_handoff_server",
+        "_accept_task",
+        "_shutdown_task",
+        "draining",
+        "read_only",
+        "_legacy",
+        "_accepting",
+        "_client_tasks",
         "_cleanup_task",
+        "_presence_task",
+        "_heartbeat_task",
     )
 
-    def __init__(self, password: str):
-        self.message_store = MessageStore()
+    def __init__(self, password: str, config: Optional[ServerConfig] = None):
+        self.config = config or ServerConfig()
+        self.handshake_limiter = HandshakeLimiter(
+            per_ip_rate=self.config.handshake_rate_per_ip,
+            per_ip_burst=self.config.handshake_burst_per_ip,
+            global_rate=self.config.handshake_rate_global,
+            global_burst=self.config.handshake_burst_global,
+            max_pending=self.config.max_pending_handshakes,
+            max_pending_per_ip=self.config.max_pending_per_ip,
+        )
+        self.connection_limiter = ConnectionLimiter(
+            max_connections=self.config.max_connections,
+            max_per_ip=self.config.max_connections_per_ip,
+        )
+        self._accepting = asyncio.Event()
+        self._accepting.set()
+        self._client_tasks: set[asyncio.Task] = set()
+        self.hooks = Hooks()
+        self.loop_monitor = LoopMonitor(
+            self.hooks,
+            interval=self.config.lag_interval,
+            threshold=self.config.lag_threshold,
+        )
+        self.message_store = MessageStore(self.hooks)
         self.session_store = UserSessionStore()
-        self.connection_manager = ConnectionManager()
-        self.srp_manager = SRPAuthManager(password)
+        self.connection_manager = ConnectionManager(self.hooks)
+        self.presence = Presence(
+            typing_ttl=self.config.typing_ttl, max_batch=self.config.presence_batch
+        )
+        self.transfers = TransferManager(
+            max_chunk=self.config.file_chunk_limit,
+            max_size=self.config.max_file_size,
+            max_per_user=self.config.max_transfers_per_user,
+        )
+        self.srp_manager = SRPAuthManager(password, self.hooks)
         self.room_salt = os.urandom(0x10)
+        self.epoch = os.urandom(8).hex()
+        self.epochs: dict[str, Optional[int]] = {self.epoch: None}
         self._cleanup_task: Optional[asyncio.Task] = None
+        self._presence_task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.metrics = ServerMetrics(self)
+        self.admin = AdminCommands(self)
+        self._admin_server: Optional[AdminServer] = None
+        self._handoff_server: Optional[HandoffServer] = None
+        self._accept_task: Optional[asyncio.Task] = None
+        self._shutdown_task: Optional[asyncio.Task] = None
+        self.draining = False
+        self.read_only = False
+        self._legacy: set[str] = set()
+        self._metrics_server: Optional[MetricsServer] = None
 
     async def start(self, host: str, port: int):
-        server = await asyncio.start_server(self._handle_client, host, port)
-        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
-        addr = server.sockets[0].getsockname()
+        sock = self.listen(host, port)
+        addr = sock.getsockname()
         print(f"[*] Server running on {addr[0]}:{addr[1]}")
-        async with server:
-            await server.serve_forever()
+        await self.serve(sock)
+
+    def listen(self, host: str, port: int) -> socket.socket:
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        sock = socket.create_server(
+            (host, port), family=family, backlog=self.config.listen_backlog
+        )
+        sock.setblocking(False)
+        return sock
+
+    async def serve(self, sock: socket.socket):
+        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+        self._presence_task = asyncio.create_task(self._presence_loop())
+        if self.config.heartbeat_interval > 0:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        if self.config.lag_interval > 0:
+            self.loop_monitor.start()
+        if self.config.metrics_port is not None:
+            self._metrics_server = MetricsServer(self.metrics.registry)
+            host, port = await self._metrics_server.start(
+                self.config.metrics_host, self.config.metrics_port
+            )
+            print(f"[*] Metrics on http://{host}:{port}/metrics")
+        try:
+            if self.config.admin_socket:
+                self._admin_server = AdminServer(self.admin)
+                path = await self._admin_server.start(self.config.admin_socket)
+                print(f"[*] Admin socket on {path}")
+            if self.config.handoff_socket:
+                self._handoff_server = HandoffServer(self, sock)
+                path = self._handoff_server.start(self.config.handoff_socket)
+                print(f"[*] Handoff socket on {path}")
+            self._accept_task = asyncio.create_task(self._accept_loop(sock))
+            try:
+                await self._accept_task
+            except asyncio.CancelledError:
+                if not self.draining:
+                    raise
+            sock.close()
+            if self._client_tasks:
+                await asyncio.gather(*self._client_tasks, return_exceptions=True)
+            if self._shutdown_task:
+                await self._shutdown_task
+        finally:
+            sock.close()
+            await self.loop_monitor.stop()
+            if self._metrics_server:
+                await self._metrics_server.stop()
+            if self._admin_server:
+                await self._admin_server.stop()
+            if self._handoff_server:
+                await self._handoff_server.stop()
+
+    def drain(self) -> None:
+        if self.draining:
+            return
+        self.draining = True
+        self._accept_task and self._accept_task.cancel()
+        print(
+            f"[*] Draining: no new connections, "
+            f"{self.connection_limiter.active} still open"
+        )
+
+    async def shutdown(self, timeout: Optional[float] = None) -> None:
+        timeout = self.config.shutdown_timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self.drain()
+        frame = json.dumps({"type": "server_shutdown", "reason": "Server is shutting down"})
+        count = len(self.connection_manager.active_connections)
+        aborted = await self.connection_manager.close_all(frame, timeout)
+        if pending := set(self._client_tasks):
+            _, pending = await asyncio.wait(
+                pending, timeout=max(0.0, deadline - loop.time())
+            )
+            for task in pending:
+                task.cancel()
+        print(
+            f"[*] Closed {count} connections"
+            + (f", {aborted} aborted after {timeout:g}s" if aborted else "")
+        )
+
+    def begin_shutdown(self, timeout: Optional[float] = None) -> None:
+        if not self._shutdown_task:
+            self._shutdown_task = asyncio.create_task(self.shutdown(timeout))
+
+    def request_shutdown(self) -> None:
+        if self._shutdown_task:
+            print("[!] Forcing shutdown")
+            for task in self._client_tasks:
+                task.cancel()
+            return
+        print("\n[*] Shutting down...")
+        self.begin_shutdown()
+
+    def export_state(self) -> HandoffState:
+        return HandoffState(
+            room_salt=self.room_salt,
+            salt=self.srp_manager.salt,
+            vkey=self.srp_manager.vkey,
+            messages=self.message_store.get_all(),
+            base=self.message_store.base,
+            epochs={
+                epoch: self.message_store.last_seq if limit is None else limit
+                for epoch, limit in self.epochs.items()
+            },
+        )
+
+    def restore(self, state: HandoffState) -> None:
+        self.room_salt = state.room_salt
+        self.srp_manager = SRPAuthManager(
+            "", self.hooks, verifier=(state.salt, state.vkey)
+        )
+        self.message_store.base = state.base
+        self.epochs.update(state.epochs)
+        for message in state.messages:
+            self.message_store.add(message)
+
+    async def clear_room(self) -> None:
+        self.message_store.clear()
+        await self._broadcast(json.dumps({"type": "cleared"}))
+
+    async def _accept_loop(self, sock: socket.socket):
+        loop = asyncio.get_running_loop()
+        while 1:
+            await self._accepting.wait()
+            try:
+                conn, addr = await loop.sock_accept(sock)
+            except ConnectionAbortedError:
+                continue
+            except OSError as exc:
+                if exc.errno not in ACCEPT_RESOURCE_ERRORS:
+                    raise
+                delay = self.config.accept_retry_delay
+                print(f"[!] Accept failed: {exc.strerror}, retrying in {delay:g}s")
+                await asyncio.sleep(delay)
+                continue
+            client_ip = addr[0] if addr else "unknown"
+
+            if reason := self.connection_limiter.acquire(client_ip):
+                with suppress(OSError):
+                    conn.send((json.dumps({"error": reason}) + "\n").encode())
+                conn.close()
+                continue
+
+            if self.connection_limiter.saturated:
+                self._accepting.clear()
+                print(
+                    f"[!] Accept paused: {self.connection_limiter.active} connections"
+                )
+
+            task = asyncio.create_task(self._serve_connection(conn, client_ip))
+            self._client_tasks.add(task)
+            task.add_done_callback(self._client_tasks.discard)
+
+    async def _serve_connection(self, conn: socket.socket, client_ip: str):
+        try:
+            reader, writer = await asyncio.open_connection(sock=conn)
+            await self._handle_client(reader, writer)
+        except OSError:
+            conn.close()
+        finally:
+            saturated_for = self.connection_limiter.release(client_ip)
+            if not self._accepting.is_set() and not self.connection_limiter.saturated:
+                self._accepting.set()
+                print(f"[*] Accept resumed after {saturated_for or 0:.2f}s saturated")
 
     async def stop(self):
-        self._cleanup_task and (
-            self._cleanup_task.cancel(),
-            await asyncio.gather(self._cleanup_task, return_exceptions=1),
+        for task in (self._cleanup_task, self._presence_task, self._heartbeat_task):
+            task and (
+                task.cancel(),
+                await asyncio.gather(task, return_exceptions=1),
+            )
+
+    def report_limits(self) -> None:
+        conns, handshakes = self.connection_limiter, self.handshake_limiter
+        print(
+            f"[*] Rejected {conns.rejected} connections, "
+            f"{handshakes.rejected} handshakes; "
+            f"saturated {conns.saturations}x for {conns.saturated_seconds():.2f}s"
         )
+        lag = self.loop_monitor
+        if lag.lags:
+            p = lag.percentiles()
+            print(
+                f"[*] Loop lag p50 {p[0.5] * 1000:.1f}ms, p99 {p[0.99] * 1000:.1f}ms; "
+                f"{lag.stalls} stalls for {lag.stalled_seconds:.2f}s"
+            )
 
     async def _cleanup_loop(self):
         while 1:
             await asyncio.sleep(0x12C)
             self.session_store.cleanup_stale()
 
+    async def _presence_loop(self):
+        while 1:
+            await asyncio.sleep(self.config.presence_interval)
+            if frame := self.presence.flush():
+                await self._broadcast(json.dumps(frame))
+
+    async def _heartbeat_loop(self):
+        interval = self.config.heartbeat_interval
+        conns = self.connection_manager
+        while 1:
+            await asyncio.sleep(interval)
+            for user_id in conns.silent(interval * self.config.heartbeat_misses):
+                if conns.abort(user_id):
+                    self.metrics.dead_peers.inc()
+                    print(f"[!] Dropping {self.username_for(user_id)}: missed heartbeats")
+            conns.ping()
+
     async def _handle_client(self, reader: StreamReader, writer: StreamWriter):
         addr = writer.get_extra_info("peername")
         client_ip = addr[0] if addr else "unknown"
         user_id = None
 
         try:
-            session = await self._handle_auth(reader, writer, client_ip)
+            session = await self._admit_and_auth(reader, writer, client_ip)
             if not session:
                 return
             user_id = session.user_id
+            self.hooks.emit(
+                "session.start", user_id=user_id, username=session.username, ip=client_ip
+            )
             await self._handle_chat(reader, writer, session)
 
-        except (asyncio.IncompleteReadError, ConnectionResetError, OSError):
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.TimeoutError,
+            ConnectionResetError,
+            OSError,
+        ):
             pass
         except Exception as e:
             print(f"[!] Client error: {e}")
         finally:
             user_id and (
+                self.hooks.emit("session.end", user_id=user_id),
+                [
+                    await self._broadcast(
+                        json.dumps({"type": "file_cancel", "file_id": t.file_id})
+                    )
+                    for t in self.transfers.drop(user_id)
+                ],
                 await self.connection_manager.disconnect(user_id),
+                await self._legacy_left(user_id),
                 self.session_store.remove(user_id),
-                await self.connection_manager.broadcast(
+                self.presence.remove(user_id),
+                await self._broadcast(
                     json.dumps({"type": "user_left", "user_id": user_id})
                 ),
             )
@@ -82,6 +379,24 @@ class ChatServer:
             with suppress(Exception):
                 await writer.wait_closed()
 
+    async def _admit_and_auth(
+        self, reader: StreamReader, writer: StreamWriter, client_ip: str
+    ) -> Optional[UserSession]:
+        if reason := self.handshake_limiter.admit(client_ip):
+            return await self._send_error(writer, reason)
+        started = time.perf_counter()
+        try:
+            with self.hooks.span("handshake", ip=client_ip):
+                session = await asyncio.wait_for(
+                    self._handle_auth(reader, writer, client_ip),
+                    self.config.handshake_timeout,
+                )
+            if session:
+                self.metrics.handshake_seconds.observe(time.perf_counter() - started)
+            return session
+        finally:
+            self.handshake_limiter.release(client_ip)
+
     async def _handle_auth(
         self, reader: StreamReader, writer: StreamWriter, client_ip: str
     ) -> Optional[UserSession]:
@@ -91,9 +406,11 @@ class ChatServer:
         line = await readline()
         if not line:
             return None
+        self.metrics.bytes_in.inc(len(line))
 
         try:
-            data = json.loads(line.decode())
+            with self.hooks.span("json.decode", size=len(line)):
+                data = json.loads(line.decode())
         except json.JSONDecodeError:
             return await self._send_error(writer, "Invalid JSON")
 
@@ -102,6 +419,12 @@ class ChatServer:
 
         username = data.get("username", "unknown")
         client_public_b64 = data.get("A")
+        resume = data.get("resume")
+        heartbeat = data.get("heartbeat") is True
+        legacy = not data.get("suites")
+        public_key = data.get("public_key")
+        if not isinstance(public_key, str) or len(public_key) > 64:
+            public_key = None
 
         if not client_public_b64:
             return await self._send_error(writer, "Missing A")
@@ -122,15 +445,18 @@ class ChatServer:
                 "B": b64e(B),
                 "salt": b64e(salt),
                 "room_salt": b64e(self.room_salt),
+                "suite": negotiate(data.get("suites") or (), self.config.cipher_suites),
             },
         )
 
         line = await readline()
         if not line:
             return None
+        self.metrics.bytes_in.inc(len(line))
 
         try:
-            data = json.loads(line.decode())
+            with self.hooks.span("json.decode", size=len(line)):
+                data = json.loads(line.decode())
         except json.JSONDecodeError:
             return await self._send_error(writer, "Invalid JSON")
 
@@ -156,8 +482,13 @@ class ChatServer:
             ip=client_ip,
             username=username,
             fernet_key=fernet_key,
+            since=self._resume_seq(resume),
+            public_key=public_key,
+            heartbeat=heartbeat,
+            legacy=legacy,
         )
-        self.session_store.add(session)
+        if not self.session_store.add(session):
+            return await self._send_error(writer, "Username taken")
 
         await self._send_json(
             writer,
@@ -175,27 +506,27 @@ class ChatServer:
         user_id = session.user_id
 
         await self.connection_manager.connect(user_id, writer)
-
-        messages = self.message_store.get_all()
-        users = self.session_store.get_all()
-
-        await self._send_json(
-            writer,
-            {
-                "type": "init",
-                "messages": [asdict(m) for m in messages],
-                "users": [
-                    {"user_id": u.user_id, "username": u.username} for u in users
-                ],
-            },
+        self.connection_manager.stats_for(user_id).heartbeat = session.heartbeat
+        session.legacy and await self._legacy_joined(session)
+        config = self.config
+        limiter = InboundLimiter(
+            config.message_rate,
+            config.message_burst,
+            config.byte_rate,
+            config.byte_burst,
         )
 
-        await self.connection_manager.broadcast(
+        with self.hooks.span("init.snapshot", messages=self.message_store.count()):
+            snapshot = json.dumps(self.init_payload(session.since))
+        await self.connection_manager.send_personal(user_id, snapshot)
+
+        await self._broadcast(
             json.dumps(
                 {
                     "type": "user_joined",
                     "user_id": user_id,
                     "username": session.username,
+                    "public_key": session.public_key,
                 }
             ),
             exclude_user=user_id,
@@ -205,18 +536,43 @@ class ChatServer:
             line = await reader.readline()
             if not line:
                 break
+            self.metrics.bytes_in.inc(len(line))
+            self.connection_manager.record_in(user_id, len(line))
+            if not await self._within_limit(
+                user_id, limiter, lambda: limiter.bytes_wait(len(line))
+            ):
+                continue
 
             self.session_store.update_activity(user_id)
 
             try:
-                data = json.loads(line.decode())
+                with self.hooks.span("json.decode", size=len(line)):
+                    data = json.loads(line.decode())
             except json.JSONDecodeError:
                 continue
 
             msg_type = data.get("type")
 
+            if self.read_only and msg_type in ("message", "clear"):
+                await self.connection_manager.send_personal(
+                    user_id,
+                    json.dumps(
+                        {
+                            "type": "not_sent",
+                            "reason": "Server is restarting, try again in a moment",
+                        }
+                    ),
+                )
+                continue
+
+            if msg_type in ("message", "direct", "clear") and not await self._within_limit(
+                user_id, limiter, limiter.message_wait
+            ):
+                continue
+
             match msg_type:
                 case "message":
+                    self.metrics.messages_received.inc()
                     text = data.get("text", "")
                     message = Message(
                         text=text,
@@ -224,18 +580,210 @@ class ChatServer:
                         username=session.username,
                     )
                     self.message_store.add(message)
-                    await self.connection_manager.broadcast(
+                    if user_id in self.presence.typing:
+                        self.presence.set_typing(user_id, False)
+                    await self._broadcast(
                         json.dumps({"type": "message", "data": asdict(message)})
                     )
 
+                case "direct":
+                    await self._direct(session, data.get("to"), data.get("text"))
+
                 case "clear":
-                    self.message_store.clear()
-                    await self.connection_manager.broadcast(
-                        json.dumps({"type": "cleared"})
+                    await self.clear_room()
+
+                case "typing":
+                    self.presence.set_typing(user_id, bool(data.get("active", True)))
+
+                case "presence":
+                    self.presence.set_status(user_id, str(data.get("status")))
+
+                case "ping":
+                    self.connection_manager.stats_for(user_id).heartbeat = True
+                    await self.connection_manager.send_personal(
+                        user_id, json.dumps({"type": "pong", "ts": data.get("ts")})
                     )
 
+                case "pong" if isinstance(data.get("ts"), (int, float)):
+                    stats = self.connection_manager.stats_for(user_id)
+                    stats.rtt = time.monotonic() - data["ts"]
+                    stats.heartbeat = True
+
+                case "ack" if isinstance(data.get("seq"), int):
+                    self._acknowledged(session, data["seq"], data.get("held", 0))
+
+                case "file_offer" | "file_chunk" | "file_end" | "file_cancel":
+                    await self._handle_file(session, msg_type, data)
+
+    async def _direct(self, session: UserSession, to, text) -> None:
+        recipient = self.session_store.user_id_for(to) if isinstance(to, str) else None
+        frame = {
+            "type": "direct",
+            "user_id": session.user_id,
+            "username": session.username,
+            "text": text,
+        }
+        delivered = (
+            isinstance(text, str)
+            and recipient is not None
+            and await self.connection_manager.send_personal(recipient, json.dumps(frame))
+        )
+        if delivered:
+            self.metrics.direct_messages.inc()
+            return
+        await self.connection_manager.send_personal(
+            session.user_id,
+            json.dumps({"type": "direct_error", "to": to, "error": "User not connected"}),
+        )
+
+    def _resume_seq(self, resume) -> Optional[int]:
+        if not isinstance(resume, dict) or resume.get("room_salt") != b64e(self.room_salt):
+            return None
+        seq, epoch = resume.get("seq"), resume.get("epoch")
+        if not isinstance(seq, int) or epoch not in self.epochs:
+            return None
+        limit = self.epochs[epoch]
+        return seq if limit is None or seq <= limit else None
+
+    def _acknowledged(self, session: UserSession, seq: int, held) -> None:
+        stats = self.connection_manager.stats_for(session.user_id)
+        if not stats.acked < seq <= self.message_store.last_seq:
+            return
+        stats.acked = seq
+        message = self.message_store.get(seq)
+        if message and message.timestamp >= session.created_at:
+            age = datetime.now(timezone.utc) - datetime.fromisoformat(message.timestamp)
+            held = held if isinstance(held, (int, float)) else 0
+            self.metrics.delivery_lag.observe(max(0.0, age.total_seconds() - held))
+
+    async def _within_limit(
+        self, user_id: str, limiter: InboundLimiter, take: Callable[[], float]
+    ) -> bool:
+        if not (wait := take()):
+            return True
+        self.metrics.rate_limited.inc()
+        self.connection_manager.stats_for(user_id).rate_limited += 1
+        match self.config.inbound_policy:
+            case "delay":
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = take()
+                return True
+            case "disconnect":
+                await self.connection_manager.send_personal(
+                    user_id, json.dumps({"error": "Rate limit exceeded"})
+                )
+                print(f"[!] Disconnecting {self.username_for(user_id)}: rate limit")
+                raise ConnectionAbortedError("rate limit")
+        now = time.monotonic()
+        if now - limiter.notified >= 1.0:
+            limiter.notified = now
+            await self.connection_manager.send_personal(
+                user_id, json.dumps({"type": "rate_limited", "retry_after": wait})
+            )
+        return False
+
+    async def _handle_file(self, session: UserSession, msg_type: str, data: dict):
+        user_id = session.user_id
+        file_id = data.get("file_id")
+        try:
+            match msg_type:
+                case "file_offer":
+                    transfer = self.transfers.offer(user_id, data)
+                    frame = {
+                        "type": "file_offer",
+                        "file_id": transfer.file_id,
+                        "name": str(data.get("name", "")),
+                        "size": transfer.size,
+                        "chunks": transfer.chunks,
+                        "user_id": user_id,
+                        "username": session.username,
+                    }
+                case "file_chunk":
+                    transfer = self.transfers.chunk(user_id, data)
+                    frame = {
+                        "type": "file_chunk",
+                        "file_id": file_id,
+                        "seq": transfer.received - 1,
+                        "data": data["data"],
+                    }
+                case _:
+                    self.transfers.end(user_id, file_id, msg_type == "file_end")
+                    frame = {"type": msg_type, "file_id": file_id}
+        except TransferError as e:
+            with suppress(TransferError):
+                self.transfers.end(user_id, file_id, complete=False)
+                await self._broadcast(
+                    json.dumps({"type": "file_cancel", "file_id": file_id}),
+                    exclude_user=user_id,
+                )
+            await self.connection_manager.send_personal(
+                user_id,
+                json.dumps({"type": "file_error", "file_id": file_id, "error": str(e)}),
+            )
+            return
+        await self._broadcast(json.dumps(frame), exclude_user=user_id)
+        if msg_type == "file_chunk":
+            await self.connection_manager.send_personal(
+                user_id,
+                json.dumps({"type": "file_ack", "file_id": file_id, "seq": frame["seq"]}),
+            )
+
+    async def _broadcast(self, message: str, exclude_user: Optional[str] = None):
+        started = time.perf_counter()
+        await self.connection_manager.broadcast(message, exclude_user=exclude_user)
+        self.metrics.broadcast_seconds.observe(time.perf_counter() - started)
+        self.metrics.broadcasts.inc()
+
+    def username_for(self, user_id: str) -> str:
+        session = self.session_store.get(user_id)
+        return session.username if session else user_id
+
+    async def _legacy_joined(self, session: UserSession) -> None:
+        first = not self._legacy
+        self._legacy.add(session.user_id)
+        if first and set(self.config.cipher_suites) - {FERNET}:
+            print(
+                f"[!] {session.username} offered no cipher suites; "
+                f"room falls back to fernet until they leave"
+            )
+            await self._broadcast(json.dumps({"type": "suite", "suite": FERNET}))
+
+    async def _legacy_left(self, user_id: str) -> None:
+        if user_id not in self._legacy:
+            return
+        self._legacy.discard(user_id)
+        if not self._legacy and set(self.config.cipher_suites) - {FERNET}:
+            print("[*] No older clients left; room back to negotiated suites")
+            await self._broadcast(json.dumps({"type": "suite"}))
+
+    def init_payload(self, since: Optional[int] = None) -> dict:
+        store = self.message_store
+        delta = store.since(since) if since is not None else None
+        return {
+            "type": "init",
+            "seq": store.last_seq,
+            "epoch": self.epoch,
+            "heartbeat": self.config.heartbeat_interval > 0,
+            **({"suite": FERNET} if self._legacy else {}),
+            **({"since": since} if delta is not None else {}),
+            "messages": [asdict(m) for m in (store.get_all() if delta is None else delta)],
+            "users": [
+                {
+                    "user_id": u.user_id,
+                    "username": u.username,
+                    "public_key": u.public_key,
+                    **self.presence.state(u.user_id),
+                }
+                for u in self.session_store.get_all()
+            ],
+        }
+
     async def _send_json(self, writer: StreamWriter, data: dict):
-        writer.write((json.dumps(data) + "\n").encode())
+        with self.hooks.span("json.encode"):
+            payload = (json.dumps(data) + "\n").encode()
+        writer.write(payload)
+        self.metrics.bytes_out.inc(len(payload))
         await writer.drain()
 
     async def _send_error(self, writer: StreamWriter, error: str) -> None:
@@ -247,9 +795,31 @@ def run_server(
     host: str = "0.0.0.0",
     port: int = 0x1F40,
     password: Optional[str] = None,
+    config: Optional[ServerConfig] = None,
 ):
-    server = ChatServer(password or "")
+    server = ChatServer(password or "", config)
+    sock = None
+    if server.config.takeover:
+        sock, state = receive_handoff(server.config.takeover)
+        server.restore(state)
+        addr = sock.getsockname()
+        print(
+            f"[*] Took over {addr[0]}:{addr[1]} "
+            f"with {len(state.messages)} messages"
+        )
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError, RuntimeError):
+                loop.add_signal_handler(sig, server.request_shutdown)
+        if sock:
+            await server.serve(sock)
+        else:
+            await server.start(host, port)
+
     try:
-        asyncio.run(server.start(host, port))
+        asyncio.run(main())
     except KeyboardInterrupt:
         print("\n[*] Shutting down...")
+    server.report_limits()
@@ -4,6 +4,8 @@ from uuid import uuid4
 
 import srp
 
+from .hooks import Hooks
+
 srp.rfc5054_enable()
 
 
@@ -17,10 +19,16 @@ class SRPSession:
 
 
 class SRPAuthManager:
-    def __init__(self, password: str):
+    def __init__(
+        self,
+        password: str,
+        hooks: Optional[Hooks] = None,
+        verifier: Optional[tuple[bytes, bytes]] = None,
+    ):
+        self.hooks = hooks or Hooks()
         self.password = password.encode()
         self.sessions: dict[str, SRPSession] = {}
-        self.salt, self.vkey = srp.create_salted_verification_key(
+        self.salt, self.vkey = verifier or srp.create_salted_verification_key(
             b"chat", self.password, hash_alg=srp.SHA256
         )
 
@@ -29,11 +37,11 @@ class SRPAuthManager:
     ) -> tuple[str, bytes, bytes]:
         session = SRPSession(username=username)
 
-        svr = srp.Verifier(
-            b"chat", self.salt, self.vkey, client_public, hash_alg=srp.SHA256
-        )
-
-        s, B = svr.get_challenge()
+        with self.hooks.span("srp.challenge"):
+            svr = srp.Verifier(
+                b"chat", self.salt, self.vkey, client_public, hash_alg=srp.SHA256
+            )
+            s, B = svr.get_challenge()
 
         if B is None:
             raise ValueError("SRP challenge generation failed")
@@ -48,7 +56,8 @@ class SRPAuthManager:
         if not session or not session.svr:
             raise ValueError("Invalid session")
 
-        H_AMK = session.svr.verify_session(client_proof)
+        with self.hooks.span("srp.verify"):
+            H_AMK = session.svr.verify_session(client_proof)
 
         if H_AMK is None:
             del self.sessions[user_id]
@@ -1,18 +1,37 @@
 from typing import Optional
+from .hooks import Hooks
 from .models import Message, UserSession
 
 
 class MessageStore:
-    def __init__(self):
+    def __init__(self, hooks: Optional[Hooks] = None):
         self._messages: list[Message] = []
+        self.base = 0
+        self.hooks = hooks or Hooks()
+
+    @property
+    def last_seq(self) -> int:
+        return self.base + len(self._messages)
 
     def add(self, message: Message) -> None:
-        self._messages.append(message)
+        with self.hooks.span("store.append"):
+            message.seq = self.last_seq + 1
+            self._messages.append(message)
+
+    def get(self, seq: int) -> Optional[Message]:
+        index = seq - self.base - 1
+        return self._messages[index] if 0 <= index < len(self._messages) else None
+
+    def since(self, seq: int) -> Optional[list[Message]]:
+        if not self.base <= seq <= self.last_seq:
+            return None
+        return self._messages[seq - self.base :]
 
     def get_all(self) -> list[Message]:
         return self._messages.copy()
 
     def clear(self) -> None:
+        self.base = self.last_seq
         self._messages.clear()
 
     def count(self) -> int:
@@ -22,9 +41,14 @@ class MessageStore:
 class UserSessionStore:
     def __init__(self):
         self._sessions: dict[str, UserSession] = {}
+        self._ids: dict[str, str] = {}
 
-    def add(self, session: UserSession) -> None:
+    def add(self, session: UserSession) -> bool:
+        if self._ids.get(session.username, session.user_id) != session.user_id:
+            return False
         self._sessions[session.user_id] = session
+        self._ids[session.username] = session.user_id
+        return True
 
     def get(self, user_id: str) -> Optional[UserSession]:
         return self._sessions.get(user_id)
@@ -34,14 +58,16 @@ class UserSessionStore:
             session.update_activity()
 
     def remove(self, user_id: str) -> None:
-        self._sessions.pop(user_id, None)
+        if session := self._sessions.pop(user_id, None):
+            if self._ids.get(session.username) == user_id:
+                del self._ids[session.username]
 
     def cleanup_stale(self, timeout_seconds: int = 3600) -> int:
         stale_ids = [
             uid for uid, s in self._sessions.items() if s.is_stale(timeout_seconds)
         ]
         for uid in stale_ids:
-            del self._sessions[uid]
+            self.remove(uid)
         return len(stale_ids)
 
     def get_all(self) -> list[UserSession]:
@@ -51,4 +77,7 @@ class UserSessionStore:
         return len(self._sessions)
 
     def username_exists(self, username: str) -> bool:
-        return any(s.username == username for s in self._sessions.values())
+        return username in self._ids
+
+    def user_id_for(self, username: str) -> Optional[str]:
+        return self._ids.get(username)
@@ -0,0 +1,78 @@
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class Transfer:
+    file_id: str
+    sender: str
+    size: int
+    chunks: int
+    received: int = 0
+    bytes: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+
+class TransferError(Exception):
+    pass
+
+
+class TransferManager:
+    def __init__(self, max_chunk: int, max_size: int, max_per_user: int):
+        self.max_chunk = max_chunk
+        self.max_size = max_size
+        self.max_per_user = max_per_user
+        self.transfers: dict[str, Transfer] = {}
+        self.completed = 0
+        self.relayed_bytes = 0
+
+    def offer(self, sender: str, data: dict) -> Transfer:
+        file_id = data.get("file_id")
+        size, chunks = data.get("size"), data.get("chunks")
+        if not isinstance(file_id, str) or not 0 < len(file_id) <= 64:
+            raise TransferError("Invalid file id")
+        if file_id in self.transfers:
+            raise TransferError("Duplicate file id")
+        if not isinstance(size, int) or not 0 <= size <= self.max_size:
+            raise TransferError(f"File too large (max {self.max_size} bytes)")
+        if not isinstance(chunks, int) or not 0 <= chunks <= max(1, size):
+            raise TransferError("Invalid chunk count")
+        if sum(t.sender == sender for t in self.transfers.values()) >= self.max_per_user:
+            raise TransferError("Too many transfers in progress")
+        transfer = self.transfers[file_id] = Transfer(file_id, sender, size, chunks)
+        return transfer
+
+    def chunk(self, sender: str, data: dict) -> Transfer:
+        transfer = self._own(sender, data.get("file_id"))
+        payload = data.get("data")
+        if data.get("seq") != transfer.received:
+            raise TransferError("Chunk out of order")
+        if not isinstance(payload, str) or len(payload) > self.max_chunk:
+            raise TransferError(f"Chunk too large (max {self.max_chunk} bytes)")
+        if transfer.received >= transfer.chunks:
+            raise TransferError("Too many chunks")
+        transfer.received += 1
+        transfer.bytes += len(payload)
+        self.relayed_bytes += len(payload)
+        return transfer
+
+    def end(self, sender: str, file_id: Optional[str], complete: bool = True) -> Transfer:
+        transfer = self._own(sender, file_id)
+        if complete and transfer.received != transfer.chunks:
+            raise TransferError("Transfer incomplete")
+        del self.transfers[transfer.file_id]
+        self.completed += complete
+        return transfer
+
+    def drop(self, sender: str) -> list[Transfer]:
+        dropped = [t for t in self.transfers.values() if t.sender == sender]
+        for transfer in dropped:
+            del self.transfers[transfer.file_id]
+        return dropped
+
+    def _own(self, sender: str, file_id: Optional[str]) -> Transfer:
+        transfer = self.transfers.get(file_id) if isinstance(file_id, str) else None
+        if transfer is None or transfer.sender != sender:
+            raise TransferError("Unknown transfer")
+        return transfer
@@ -0,0 +1,85 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+
+from cmd_chat.bench.crypto import bench_suite
+from cmd_chat.bench.load import percentile, run_load
+from cmd_chat.bench.micro import BENCHMARKS, measure, run_micro_bench
+
+
+class TestCryptoBench:
+    def test_bench_suite_reports_sizes(self):
+        result = bench_suite("aes-256-gcm", 100, iterations=10, repeat=1)
+
+        assert result.raw_bytes == 100 + 29
+        assert result.wire_bytes > result.raw_bytes
+        assert result.encrypt_per_sec > 0
+
+
+class TestLoadBench:
+    def test_percentile(self):
+        values = [float(i) for i in range(1, 101)]
+
+        assert percentile(values, 50) == 51.0
+        assert percentile(values, 99) == 99.0
+        assert percentile([], 50) == 0.0
+
+    @pytest.mark.asyncio
+    async def test_in_process_load(self):
+        result = await run_load(clients=3, rate=10, duration=0.3)
+
+        assert result.errors == 0
+        assert len(result.handshakes) == 3
+        assert result.sent > 0
+        assert result.delivered == result.sent * 3
+        assert len(result.latencies) == result.delivered
+        assert "fan-out ms" in result.summary()
+        assert result.rss and result.rss > 2**20
+
+
+class TestMicroBench:
+    def test_every_benchmark_runs(self):
+        for bench in BENCHMARKS:
+            timing = measure(bench, bench.sizes[0], min_time=0.001, repeat=1)
+            assert timing.best > 0
+            assert timing.iterations >= 1
+
+    def test_message_add_stays_near_size(self, monkeypatch):
+        from cmd_chat.bench import micro
+
+        stores = []
+        build = micro._message_store
+
+        def tracked(size):
+            stores.append(build(size))
+            return stores[-1]
+
+        monkeypatch.setattr(micro, "_message_store", tracked)
+        add = micro.bench_message_add(100)
+        for _ in range(micro.ADD_BATCH * 3 + 5):
+            add()
+
+        messages = stores[0].get_all()
+        assert len(messages) == 105
+        assert len({id(m) for m in messages}) == 105
+        assert [m.seq for m in messages] == list(range(1, 106))
+
+    def test_save_and_compare_baseline(self, tmp_path):
+        path = str(tmp_path / "baseline.json")
+
+        timings, _ = run_micro_bench(
+            filter="message_store.get_all", min_time=0.001, repeat=1, save=path
+        )
+        _, regressions = run_micro_bench(
+            filter="message_store.get_all",
+            min_time=0.001,
+            repeat=1,
+            compare=path,
+            threshold=1000.0,
+        )
+
+        assert [t.key for t in timings][0] == "message_store.get_all[10]"
+        assert regressions == []
@@ -24,6 +24,7 @@ def client():
         port=3000,
         username="testuser",
         password="testpassword",
+        reconnect_attempts=0,
     )
 
 
@@ -393,10 +394,11 @@ class TestReceiveLoop:
         with patch.object(client, "render_messages"):
             await client.receive_loop()
 
+        visible = client.visible_messages()
         assert len(client.messages) == 3
-        assert client.messages[0]["text"] == "First"
-        assert client.messages[1]["text"] == "Second"
-        assert client.messages[2]["text"] == "Third"
+        assert visible[0]["text"] == "First"
+        assert visible[1]["text"] == "Second"
+        assert visible[2]["text"] == "Third"
 
     @pytest.mark.asyncio
     async def test_receive_init_message(self, client):
@@ -497,6 +499,212 @@ class TestReceiveLoop:
         assert client.messages == []
 
 
+class TestLazyDecryption:
+    @pytest.mark.asyncio
+    async def test_init_history_not_decrypted(self, client, room_fernet):
+        client.room_fernet = room_fernet
+        client.running = True
+        history = [
+            {"id": str(i), "text": room_fernet.encrypt(f"m{i}".encode()).decode()}
+            for i in range(100)
+        ]
+        init_msg = json.dumps({"type": "init", "messages": history, "users": []})
+
+        mock_reader = AsyncMock()
+        mock_reader.readline = AsyncMock(side_effect=[(init_msg + "\n").encode(), b""])
+        client.reader = mock_reader
+
+        with patch.object(client, "render_messages"):
+            with patch.object(client, "_decrypt_text") as mock_decrypt:
+                await client.receive_loop()
+
+        mock_decrypt.assert_not_called()
+        assert len(client.messages) == 100
+
+    @pytest.mark.asyncio
+    async def test_joins_room_with_history_over_64k(self):
+        from cmd_chat.client import AsyncChatClient
+        from cmd_chat.server.models import Message
+        from cmd_chat.server.server import ChatServer
+
+        server = ChatServer("testpassword")
+        for i in range(2000):
+            server.message_store.add(Message(text="x" * 200, username=f"u{i}"))
+        sock = server.listen("127.0.0.1", 0)
+        serve_task = asyncio.create_task(server.serve(sock))
+        try:
+            async with AsyncChatClient(
+                "127.0.0.1", sock.getsockname()[1], "alice", "testpassword"
+            ) as alice:
+                with patch.object(alice, "_decrypt_text") as mock_decrypt:
+                    init = await asyncio.wait_for(anext(alice.events()), 5)
+
+                assert init.type == "init"
+                assert len(json.dumps(init.data)) > 400 * 1024
+                assert len(alice.messages) == 2000
+                mock_decrypt.assert_not_called()
+        finally:
+            serve_task.cancel()
+            await asyncio.gather(serve_task, return_exceptions=True)
+
+    def test_visible_window_decrypts_only_tail(self, client, room_fernet):
+        client.room_fernet = room_fernet
+        client.messages = [
+            {"id": str(i), "text": room_fernet.encrypt(f"m{i}".encode()).decode()}
+            for i in range(100)
+        ]
+
+        visible = client.visible_messages()
+
+        assert [m["text"] for m in visible] == [f"m{i}" for i in range(85, 100)]
+        assert set(client._plaintext) == {str(i) for i in range(85, 100)}
+        assert client.messages[99]["text"] != "m99"
+
+    def test_plaintext_memoized(self, client, room_fernet):
+        client.room_fernet = room_fernet
+        client.messages = [{"id": "a", "text": room_fernet.encrypt(b"hi").decode()}]
+
+        client.visible_messages()
+        with patch.object(client, "_decrypt_text") as mock_decrypt:
+            assert client.visible_messages()[0]["text"] == "hi"
+        mock_decrypt.assert_not_called()
+
+    def test_scrollback_window(self, client, room_fernet):
+        client.room_fernet = room_fernet
+        client.messages = [
+            {"id": str(i), "text": room_fernet.encrypt(f"m{i}".encode()).decode()}
+            for i in range(40)
+        ]
+
+        client.scroll(10)
+        assert client.visible_messages()[-1]["text"] == "m29"
+
+        client.scroll(1000)
+        assert client.scroll_offset == 25
+        assert client.visible_messages()[0]["text"] == "m0"
+
+        client.scroll(-1000)
+        assert client.scroll_offset == 0
+
+
+class TestBatchDecrypt:
+    @pytest.mark.asyncio
+    async def test_chunks_stream_in_order(self, client, room_fernet):
+        client.room_fernet = room_fernet
+        client.batch_decryptor.chunk_size = 7
+        client.messages = [
+            {"id": str(i), "text": room_fernet.encrypt(f"m{i}".encode()).decode()}
+            for i in range(50)
+        ]
+
+        chunks = [chunk async for chunk in client.decrypt_history()]
+
+        assert [len(c) for c in chunks] == [7] * 7 + [1]
+        assert [m["text"] for c in chunks for m in c] == [f"m{i}" for i in range(50)]
+        assert len(client._plaintext) == 50
+        client.batch_decryptor.close()
+
+    @pytest.mark.asyncio
+    async def test_cached_messages_skip_decrypt(self, client, room_fernet):
+        client.room_fernet = room_fernet
+        client.messages = [{"id": "a", "text": "garbage"}]
+        client._plaintext["a"] = "cached"
+
+        chunks = [chunk async for chunk in client.decrypt_history()]
+
+        assert chunks == [[{"id": "a", "text": "cached"}]]
+        client.batch_decryptor.close()
+
+    @pytest.mark.asyncio
+    async def test_event_loop_not_blocked(self, client, room_fernet):
+        client.room_fernet = room_fernet
+        client.batch_decryptor.chunk_size = 50
+        client.messages = [
+            {"id": str(i), "text": room_fernet.encrypt(b"x" * 512).decode()}
+            for i in range(2000)
+        ]
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(ticker())
+        async for _ in client.decrypt_history():
+            pass
+        task.cancel()
+
+        assert ticks > 10
+        client.batch_decryptor.close()
+
+    @pytest.mark.asyncio
+    async def test_search(self, client, room_fernet):
+        client.room_fernet = room_fernet
+        client.messages = [
+            {"id": str(i), "text": room_fernet.encrypt(t.encode()).decode()}
+            for i, t in enumerate(["hello world", "bye", "Hello again"])
+        ]
+
+        found = await client.search("hello")
+
+        assert [m["id"] for m in found] == ["0", "2"]
+        client.batch_decryptor.close()
+
+
+class TestPlaintextCache:
+    def test_lru_evicts_least_recent(self):
+        from cmd_chat.client.cache import PlaintextCache
+
+        cache = PlaintextCache(capacity=2)
+        cache["a"] = "1"
+        cache["b"] = "2"
+        cache["a"]
+        cache["c"] = "3"
+
+        assert list(cache) == ["a", "c"]
+
+    def test_byte_cap(self):
+        from cmd_chat.client.cache import PlaintextCache
+
+        cache = PlaintextCache(max_bytes=10)
+        cache["a"] = "x" * 6
+        cache["b"] = "y" * 6
+
+        assert list(cache) == ["b"]
+        assert cache.size_bytes == 6
+
+        cache.clear()
+        assert cache.size_bytes == 0
+
+    def test_file_roundtrip(self, tmp_path, room_salt):
+        from cmd_chat.client.cache import EncryptedFileCache
+
+        path = str(tmp_path / "cache.bin")
+        cache = EncryptedFileCache.open(path, b"testpassword", room_salt)
+        cache["id-1"] = "secret text"
+        cache.save()
+
+        assert b"secret text" not in open(path, "rb").read()
+        assert os.stat(path).st_mode & 0o777 == 0o600
+
+        reopened = EncryptedFileCache.open(path, b"testpassword", room_salt)
+        assert reopened["id-1"] == "secret text"
+
+        wrong = EncryptedFileCache.open(path, b"wrong", room_salt)
+        assert len(wrong) == 0
+
+    def test_cached_history_not_decrypted(self, client, room_fernet):
+        client.room_fernet = room_fernet
+        client._plaintext["m1"] = "from cache"
+        client.messages = [{"id": "m1", "text": "not-a-token"}]
+
+        with patch.object(client, "_decrypt_text") as mock_decrypt:
+            assert client.visible_messages()[0]["text"] == "from cache"
+        mock_decrypt.assert_not_called()
+
+
 class TestInputLoop:
     @pytest.mark.asyncio
     async def test_input_quit_command(self, client):
@@ -575,6 +783,129 @@ class TestInputLoop:
         mock_writer.write.assert_not_called()
 
 
+class TestLineReader:
+    def test_editor_cursor_editing(self):
+        from cmd_chat.client.terminal import LineEditor
+
+        editor = LineEditor()
+        editor.insert("helo")
+        editor.key("left")
+        editor.insert("l")
+        editor.key("end")
+        editor.insert(" world")
+        editor.key("kill_word")
+
+        assert editor.buffer == "hello "
+        assert editor.key("enter") == "hello "
+        assert editor.buffer == ""
+
+    def test_editor_history(self):
+        from cmd_chat.client.terminal import LineEditor
+
+        editor = LineEditor()
+        editor.insert("first")
+        editor.key("enter")
+        editor.insert("second")
+        editor.key("enter")
+
+        editor.key("up")
+        assert editor.buffer == "second"
+        editor.key("up")
+        assert editor.buffer == "first"
+        editor.key("down")
+        editor.key("down")
+        assert editor.buffer == ""
+
+    @pytest.mark.asyncio
+    async def test_interactive_escape_split_across_reads(self):
+        from cmd_chat.client.terminal import LineReader
+
+        keys = []
+        reader = LineReader(0, on_key=keys.append)
+        reader.interactive = True
+
+        reader.feed("ab\x1b[")
+        reader.feed("D\x7fc\x1b[5")
+        reader.feed("~\r")
+
+        assert await reader.readline() == "cb"
+        assert keys == ["page_up"]
+
+    @pytest.mark.asyncio
+    async def test_pipe_lines_and_eof(self):
+        from cmd_chat.client.terminal import LineReader
+
+        read_fd, write_fd = os.pipe()
+        reader = LineReader(read_fd)
+        reader.start()
+        try:
+            os.write(write_fd, "hello\nwörld\n".encode())
+            os.close(write_fd)
+
+            assert await asyncio.wait_for(reader.readline(), 1) == "hello"
+            assert await asyncio.wait_for(reader.readline(), 1) == "wörld"
+            with pytest.raises(EOFError):
+                await asyncio.wait_for(reader.readline(), 1)
+        finally:
+            reader.stop()
+            os.close(read_fd)
+
+    @pytest.mark.asyncio
+    async def test_unpollable_stdin_falls_back(self, tmp_path):
+        from cmd_chat.client.terminal import LineReader
+
+        script = tmp_path / "script.txt"
+        script.write_text("hello\n")
+        for path in (script, os.devnull):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                reader = LineReader(fd)
+                assert reader.start() is False
+                reader.stop()
+            finally:
+                os.close(fd)
+
+    @pytest.mark.asyncio
+    async def test_run_async_reads_redirected_stdin_with_input(self, client):
+        client.srp_authenticate = AsyncMock()
+        client.reader = asyncio.StreamReader()
+        client.reader.feed_data(b'{"type": "init", "messages": [], "users": []}\n')
+        reader = MagicMock(start=MagicMock(return_value=False))
+
+        with (
+            patch("asyncio.open_connection", new_callable=AsyncMock) as mock_connect,
+            patch("cmd_chat.client.client.LineReader.open", return_value=reader),
+            patch("builtins.input", side_effect=EOFError) as mock_input,
+            patch.object(client.console, "clear"),
+            patch.object(client.console, "print"),
+        ):
+            mock_connect.return_value = (client.reader, MagicMock())
+            await client.run_async()
+
+        reader.start.assert_called_once()
+        reader.readline.assert_not_called()
+        mock_input.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_input_loop_uses_line_reader(self, client, room_fernet):
+        client.room_fernet = room_fernet
+        client.running = True
+        client.line_reader = MagicMock()
+        client.line_reader.readline = AsyncMock(side_effect=["hi", "q"])
+
+        mock_writer = MagicMock()
+        mock_writer.drain = AsyncMock()
+        client.writer = mock_writer
+
+        with patch("asyncio.get_event_loop") as mock_loop:
+            await client.input_loop()
+
+        mock_loop.return_value.run_in_executor.assert_not_called()
+        sent = json.loads(mock_writer.write.call_args[0][0].decode())
+        assert room_fernet.decrypt(sent["text"].encode()) == b"hi"
+        assert client.running is False
+
+
 class TestRunAsync:
     @pytest.mark.asyncio
     async def test_run_connection_refused(self, client):
@@ -617,7 +948,7 @@ class TestRenderMessages:
         client.room_fernet = Fernet(Fernet.generate_key())
         client.username = "testuser"
         client.messages = [
-            {"username": "testuser", "text": "my msg", "timestamp": "2024-01-01T12:00:00"}
+            {"username": "testuser", "text": client.room_fernet.encrypt(b"my msg").decode(), "timestamp": "2024-01-01T12:00:00"}
         ]
         client.users = []
 
@@ -636,7 +967,7 @@ class TestRenderMessages:
         client.room_fernet = Fernet(Fernet.generate_key())
         client.username = "testuser"
         client.messages = [
-            {"username": "other", "text": "their msg", "timestamp": "2024-01-01T12:00:00"}
+            {"username": "other", "text": client.room_fernet.encrypt(b"their msg").decode(), "timestamp": "2024-01-01T12:00:00"}
         ]
         client.users = []
 
@@ -686,6 +1017,221 @@ class TestRenderMessages:
         assert "none" in str(online_line[0])
 
 
+class TestRenderer:
+    @pytest.mark.asyncio
+    async def test_burst_collapses_into_one_frame(self):
+        from cmd_chat.client.render import Renderer
+
+        console = MagicMock()
+        renderer = Renderer(console, fps=20)
+
+        for i in range(50):
+            renderer.append(f"line {i}")
+        renderer.set_footer("Online: alice")
+
+        await asyncio.sleep(0.01)
+
+        assert renderer.frames == 1
+        assert console.print.call_count == 50
+
+    @pytest.mark.asyncio
+    async def test_frames_throttled(self):
+        from cmd_chat.client.render import Renderer
+
+        renderer = Renderer(MagicMock(), fps=10)
+
+        renderer.append("a")
+        await asyncio.sleep(0.01)
+        renderer.append("b")
+        await asyncio.sleep(0.02)
+
+        assert renderer.frames == 1
+
+        await asyncio.sleep(0.1)
+        assert renderer.frames == 2
+
+    @pytest.mark.asyncio
+    async def test_repaint_supersedes_pending_lines(self):
+        from cmd_chat.client.render import Renderer
+
+        console = MagicMock()
+        renderer = Renderer(console, fps=20)
+        repaint = MagicMock()
+
+        renderer.append("stale")
+        renderer.repaint(repaint)
+        renderer.append("also stale")
+        await asyncio.sleep(0.01)
+
+        repaint.assert_called_once()
+        console.print.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_notices_survive_repaint(self):
+        from cmd_chat.client.render import Renderer
+
+        order = []
+        console = MagicMock()
+        console.print.side_effect = order.append
+        renderer = Renderer(console, fps=20)
+
+        renderer.notice("before")
+        renderer.append("stale")
+        renderer.repaint(lambda: order.append("REPAINT"))
+        renderer.notice("after")
+        await asyncio.sleep(0.01)
+
+        assert order == ["REPAINT", "before", "after"]
+
+    @pytest.mark.asyncio
+    async def test_client_appends_new_message_only(self, client, room_fernet):
+        from cmd_chat.client.render import Renderer
+
+        client.room_fernet = room_fernet
+        client.renderer = Renderer(MagicMock(), fps=20)
+        client.messages = [{"id": "1", "text": room_fernet.encrypt(b"new").decode()}]
+
+        with patch.object(client, "render_messages") as mock_render:
+            with patch.object(client.renderer, "append") as mock_append:
+                client.show_message()
+
+        mock_render.assert_not_called()
+        assert "new" in mock_append.call_args[0][0]
+
+
+class TestRoomCipher:
+    @pytest.mark.parametrize("suite", ["aes-256-gcm", "chacha20-poly1305", "fernet"])
+    def test_roundtrip(self, suite, room_salt):
+        from cmd_chat.crypto import RoomCipher
+
+        sender = RoomCipher.derive(b"testpassword", room_salt, suite)
+        receiver = RoomCipher.derive(b"testpassword", room_salt, "fernet")
+
+        token = sender.encrypt_text("Привет 🎉")
+
+        assert receiver.decrypt_text(token) == "Привет 🎉"
+
+    def test_fernet_suite_is_legacy_compatible(self, room_salt, room_fernet):
+        from cmd_chat.crypto import RoomCipher
+
+        cipher = RoomCipher.derive(b"testpassword", room_salt, "fernet")
+
+        assert room_fernet.decrypt(cipher.encrypt_text("old").encode()) == b"old"
+        legacy = room_fernet.encrypt(b"legacy").decode()
+        aead = RoomCipher.derive(b"testpassword", room_salt, "aes-256-gcm")
+        assert aead.decrypt_text(legacy) == "legacy"
+
+    def test_use_switches_suite(self, room_salt, room_fernet):
+        from cmd_chat.crypto import RoomCipher
+
+        cipher = RoomCipher.derive(b"testpassword", room_salt, "aes-256-gcm")
+        cipher.use("fernet")
+        assert room_fernet.decrypt(cipher.encrypt_text("old").encode()) == b"old"
+        cipher.use("chacha20-poly1305")
+        assert cipher.suite == "chacha20-poly1305"
+        with pytest.raises(ValueError):
+            RoomCipher(room_fernet).use("aes-256-gcm")
+
+    def test_aead_smaller_than_fernet(self, room_salt):
+        from cmd_chat.crypto import RoomCipher
+
+        gcm = RoomCipher.derive(b"testpassword", room_salt, "aes-256-gcm")
+        fernet = RoomCipher.derive(b"testpassword", room_salt, "fernet")
+
+        assert len(gcm.encrypt(b"x" * 100)) == 100 + 29
+        assert len(gcm.encrypt_text("x" * 100)) < len(fernet.encrypt_text("x" * 100))
+
+    def test_aead_wrong_password_fails(self, room_salt):
+        from cmd_chat.crypto import RoomCipher
+
+        good = RoomCipher.derive(b"testpassword", room_salt, "chacha20-poly1305")
+        bad = RoomCipher.derive(b"wrong", room_salt, "chacha20-poly1305")
+
+        with pytest.raises(Exception):
+            bad.decrypt_text(good.encrypt_text("secret"))
+
+    def test_negotiate(self):
+        from cmd_chat.crypto import negotiate
+
+        assert negotiate(["fernet", "chacha20-poly1305"]) == "chacha20-poly1305"
+        assert negotiate([]) == "fernet"
+        assert negotiate(["aes-256-gcm"], allowed=["fernet"]) == "fernet"
+
+    @pytest.mark.asyncio
+    async def test_client_uses_negotiated_suite(self, client, room_salt):
+        client.reader = AsyncMock()
+        client.writer = MagicMock()
+        client.writer.drain = AsyncMock()
+        init = {
+            "user_id": "u1",
+            "B": base64.b64encode(b"B").decode(),
+            "salt": base64.b64encode(b"s").decode(),
+            "room_salt": base64.b64encode(room_salt).decode(),
+            "suite": "aes-256-gcm",
+        }
+        verify = {
+            "H_AMK": base64.b64encode(b"h").decode(),
+            "session_key": base64.b64encode(Fernet.generate_key()).decode(),
+        }
+        client.reader.readline = AsyncMock(
+            side_effect=[(json.dumps(m) + "\n").encode() for m in (init, verify)]
+        )
+
+        with patch("cmd_chat.client.client.srp.User") as mock_srp_user:
+            mock_usr = mock_srp_user.return_value
+            mock_usr.start_authentication.return_value = (None, b"A")
+            mock_usr.process_challenge.return_value = b"M"
+            mock_usr.authenticated.return_value = True
+            await client.srp_authenticate()
+
+        sent = json.loads(client.writer.write.call_args_list[0][0][0])
+        assert "aes-256-gcm" in sent["suites"]
+        assert client.room_cipher.suite == "aes-256-gcm"
+
+
+class TestAsyncChatClient:
+    @pytest.mark.asyncio
+    async def test_headless_clients_exchange_messages(self):
+        from cmd_chat.client import AsyncChatClient
+        from cmd_chat.server.server import ChatServer
+
+        server = ChatServer("testpassword")
+        sock = server.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        serve_task = asyncio.create_task(server.serve(sock))
+
+        try:
+            async with AsyncChatClient("127.0.0.1", port, "alice", "testpassword") as alice:
+                async with AsyncChatClient("127.0.0.1", port, "bob", "testpassword") as bob:
+                    alice_events = alice.events()
+                    bob_events = bob.events()
+                    assert (await anext(alice_events)).type == "init"
+                    assert (await anext(bob_events)).type == "init"
+                    joined = await anext(alice_events)
+                    assert joined.type == "user_joined"
+                    assert [u["username"] for u in alice.users] == ["alice", "bob"]
+
+                    await bob.send("hi alice")
+                    event = await asyncio.wait_for(anext(alice_events), 1)
+
+                    assert event.type == "message"
+                    assert event.text == "hi alice"
+                    assert event.data["username"] == "bob"
+                    assert alice.room_cipher.suite == "aes-256-gcm"
+        finally:
+            serve_task.cancel()
+            await asyncio.gather(serve_task, return_exceptions=True)
+
+    def test_core_has_no_console(self):
+        from cmd_chat.client import AsyncChatClient
+
+        chat = AsyncChatClient("localhost", 3000, "bot", "pw")
+
+        assert not hasattr(chat, "console")
+        assert chat.apply({"type": "user_joined", "user_id": "1", "username": "x"}).type == "user_joined"
+        assert chat.users == [{"user_id": "1", "username": "x"}]
+
+
 class TestE2EEncryption:
     def test_same_password_same_key(self, room_salt):
         password = b"shared_secret"
@@ -788,3 +1334,131 @@ class TestEdgeCases:
     def test_ipv6_server(self):
         client = Client("::1", 3000, "user", "pass")
         assert client.server == "::1"
+
+
+class TestFileTransfer:
+    @pytest.mark.asyncio
+    async def test_file_streams_between_clients(self, tmp_path):
+        from cmd_chat.client import AsyncChatClient
+        from cmd_chat.client.files import CHUNK_SIZE
+        from cmd_chat.server.server import ChatServer
+
+        server = ChatServer("testpassword")
+        sock = server.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        serve_task = asyncio.create_task(server.serve(sock))
+        source = tmp_path / "report.bin"
+        source.write_bytes(os.urandom(CHUNK_SIZE * 5 + 123))
+        downloads = tmp_path / "downloads"
+
+        async def collect(client, events, until):
+            async for event in client.events():
+                events.append(event)
+                if event.type == until:
+                    return
+
+        try:
+            async with AsyncChatClient("127.0.0.1", port, "alice", "testpassword") as alice:
+                async with AsyncChatClient(
+                    "127.0.0.1", port, "bob", "testpassword", download_dir=downloads
+                ) as bob:
+                    alice_events, bob_events = [], []
+                    bob_task = asyncio.create_task(collect(bob, bob_events, "file_end"))
+                    alice_task = asyncio.create_task(collect(alice, alice_events, "never"))
+                    await asyncio.sleep(0.05)
+
+                    await asyncio.wait_for(alice.send_file(source, window=2), 5)
+                    await asyncio.wait_for(bob_task, 5)
+                    alice_task.cancel()
+        finally:
+            serve_task.cancel()
+            await asyncio.gather(serve_task, return_exceptions=True)
+
+        types = [e.type for e in bob_events]
+        assert types.count("file_chunk") == 6
+        assert bob_events[-1].text == str(downloads / "report.bin")
+        assert (downloads / "report.bin").read_bytes() == source.read_bytes()
+        assert not list(downloads.glob("*.part"))
+        assert [e.type for e in alice_events].count("file_ack") == 6
+        assert server.transfers.transfers == {}
+        assert server.transfers.completed == 1
+
+    def test_chunks_are_bound_to_transfer_and_position(self):
+        from cryptography.fernet import Fernet
+        from cmd_chat.client.files import decrypt_chunk, encrypt_chunk, safe_name
+        from cmd_chat.crypto import RoomCipher
+
+        cipher = RoomCipher(Fernet(Fernet.generate_key()))
+        token = encrypt_chunk(cipher, "f1", 0, b"data")
+
+        assert decrypt_chunk(cipher, "f1", 0, token) == b"data"
+        with pytest.raises(ValueError):
+            decrypt_chunk(cipher, "f1", 1, token)
+        with pytest.raises(ValueError):
+            decrypt_chunk(cipher, "f2", 0, token)
+        assert safe_name("../../etc/passwd") == "passwd"
+        assert safe_name("..\\evil.txt") == "evil.txt"
+        assert safe_name("...") == "file"
+
+
+class TestDirectMessages:
+    def test_cipher_needs_both_keys_and_room_password(self, room_salt):
+        from cryptography.exceptions import InvalidTag
+        from cmd_chat.crypto import DirectCipher
+
+        alice = DirectCipher.derive(b"testpassword", room_salt)
+        bob = DirectCipher.derive(b"testpassword", room_salt)
+        eve = DirectCipher.derive(b"testpassword", room_salt)
+        outsider = DirectCipher.derive(b"wrong", room_salt, bob.private)
+
+        token = alice.encrypt_text(bob.public, "psst")
+
+        assert bob.decrypt_text(alice.public, token) == "psst"
+        assert alice.decrypt_text(bob.public, bob.encrypt_text(alice.public, "hi")) == "hi"
+        wrong = ((eve, alice.public), (outsider, alice.public), (alice, bob.public))
+        for reader, peer in wrong:
+            with pytest.raises(InvalidTag):
+                reader.decrypt_text(peer, token)
+
+    @pytest.mark.asyncio
+    async def test_direct_reaches_only_the_recipient(self):
+        from cmd_chat.client import AsyncChatClient
+        from cmd_chat.server.server import ChatServer
+
+        server = ChatServer("testpassword")
+        sock = server.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        serve_task = asyncio.create_task(server.serve(sock))
+        names = ("alice", "bob", "carol")
+        clients = [AsyncChatClient("127.0.0.1", port, n, "testpassword") for n in names]
+        try:
+            for client in clients:
+                await client.connect()
+            alice, bob, carol = clients
+            streams = [client.events() for client in clients]
+            for client, stream in zip(clients, streams):
+                while len(client.users) < 3:
+                    await asyncio.wait_for(anext(stream), 1)
+
+            await alice.send_direct("bob", "secret")
+            await alice.send_json({"type": "direct", "to": "nobody", "text": "x"})
+            event = await asyncio.wait_for(anext(streams[1]), 1)
+            error = await asyncio.wait_for(anext(streams[0]), 1)
+            await carol.send("public")
+            seen_by_carol = await asyncio.wait_for(anext(streams[2]), 1)
+
+            assert event.type == "direct" and event.text == "secret"
+            assert event.data["username"] == "alice"
+            assert event.data["text"] != "secret"
+            assert error.type == "direct_error" and error.data["to"] == "nobody"
+            assert seen_by_carol.type == "message"
+            assert server.metrics.direct_messages.value == 1
+            assert alice.key_fingerprint("bob") == bob.key_fingerprint()
+            assert alice.key_fingerprint("carol") != bob.key_fingerprint()
+            with pytest.raises(ValueError):
+                await alice.send_direct("nobody", "x")
+        finally:
+            for client in clients:
+                await client.close()
+            serve_task.cancel()
+            await asyncio.gather(serve_task, return_exceptions=True)
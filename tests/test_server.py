@@ -150,6 +150,28 @@ class TestSRPFlow:
         assert usr.authenticated()
         assert session_key is not None
 
+    @pytest.mark.asyncio
+    async def test_srp_init_negotiates_suite(self, server):
+        srp.rfc5054_enable()
+        usr = srp.User(b"chat", b"testpassword", hash_alg=srp.SHA256)
+        _, A = usr.start_authentication()
+
+        writer_transport = MockTransport()
+        writer = MockStreamWriter(writer_transport)
+        for suites in (["fernet", "chacha20-poly1305"], None):
+            request = {"cmd": "srp_init", "username": "u", "A": base64.b64encode(A).decode()}
+            if suites:
+                request["suites"] = suites
+            reader = asyncio.StreamReader()
+            reader.feed_data((json.dumps(request) + "\n").encode())
+            reader.feed_eof()
+            writer_transport.data = b""
+
+            await server._handle_auth(reader, writer, "127.0.0.1")
+
+            response = json.loads(writer_transport.data.decode().strip())
+            assert response["suite"] == ("chacha20-poly1305" if suites else "fernet")
+
     @pytest.mark.asyncio
     async def test_srp_verify_invalid_session(self, server):
         reader = asyncio.StreamReader()
@@ -255,6 +277,46 @@ class TestChat:
         assert server.message_store.count() == 0
 
 
+    @pytest.mark.asyncio
+    async def test_room_falls_back_to_fernet_for_older_clients(self, server, capsys):
+        from cmd_chat.client import AsyncChatClient
+        from cmd_chat.crypto import FERNET_VERSION
+
+        sock = server.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        serving = asyncio.create_task(server.serve(sock))
+        alice = AsyncChatClient("127.0.0.1", port, "alice", "testpassword")
+        old = AsyncChatClient("127.0.0.1", port, "old", "testpassword", suites=())
+
+        async def next_of(client, kind):
+            async for event in client.events():
+                if event.type == kind:
+                    return event
+
+        try:
+            await alice.connect()
+            await next_of(alice, "init")
+            assert alice.room_cipher.suite == "aes-256-gcm"
+
+            await old.connect()
+            await asyncio.wait_for(next_of(alice, "suite"), 2)
+            assert alice.room_cipher.suite == "fernet"
+            await alice.send("hi")
+            message = await asyncio.wait_for(next_of(old, "message"), 2)
+            assert base64.urlsafe_b64decode(message.data["text"])[0] == FERNET_VERSION
+            assert "room falls back to fernet" in capsys.readouterr().out
+
+            await old.close()
+            await asyncio.wait_for(next_of(alice, "suite"), 2)
+            assert alice.room_cipher.suite == "aes-256-gcm"
+        finally:
+            await alice.close()
+            await old.close()
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+            await server.stop()
+
+
 class TestStores:
     def test_message_store_add_and_get(self, message_store):
         from cmd_chat.server.models import Message
@@ -274,6 +336,25 @@ class TestStores:
 
         assert message_store.count() == 0
 
+    def test_message_store_sequences_and_since(self, message_store):
+        from cmd_chat.server.models import Message
+
+        for text in "abc":
+            message_store.add(Message(text=text))
+
+        assert [m.seq for m in message_store.get_all()] == [1, 2, 3]
+        assert [m.text for m in message_store.since(1)] == ["b", "c"]
+        assert message_store.since(3) == []
+        assert message_store.since(4) is None
+        assert message_store.get(2).text == "b"
+
+        message_store.clear()
+        message_store.add(Message(text="d"))
+
+        assert message_store.get(4).text == "d"
+        assert message_store.since(2) is None
+        assert [m.text for m in message_store.since(3)] == ["d"]
+
     def test_session_store_add_and_get(self, session_store):
         from cmd_chat.server.models import UserSession
 
@@ -302,6 +383,23 @@ class TestStores:
         assert session_store.username_exists("bob") is False
 
 
+    def test_session_store_username_index(self, session_store):
+        from cmd_chat.server.models import UserSession
+
+        session_store.add(UserSession(user_id="1", ip="127.0.0.1", username="alice"))
+        session_store.add(UserSession(user_id="2", ip="127.0.0.1", username="bob"))
+        session_store.get("2").last_activity = "2000-01-01T00:00:00+00:00"
+
+        assert session_store.user_id_for("alice") == "1"
+        assert not session_store.add(UserSession(user_id="3", ip="::1", username="alice"))
+        assert session_store.get("3") is None
+        assert session_store.add(session_store.get("1"))
+        assert session_store.cleanup_stale() == 1
+        assert not session_store.username_exists("bob")
+        session_store.remove("1")
+        assert session_store.user_id_for("alice") is None
+
+
 class TestConnectionManager:
     @pytest.mark.asyncio
     async def test_connect_disconnect(self, connection_manager):
@@ -403,10 +501,1456 @@ class TestSRPAuthManager:
             srp_manager.verify_auth("nonexistent", b"fake")
 
 
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHandshakeLimiter:
+    def test_token_bucket_refills(self):
+        from cmd_chat.server.limits import TokenBucket
+
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2.0, capacity=2, clock=clock)
+
+        assert bucket.consume() is True
+        assert bucket.consume() is True
+        assert bucket.consume() is False
+
+        clock.now = 0.5
+        assert bucket.consume() is True
+        assert bucket.consume() is False
+
+    def test_per_ip_burst_exhausted(self):
+        from cmd_chat.server.limits import HandshakeLimiter
+
+        limiter = HandshakeLimiter(
+            per_ip_rate=1.0, per_ip_burst=2, max_pending_per_ip=10, clock=FakeClock()
+        )
+
+        assert limiter.admit("10.0.0.1") is None
+        assert limiter.admit("10.0.0.1") is None
+        assert limiter.admit("10.0.0.1") == "Too many handshakes"
+        assert limiter.admit("10.0.0.2") is None
+        assert limiter.rejected == 1
+
+    def test_global_bucket_refunds_ip(self):
+        from cmd_chat.server.limits import HandshakeLimiter
+
+        limiter = HandshakeLimiter(global_rate=1.0, global_burst=1, clock=FakeClock())
+
+        assert limiter.admit("10.0.0.1") is None
+        assert limiter.admit("10.0.0.2") == "Server busy"
+        assert limiter._buckets["10.0.0.2"].tokens == limiter.per_ip_burst
+
+    def test_pending_cap_and_release(self):
+        from cmd_chat.server.limits import HandshakeLimiter
+
+        limiter = HandshakeLimiter(max_pending=1, clock=FakeClock())
+
+        assert limiter.admit("10.0.0.1") is None
+        assert limiter.admit("10.0.0.2") == "Server busy"
+
+        limiter.release("10.0.0.1")
+        assert limiter.pending == 0
+        assert limiter.admit("10.0.0.2") is None
+
+    @pytest.mark.asyncio
+    async def test_rejected_before_srp_work(self, server):
+        from cmd_chat.server.limits import HandshakeLimiter
+
+        server.handshake_limiter = HandshakeLimiter(per_ip_burst=0)
+
+        reader = asyncio.StreamReader()
+        writer_transport = MockTransport()
+        writer = MockStreamWriter(writer_transport)
+        reader.feed_data(b'{"cmd": "srp_init", "username": "u", "A": "AAAA"}\n')
+        reader.feed_eof()
+
+        await server._handle_client(reader, writer)
+
+        response = json.loads(writer_transport.data.decode().strip())
+        assert response["error"] == "Too many handshakes"
+        assert not server.srp_manager.sessions
+        assert server.handshake_limiter.pending == 0
+        assert writer_transport.closed
+
+    @pytest.mark.asyncio
+    async def test_pending_released_after_auth(self, server):
+        reader = asyncio.StreamReader()
+        writer_transport = MockTransport()
+        writer = MockStreamWriter(writer_transport)
+        reader.feed_eof()
+
+        await server._handle_client(reader, writer)
+
+        assert server.handshake_limiter.pending == 0
+        assert server.handshake_limiter.admitted == 1
+
+
+class TestConnectionLimits:
+    def test_limiter_per_ip(self):
+        from cmd_chat.server.limits import ConnectionLimiter
+
+        limiter = ConnectionLimiter(max_connections=10, max_per_ip=1)
+
+        assert limiter.acquire("10.0.0.1") is None
+        assert limiter.acquire("10.0.0.1") == "Too many connections"
+        assert limiter.acquire("10.0.0.2") is None
+        assert limiter.active == 2
+        assert limiter.rejected == 1
+
+    def test_limiter_saturation_time(self):
+        from cmd_chat.server.limits import ConnectionLimiter
+
+        clock = FakeClock()
+        limiter = ConnectionLimiter(max_connections=1, clock=clock)
+
+        assert limiter.acquire("10.0.0.1") is None
+        assert limiter.saturated
+        clock.now = 2.5
+        assert limiter.saturated_seconds() == 2.5
+
+        assert limiter.release("10.0.0.1") == 2.5
+        assert not limiter.saturated
+        clock.now = 10.0
+        assert limiter.saturated_seconds() == 2.5
+        assert limiter.saturations == 1
+
+    @pytest.mark.asyncio
+    async def test_accept_paused_when_saturated(self):
+        from cmd_chat.server.config import ServerConfig
+
+        server = ChatServer("testpassword", ServerConfig(max_connections=1))
+        sock = server.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        serve_task = asyncio.create_task(server.serve(sock))
+
+        try:
+            _, w1 = await asyncio.open_connection("127.0.0.1", port)
+            await asyncio.sleep(0.05)
+            assert server.connection_limiter.active == 1
+            assert not server._accepting.is_set()
+
+            r2, w2 = await asyncio.open_connection("127.0.0.1", port)
+            await asyncio.sleep(0.05)
+            assert server.connection_limiter.active == 1
+
+            w1.close()
+            await asyncio.sleep(0.1)
+            assert server.connection_limiter.active == 1
+            assert server.connection_limiter.saturations == 2
+            w2.close()
+        finally:
+            serve_task.cancel()
+            await asyncio.gather(serve_task, return_exceptions=True)
+            await server.stop()
+
+    @pytest.mark.asyncio
+    async def test_accept_survives_aborted_and_exhausted_accepts(self, capsys):
+        import errno
+        from cmd_chat.server.config import ServerConfig
+
+        server = ChatServer("testpassword", ServerConfig(accept_retry_delay=0.01))
+        sock = server.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        loop = asyncio.get_running_loop()
+        errors = [
+            ConnectionAbortedError(),
+            OSError(errno.EMFILE, "Too many open files"),
+        ]
+        real_accept = loop.sock_accept
+
+        async def flaky_accept(s):
+            if errors:
+                raise errors.pop(0)
+            return await real_accept(s)
+
+        loop.sock_accept = flaky_accept
+        serve_task = asyncio.create_task(server.serve(sock))
+        try:
+            _, w1 = await asyncio.open_connection("127.0.0.1", port)
+            for _ in range(50):
+                if server.connection_limiter.active:
+                    break
+                await asyncio.sleep(0.01)
+
+            assert server.connection_limiter.active == 1
+            assert not serve_task.done()
+            assert "Accept failed: Too many open files" in capsys.readouterr().out
+            w1.close()
+        finally:
+            del loop.sock_accept
+            serve_task.cancel()
+            await asyncio.gather(serve_task, return_exceptions=True)
+            await server.stop()
+
+    @pytest.mark.asyncio
+    async def test_per_ip_rejection_sends_error(self):
+        from cmd_chat.server.config import ServerConfig
+
+        server = ChatServer("testpassword", ServerConfig(max_connections_per_ip=1))
+        sock = server.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        serve_task = asyncio.create_task(server.serve(sock))
+
+        try:
+            _, w1 = await asyncio.open_connection("127.0.0.1", port)
+            await asyncio.sleep(0.05)
+            r2, w2 = await asyncio.open_connection("127.0.0.1", port)
+            line = await asyncio.wait_for(r2.readline(), 1)
+
+            assert json.loads(line)["error"] == "Too many connections"
+            w1.close()
+            w2.close()
+        finally:
+            serve_task.cancel()
+            await asyncio.gather(serve_task, return_exceptions=True)
+            await server.stop()
+
+
+class TestMetrics:
+    def test_registry_text_format(self):
+        from cmd_chat.server.metrics import Registry
+
+        registry = Registry()
+        counter = registry.counter("x_total", "An x")
+        registry.gauge("y", "A y", labeled=lambda: {(("user", 'a"b'),): 3})
+        hist = registry.histogram("z_seconds", "A z", buckets=(0.1, 1.0))
+        counter.inc(2)
+        hist.observe(0.05)
+        hist.observe(0.5)
+        hist.observe(5)
+
+        text = registry.render()
+
+        assert "# TYPE x_total counter\nx_total 2\n" in text
+        assert 'y{user="a\\"b"} 3' in text
+        assert 'z_seconds_bucket{le="0.1"} 1' in text
+        assert 'z_seconds_bucket{le="1.0"} 2' in text
+        assert 'z_seconds_bucket{le="+Inf"} 3' in text
+        assert "z_seconds_count 3" in text
+
+    @pytest.mark.asyncio
+    async def test_chat_updates_counters(self, server):
+        from cmd_chat.server.models import UserSession
+
+        session = UserSession(user_id="test-id", ip="127.0.0.1", username="testuser")
+        server.session_store.add(session)
+
+        reader = asyncio.StreamReader()
+        writer = MockStreamWriter(MockTransport())
+        reader.feed_data((json.dumps({"type": "message", "text": "x"}) + "\n").encode())
+        reader.feed_eof()
+
+        await server._handle_chat(reader, writer, session)
+
+        text = server.metrics.registry.render()
+        assert "chat_messages_received_total 1" in text
+        assert "chat_broadcasts_total 2" in text
+        assert "chat_sessions_authenticated 1" in text
+        assert "chat_history_messages 1" in text
+        assert server.metrics.broadcast_seconds.count == 2
+        assert server.metrics.bytes_in.value > 0
+
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self):
+        from cmd_chat.server.config import ServerConfig
+
+        server = ChatServer("testpassword", ServerConfig(metrics_port=0))
+        sock = server.listen("127.0.0.1", 0)
+        serve_task = asyncio.create_task(server.serve(sock))
+        await asyncio.sleep(0.05)
+        host, port = server._metrics_server._server.sockets[0].getsockname()[:2]
+
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n")
+            response = await asyncio.wait_for(reader.read(), 1)
+            writer.close()
+
+            assert response.startswith(b"HTTP/1.0 200 OK")
+            assert b"chat_connections_active 0" in response
+            assert b"chat_handshake_duration_seconds_count 0" in response
+        finally:
+            serve_task.cancel()
+            await asyncio.gather(serve_task, return_exceptions=True)
+
+
+class TestHooks:
+    def test_inactive_span_is_shared_noop(self):
+        from cmd_chat.server.hooks import Hooks, NULL_SPAN
+
+        hooks = Hooks()
+
+        assert hooks.span("x", a=1) is NULL_SPAN
+        assert hooks.tracing is False
+
+    def test_span_listener_and_removal(self):
+        from cmd_chat.server.hooks import Hooks
+
+        hooks = Hooks()
+        spans = []
+        remove = hooks.on_span(lambda name, duration, fields: spans.append((name, fields)))
+
+        with hooks.span("store.append", size=3):
+            pass
+        remove()
+        with hooks.span("ignored"):
+            pass
+
+        assert spans == [("store.append", {"size": 3})]
+        assert hooks.tracing is False
+
+    def test_tracer_context_manager_wraps_span(self):
+        from contextlib import contextmanager
+        from cmd_chat.server.hooks import Hooks
+
+        hooks = Hooks()
+        calls = []
+
+        @contextmanager
+        def tracer(name, fields):
+            calls.append(("enter", name))
+            try:
+                yield
+            finally:
+                calls.append(("exit", name))
+
+        hooks.add_tracer(tracer)
+        errors = []
+        hooks.on_span(lambda name, duration, fields: errors.append(fields.get("error")))
+
+        with pytest.raises(KeyError):
+            with hooks.span("boom"):
+                raise KeyError("x")
+
+        assert calls == [("enter", "boom"), ("exit", "boom")]
+        assert errors == ["KeyError"]
+
+    @pytest.mark.asyncio
+    async def test_server_emits_spans(self, server):
+        from cmd_chat.server.models import UserSession
+
+        names = []
+        server.hooks.on_span(lambda name, duration, fields: names.append(name))
+        server.connection_manager.active_connections["other"] = MockStreamWriter(
+            MockTransport()
+        )
+
+        srp.rfc5054_enable()
+        usr = srp.User(b"chat", b"testpassword", hash_alg=srp.SHA256)
+        _, A = usr.start_authentication()
+        reader = asyncio.StreamReader()
+        request = {"cmd": "srp_init", "username": "u", "A": base64.b64encode(A).decode()}
+        reader.feed_data((json.dumps(request) + "\n").encode())
+        reader.feed_eof()
+        await server._handle_auth(reader, MockStreamWriter(MockTransport()), "127.0.0.1")
+
+        session = UserSession(user_id="test-id", ip="127.0.0.1", username="testuser")
+        reader = asyncio.StreamReader()
+        reader.feed_data((json.dumps({"type": "message", "text": "x"}) + "\n").encode())
+        reader.feed_eof()
+        await server._handle_chat(reader, MockStreamWriter(MockTransport()), session)
+
+        for expected in (
+            "json.decode",
+            "srp.challenge",
+            "store.append",
+            "broadcast.fanout",
+            "broadcast.drain",
+        ):
+            assert expected in names
+
+    def test_emit_reaches_event_listeners(self):
+        from cmd_chat.server.hooks import Hooks
+
+        hooks = Hooks()
+        events = []
+        hooks.on("session.end", lambda event, fields: events.append((event, fields)))
+
+        hooks.emit("session.start", user_id="a")
+        hooks.emit("session.end", user_id="a")
+
+        assert events == [("session.end", {"user_id": "a"})]
+        assert hooks.tracing is False
+
+
+class TestLoopMonitor:
+    def test_records_lag_and_percentiles(self):
+        from cmd_chat.server.hooks import Hooks
+        from cmd_chat.server.lag import LoopMonitor
+
+        monitor = LoopMonitor(Hooks(), interval=0.1, threshold=0.05, clock=FakeClock())
+        for lag in [0.001] * 98 + [-0.002, 0.2]:
+            monitor.record(lag)
+
+        stats = monitor.stats()
+        assert stats["samples"] == 100
+        assert stats["lag"]["p50"] == 0.001
+        assert stats["max"] == 0.2
+        assert stats["stalls"] == 1
+        assert min(monitor.lags) == 0.0
+
+    def test_stall_blames_slow_span(self, capsys):
+        from cmd_chat.server.hooks import Hooks
+        from cmd_chat.server.lag import LoopMonitor
+
+        clock = FakeClock()
+        hooks = Hooks()
+        monitor = LoopMonitor(hooks, interval=0.1, threshold=0.05, clock=clock)
+        hooks.on_span(monitor._on_span, detail=False)
+        clock.now = 100.0
+        monitor._on_span("handshake", 30.0, {"ip": "1.2.3.4"})
+        monitor._on_span("srp.verify", 0.3, {})
+        monitor._on_span("json.decode", 0.001, {})
+        clock.now = 100.01
+
+        monitor.record(0.31)
+
+        offender = monitor.offenders[-1]
+        assert offender["span"] == "srp.verify"
+        assert "stalled 310ms in srp.verify" in capsys.readouterr().out
+
+    def test_stall_skips_spans_that_await(self, capsys):
+        from cmd_chat.server.hooks import Hooks
+        from cmd_chat.server.lag import LoopMonitor
+
+        clock = FakeClock()
+        monitor = LoopMonitor(Hooks(), interval=0.1, threshold=0.05, clock=clock)
+        clock.now = 100.0
+        monitor._on_span("srp.verify", 0.1, {})
+        monitor._on_span("handshake", 0.13, {"ip": "1.2.3.4"})
+        monitor.record(0.12)
+
+        assert monitor.offenders[-1]["span"] == "srp.verify"
+        assert "in srp.verify (100ms)" in capsys.readouterr().out
+
+        clock.now = 200.0
+        monitor._on_span("broadcast.fanout", 0.2, {"recipients": 3})
+        monitor.record(0.1)
+
+        assert monitor.offenders[-1]["span"] is None
+
+    def test_coarse_listener_skips_detail_spans(self):
+        from cmd_chat.server.hooks import Hooks
+
+        hooks = Hooks()
+        remove = hooks.on_span(lambda *a: None, detail=False)
+        assert hooks.tracing and not hooks.detail
+        hooks.on_span(lambda *a: None)
+        assert hooks.detail
+        remove()
+        assert hooks.detail
+
+    @pytest.mark.asyncio
+    async def test_detects_blocking_call(self, server, capsys):
+        import time
+        from cmd_chat.server.lag import LoopMonitor
+
+        monitor = LoopMonitor(server.hooks, interval=0.01, threshold=0.05)
+        monitor.start()
+        await asyncio.sleep(0.03)
+        with server.hooks.span("init.snapshot", messages=5):
+            time.sleep(0.15)
+        await asyncio.sleep(0.03)
+        await monitor.stop()
+
+        assert monitor.stalls >= 1
+        assert monitor.offenders[0]["span"] == "init.snapshot"
+        assert server.hooks.tracing is False
+        assert "chat_event_loop_lag_seconds{quantile=" in server.metrics.registry.render()
+
+
+class TestConnectionStats:
+    @pytest.mark.asyncio
+    async def test_tracks_traffic_per_connection(self, server):
+        from cmd_chat.server.models import UserSession
+
+        session = UserSession(user_id="test-id", ip="127.0.0.1", username="testuser")
+        server.session_store.add(session)
+        other = MockStreamWriter(MockTransport())
+        await server.connection_manager.connect("other", other)
+
+        reader = asyncio.StreamReader()
+        line = (json.dumps({"type": "message", "text": "hello"}) + "\n").encode()
+        reader.feed_data(line * 2)
+        reader.feed_eof()
+        await server._handle_chat(reader, MockStreamWriter(MockTransport()), session)
+
+        sender = server.connection_manager.connection_info("test-id")
+        receiver = server.connection_manager.connection_info("other")
+        assert sender["frames_in"] == 2
+        assert sender["bytes_in"] == 2 * len(line)
+        assert sender["frames_out"] == 3
+        assert receiver["frames_out"] == 3
+        assert receiver["bytes_out"] == len(other.transport.data)
+        assert receiver["age"] >= 0
+        assert receiver["last_drain"] >= 0
+
+    @pytest.mark.asyncio
+    async def test_disconnect_drops_stats(self, server):
+        await server.connection_manager.connect("a", MockStreamWriter(MockTransport()))
+        await server.connection_manager.disconnect("a")
+
+        assert server.connection_manager.stats == {}
+        assert server.connection_manager.connection_info("a") is None
+
+    @pytest.mark.asyncio
+    async def test_admin_top_and_conn(self, server):
+        from cmd_chat.server.models import UserSession
+
+        manager = server.connection_manager
+        for uid, name, sent, buffered in (("a", "alice", 10, 0), ("b", "bob", 500, 9000)):
+            server.session_store.add(UserSession(user_id=uid, ip="1.1.1.1", username=name))
+            transport = MockTransport()
+            transport.buffer_size = buffered
+            await manager.connect(uid, MockStreamWriter(transport))
+            manager.record_in(uid, sent)
+
+        senders = await server.admin.execute("top senders 1")
+        receivers = await server.admin.execute("top receivers")
+        alice = await server.admin.execute("conn alice")
+
+        assert senders["ok"] and [r["username"] for r in senders["senders"]] == ["bob"]
+        assert [r["username"] for r in receivers["receivers"]] == ["bob", "alice"]
+        assert alice["connection"]["bytes_in"] == 10
+        assert (await server.admin.execute("conn nobody"))["error"] == "No such user: nobody"
+        assert "error" in await server.admin.execute("top nonsense")
+        assert "error" in await server.admin.execute("bogus")
+        assert (await server.admin.execute("stats"))["sessions"] == 2
+
+
+def _busy_work():
+    return sum(i * i for i in range(2000))
+
+
+class TestProfiling:
+    @pytest.mark.asyncio
+    async def test_profile_reports_hot_functions(self, server):
+        async def busy():
+            while 1:
+                _busy_work()
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(busy())
+        try:
+            result = await server.admin.execute("profile 0.05 50 cumtime")
+        finally:
+            task.cancel()
+
+        assert result["ok"]
+        assert any("_busy_work" in f["function"] for f in result["functions"])
+        assert server.admin.profiler.running is False
+
+    @pytest.mark.asyncio
+    async def test_profile_rejects_overlap_and_bad_window(self, server):
+        first = asyncio.create_task(server.admin.execute("profile 0.05"))
+        await asyncio.sleep(0)
+
+        overlap = await server.admin.execute("profile 0.05")
+        assert (await first)["ok"]
+
+        assert overlap["error"] == "A profile is already running"
+        assert "error" in await server.admin.execute("profile 0")
+        assert "error" in await server.admin.execute("profile 1 5 bogus")
+
+    @pytest.mark.asyncio
+    async def test_memory_diff_shows_growth(self, server):
+        assert "error" in await server.admin.execute("memory diff")
+        try:
+            started = await server.admin.execute("memory start")
+            assert started["tracing"] is True
+            held = [bytearray(1024) for _ in range(200)]
+            diff = await server.admin.execute("memory diff 5")
+            top = await server.admin.execute("memory top 3")
+        finally:
+            stopped = await server.admin.execute("memory stop")
+
+        assert diff["diff"][0]["size_diff"] >= 200 * 1024
+        assert __file__ in diff["diff"][0]["where"]
+        assert len(top["top"]) == 3
+        assert stopped["tracing"] is False
+        assert held
+
+
+class TestAdminSocket:
+    @pytest.mark.asyncio
+    async def test_commands_over_unix_socket(self, server, tmp_path):
+        import os
+        import stat
+        from cmd_chat.server.admin import AdminServer, admin_request
+        from cmd_chat.server.models import UserSession
+
+        path = str(tmp_path / "admin.sock")
+        admin = AdminServer(server.admin)
+        await admin.start(path)
+        try:
+            server.session_store.add(UserSession(user_id="a", ip="1.1.1.1", username="alice"))
+            stats = await admin_request(path, "stats")
+            sessions = await admin_request(path, "sessions")
+            unknown = await admin_request(path, "nope")
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        finally:
+            await admin.stop()
+
+        assert stats["ok"] and stats["sessions"] == 1
+        assert sessions["sessions"][0]["username"] == "alice"
+        assert unknown["error"] == "Unknown command: nope"
+        assert not os.path.exists(path)
+
+    @pytest.mark.asyncio
+    async def test_refuses_live_socket_and_replaces_stale(self, server, tmp_path):
+        import socket
+        from cmd_chat.server.admin import AdminServer
+
+        path = str(tmp_path / "admin.sock")
+        stale = socket.socket(socket.AF_UNIX)
+        stale.bind(path)
+        stale.close()
+
+        first = AdminServer(server.admin)
+        await first.start(path)
+        try:
+            with pytest.raises(OSError, match="in use"):
+                await AdminServer(server.admin).start(path)
+        finally:
+            await first.stop()
+
+    @pytest.mark.asyncio
+    async def test_kick_and_clear(self, server):
+        from cmd_chat.server.models import Message, UserSession
+
+        transport = MockTransport()
+        server.session_store.add(UserSession(user_id="a", ip="1.1.1.1", username="alice"))
+        await server.connection_manager.connect("a", MockStreamWriter(transport))
+        server.message_store.add(Message(text="x"))
+
+        kicked = await server.admin.execute("kick alice spamming")
+        cleared = await server.admin.execute("clear")
+
+        assert kicked == {"ok": True, "kicked": "a"}
+        assert transport.closed
+        frame = json.loads(transport.data.decode().splitlines()[0])
+        assert frame == {"type": "kicked", "reason": "spamming"}
+        assert cleared["cleared"] == 1
+        assert server.message_store.count() == 0
+        assert "error" in await server.admin.execute("kick nobody")
+
+    @pytest.mark.asyncio
+    async def test_drain_stops_accepting_and_closes_stragglers(self, server):
+        sock = server.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        serving = asyncio.create_task(server.serve(sock))
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await asyncio.sleep(0.05)
+
+        result = await server.admin.execute("drain 0.2")
+        await asyncio.sleep(0.05)
+        assert result["draining"] and result["connections"] == 1
+        assert not serving.done()
+        with pytest.raises(OSError):
+            await asyncio.open_connection("127.0.0.1", port)
+
+        await asyncio.wait_for(serving, 2)
+        assert await reader.read() == b""
+        writer.close()
+
+
+class TestShutdown:
+    @pytest.mark.asyncio
+    async def test_clients_get_shutdown_frame_then_eof(self, server):
+        from cmd_chat.client import AsyncChatClient
+
+        sock = server.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        serving = asyncio.create_task(server.serve(sock))
+        clients = [
+            AsyncChatClient("127.0.0.1", port, name, "testpassword")
+            for name in ("alice", "bob")
+        ]
+        try:
+            for client in clients:
+                await client.connect()
+            await asyncio.sleep(0.05)
+
+            await server.shutdown(timeout=1)
+            await asyncio.wait_for(serving, 2)
+
+            for client in clients:
+                types = [event.type async for event in client.events()]
+                assert types[-1] == "server_shutdown"
+                assert client.connected is False
+        finally:
+            for client in clients:
+                await client.close()
+            serving.cancel()
+
+        assert server.connection_manager.active_connections == {}
+        assert server.draining
+
+    @pytest.mark.asyncio
+    async def test_close_all_aborts_writers_past_deadline(self):
+        from cmd_chat.server.managers import ConnectionManager
+
+        class StuckTransport(MockTransport):
+            aborted = False
+
+            def abort(self):
+                self.aborted = True
+
+        class StuckWriter(MockStreamWriter):
+            async def wait_closed(self):
+                await asyncio.sleep(10)
+
+        manager = ConnectionManager()
+        fast, stuck = MockTransport(), StuckTransport()
+        await manager.connect("fast", MockStreamWriter(fast))
+        await manager.connect("stuck", StuckWriter(stuck))
+
+        aborted = await manager.close_all('{"type": "server_shutdown"}', timeout=0.05)
+
+        assert aborted == 1
+        assert stuck.aborted and fast.closed
+        assert b"server_shutdown" in fast.data
+        assert manager.active_connections == {}
+
+    @pytest.mark.asyncio
+    async def test_kick_aborts_writer_that_never_drains(self):
+        from cmd_chat.server.managers import ConnectionManager
+
+        class StuckTransport(MockTransport):
+            aborted = False
+
+            def abort(self):
+                self.aborted = True
+
+        class StuckWriter(MockStreamWriter):
+            async def drain(self):
+                await asyncio.sleep(10)
+
+            async def wait_closed(self):
+                await asyncio.sleep(10)
+
+        manager = ConnectionManager()
+        stuck, other = StuckTransport(), MockTransport()
+        await manager.connect("stuck", StuckWriter(stuck))
+        await manager.connect("other", MockStreamWriter(other))
+        stalled = asyncio.create_task(manager.broadcast('{"type": "message"}'))
+        await asyncio.sleep(0)
+
+        try:
+            assert await asyncio.wait_for(manager.kick("stuck", "bye", timeout=0.05), 1)
+            assert stuck.aborted and stuck.closed
+            assert b'"kicked"' in stuck.data
+            assert list(manager.active_connections) == ["other"]
+            assert not await manager.kick("stuck", "again")
+        finally:
+            stalled.cancel()
+            await asyncio.gather(stalled, return_exceptions=True)
+
+    @pytest.mark.asyncio
+    async def test_second_request_forces(self, server, capsys):
+        async def hang():
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(hang())
+        server._client_tasks.add(task)
+
+        server.request_shutdown()
+        server.request_shutdown()
+        await asyncio.gather(task, server._shutdown_task, return_exceptions=True)
+
+        assert task.cancelled()
+        assert "Forcing shutdown" in capsys.readouterr().out
+
+
+class TestHandoff:
+    @pytest.mark.asyncio
+    async def test_new_server_takes_socket_and_history(self, tmp_path, monkeypatch):
+        from cmd_chat.client import AsyncChatClient
+        from cmd_chat.server import handoff
+        from cmd_chat.server.config import ServerConfig
+        from cmd_chat.server.handoff import receive_handoff
+        from cmd_chat.server.models import Message
+
+        path = str(tmp_path / "handoff.sock")
+        old = ChatServer("testpassword", ServerConfig(handoff_socket=path))
+        monkeypatch.setattr(handoff, "CHUNK_MESSAGES", 64)
+        for i in range(10):
+            old.message_store.add(Message(text="cleared"))
+        old.message_store.clear()
+        for i in range(250):
+            old.message_store.add(Message(text=f"ciphertext-{i}", username="alice"))
+        sock = old.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        old_serving = asyncio.create_task(old.serve(sock))
+        await asyncio.sleep(0.05)
+
+        listener, state = await asyncio.to_thread(receive_handoff, path, 5)
+        new = ChatServer("")
+        new.restore(state)
+        await asyncio.wait_for(old_serving, 2)
+        new_serving = asyncio.create_task(new.serve(listener))
+
+        try:
+            assert listener.getsockname()[1] == port
+            assert new.room_salt == old.room_salt
+            assert (new.srp_manager.salt, new.srp_manager.vkey) == (
+                old.srp_manager.salt,
+                old.srp_manager.vkey,
+            )
+            assert [(m.id, m.seq) for m in new.message_store.get_all()] == [
+                (m.id, m.seq) for m in old.message_store.get_all()
+            ]
+            assert new.message_store.last_seq == old.message_store.last_seq == 260
+            assert new.epochs[old.epoch] == 260
+
+            async with AsyncChatClient("127.0.0.1", port, "bob", "testpassword") as bob:
+                init = await anext(bob.events())
+                assert init.type == "init"
+                assert len(bob.messages) == 250
+                assert bob.room_salt == old.room_salt
+        finally:
+            new_serving.cancel()
+            await asyncio.gather(new_serving, return_exceptions=True)
+
+        assert old.draining
+
+    @pytest.mark.asyncio
+    async def test_terminal_client_rejoins_after_handoff(self, tmp_path, monkeypatch):
+        from unittest.mock import patch
+        from cmd_chat.client import client as terminal
+        from cmd_chat.server.config import ServerConfig
+        from cmd_chat.server.handoff import receive_handoff
+
+        monkeypatch.setattr(terminal, "RECONNECT_DELAY", 0.01)
+        path = str(tmp_path / "handoff.sock")
+        old = ChatServer("testpassword", ServerConfig(handoff_socket=path))
+        sock = old.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        old_serving = asyncio.create_task(old.serve(sock))
+        alice = terminal.Client("127.0.0.1", port, "alice", "testpassword")
+        new = ChatServer("")
+        new_serving = receiving = None
+
+        async def until(check):
+            while not check():
+                await asyncio.sleep(0.01)
+
+        with patch.object(alice, "render_messages"):
+            try:
+                await alice.connect()
+                alice.running = True
+                receiving = asyncio.create_task(alice.receive_loop())
+                await alice.send("before")
+                await asyncio.wait_for(until(lambda: alice.last_seq == 1), 2)
+
+                listener, state = await asyncio.to_thread(receive_handoff, path, 5)
+                new.restore(state)
+                new_serving = asyncio.create_task(new.serve(listener))
+                await asyncio.wait_for(until(lambda: alice.epoch == new.epoch), 5)
+                await alice.send("after")
+                await asyncio.wait_for(until(lambda: alice.last_seq == 2), 2)
+
+                assert not receiving.done()
+                assert [alice.message_text(m) for m in alice.messages] == [
+                    "before",
+                    "after",
+                ]
+            finally:
+                alice.running = False
+                await alice.close()
+                for task in (receiving, old_serving, new_serving):
+                    if task:
+                        task.cancel()
+                        await asyncio.gather(task, return_exceptions=True)
+
+    @pytest.mark.asyncio
+    async def test_failed_takeover_keeps_old_server(self, tmp_path):
+        import socket
+        from cmd_chat.server.config import ServerConfig
+
+        path = str(tmp_path / "handoff.sock")
+        old = ChatServer("testpassword", ServerConfig(handoff_socket=path))
+        sock = old.listen("127.0.0.1", 0)
+        serving = asyncio.create_task(old.serve(sock))
+        await asyncio.sleep(0.05)
+
+        def abandon():
+            with socket.socket(socket.AF_UNIX) as conn:
+                conn.connect(path)
+                socket.recv_fds(conn, 1, 1)[1] and conn.recv(4096)
+
+        await asyncio.to_thread(abandon)
+        await asyncio.sleep(0.05)
+
+        try:
+            assert not old.draining
+            assert not old.read_only
+            assert not serving.done()
+        finally:
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+
+    @pytest.mark.asyncio
+    async def test_room_is_read_only_while_handing_off(self, tmp_path):
+        import socket
+        import threading
+        from cmd_chat.client import AsyncChatClient
+        from cmd_chat.server.config import ServerConfig
+        from cmd_chat.server.models import Message
+
+        path = str(tmp_path / "handoff.sock")
+        old = ChatServer("testpassword", ServerConfig(handoff_socket=path))
+        old.message_store.add(Message(text="before"))
+        sock = old.listen("127.0.0.1", 0)
+        serving = asyncio.create_task(old.serve(sock))
+        await asyncio.sleep(0.05)
+        port = sock.getsockname()[1]
+        alice = AsyncChatClient("127.0.0.1", port, "alice", "testpassword")
+        release = threading.Event()
+
+        def take_over():
+            with socket.socket(socket.AF_UNIX) as conn:
+                conn.connect(path)
+                socket.socket(fileno=socket.recv_fds(conn, 1, 1)[1][0]).close()
+                stream = conn.makefile("rb")
+                header = json.loads(stream.readline())
+                lines = [stream.readline() for _ in range(header["messages"])]
+                release.wait(5)
+                conn.sendall(b"OK\n")
+                return lines, stream.readline()
+
+        try:
+            await alice.connect()
+            events = alice.events()
+            assert (await anext(events)).type == "init"
+            taking = asyncio.create_task(asyncio.to_thread(take_over))
+            while not old.read_only:
+                await asyncio.sleep(0.01)
+
+            await alice.send("during")
+            await alice.clear()
+            refused = [
+                (await asyncio.wait_for(anext(events), 2)).type for _ in range(2)
+            ]
+
+            assert refused == ["not_sent", "not_sent"]
+            assert [m.text for m in old.message_store.get_all()] == ["before"]
+            release.set()
+            lines, done = await taking
+            assert len(lines) == 1 and done == b"DONE\n"
+        finally:
+            release.set()
+            await alice.close()
+            await asyncio.wait_for(serving, 2)
+
+
+class TestTransfers:
+    def test_offer_and_chunk_validation(self):
+        from cmd_chat.server.transfers import TransferError, TransferManager
+
+        manager = TransferManager(max_chunk=10, max_size=100, max_per_user=1)
+        manager.offer("a", {"file_id": "f", "size": 20, "chunks": 2})
+
+        with pytest.raises(TransferError, match="Too many transfers"):
+            manager.offer("a", {"file_id": "g", "size": 1, "chunks": 1})
+        with pytest.raises(TransferError, match="too large"):
+            manager.offer("b", {"file_id": "h", "size": 101, "chunks": 1})
+        with pytest.raises(TransferError, match="out of order"):
+            manager.chunk("a", {"file_id": "f", "seq": 1, "data": "x"})
+        with pytest.raises(TransferError, match="Chunk too large"):
+            manager.chunk("a", {"file_id": "f", "seq": 0, "data": "x" * 11})
+        with pytest.raises(TransferError, match="Unknown transfer"):
+            manager.chunk("b", {"file_id": "f", "seq": 0, "data": "x"})
+        manager.chunk("a", {"file_id": "f", "seq": 0, "data": "x"})
+        with pytest.raises(TransferError, match="incomplete"):
+            manager.end("a", "f")
+        manager.chunk("a", {"file_id": "f", "seq": 1, "data": "x"})
+
+        assert manager.end("a", "f").bytes == 2
+        assert manager.transfers == {}
+
+    @pytest.mark.asyncio
+    async def test_relay_acks_and_cancels_on_error(self, server):
+        from cmd_chat.server.models import UserSession
+
+        session = UserSession(user_id="a", ip="1.1.1.1", username="alice")
+        sender, receiver = MockTransport(), MockTransport()
+        await server.connection_manager.connect("a", MockStreamWriter(sender))
+        await server.connection_manager.connect("b", MockStreamWriter(receiver))
+
+        await server._handle_file(
+            session, "file_offer", {"file_id": "f", "name": "n", "size": 5, "chunks": 1}
+        )
+        await server._handle_file(
+            session, "file_chunk", {"file_id": "f", "seq": 0, "data": "abc"}
+        )
+        await server._handle_file(
+            session, "file_chunk", {"file_id": "f", "seq": 1, "data": "abc"}
+        )
+
+        relayed = [json.loads(l) for l in receiver.data.decode().splitlines()]
+        replies = [json.loads(l) for l in sender.data.decode().splitlines()]
+        assert [f["type"] for f in relayed] == ["file_offer", "file_chunk", "file_cancel"]
+        assert relayed[0]["username"] == "alice"
+        assert [f["type"] for f in replies] == ["file_ack", "file_error"]
+        assert server.transfers.transfers == {}
+
+
+class TestPresence:
+    def test_coalesces_and_caps_updates(self):
+        from cmd_chat.server.presence import Presence
+
+        presence = Presence(max_batch=100, clock=FakeClock())
+        for _ in range(50):
+            presence.set_typing("a")
+        for i in range(250):
+            presence.set_typing(f"u{i}")
+        presence.set_status("a", "away")
+        presence.set_status("a", "bogus")
+
+        frames = [presence.flush() for _ in range(4)]
+
+        assert [len(f["changes"]) for f in frames[:3]] == [100, 100, 51]
+        assert frames[3] is None
+        assert frames[0]["changes"][0] == {"user_id": "a", "typing": True, "status": "away"}
+        assert presence.updates == 301
+        assert presence.frames == 3
+
+    def test_typing_expires_and_remove_forgets(self):
+        from cmd_chat.server.presence import Presence
+
+        clock = FakeClock()
+        presence = Presence(typing_ttl=5, clock=clock)
+        presence.set_typing("a")
+        presence.set_typing("b")
+        presence.flush()
+        clock.now = 4
+        presence.set_typing("a")
+        clock.now = 6
+
+        frame = presence.flush()
+        presence.remove("a")
+
+        assert frame["changes"] == [{"user_id": "b", "typing": False}]
+        assert presence.state("a") == {"status": "active", "typing": False}
+        assert presence.flush() is None
+
+    @pytest.mark.asyncio
+    async def test_clients_see_typing_and_away(self):
+        from cmd_chat.client import AsyncChatClient
+        from cmd_chat.server.config import ServerConfig
+
+        server = ChatServer("testpassword", ServerConfig(presence_interval=0.02))
+        sock = server.listen("127.0.0.1", 0)
+        serving = asyncio.create_task(server.serve(sock))
+        port = sock.getsockname()[1]
+
+        async def until(client, check):
+            async for _ in client.events():
+                if check():
+                    return
+
+        try:
+            async with AsyncChatClient("127.0.0.1", port, "alice", "testpassword") as alice:
+                async with AsyncChatClient("127.0.0.1", port, "bob", "testpassword") as bob:
+                    await until(bob, lambda: bob.connected)
+                    for _ in range(20):
+                        await alice.set_typing()
+                    await alice.set_status("away")
+                    await asyncio.wait_for(until(bob, lambda: bob.typing_users()), 1)
+
+                    alice_entry = next(u for u in bob.users if u["username"] == "alice")
+                    assert alice_entry["status"] == "away"
+                    assert bob.typing_users() == ["alice"]
+
+                    await alice.send("done")
+                    await asyncio.wait_for(until(bob, lambda: not bob.typing), 1)
+        finally:
+            await server.stop()
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+
+        assert server.presence.frames <= 3
+
+
+class TestInboundLimits:
+    def test_bucket_wait_reports_time_to_refill(self):
+        from cmd_chat.server.limits import InboundLimiter
+
+        clock = FakeClock()
+        limiter = InboundLimiter(2.0, 1, 100.0, 100, clock=clock)
+
+        assert limiter.message_wait() == 0
+        assert limiter.message_wait() == pytest.approx(0.5)
+        assert limiter.bytes_wait(1000) == 0
+        assert limiter.bytes_wait(50) == pytest.approx(0.5)
+        clock.now = 0.5
+        assert limiter.message_wait() == 0
+        assert InboundLimiter(0, 0, 0, 0).bytes_wait(10**9) == 0
+
+    async def _flood(self, server, count):
+        from cmd_chat.server.models import UserSession
+
+        session = UserSession(user_id="test-id", ip="127.0.0.1", username="testuser")
+        server.session_store.add(session)
+        transport = MockTransport()
+        reader = asyncio.StreamReader()
+        line = (json.dumps({"type": "message", "text": "x"}) + "\n").encode()
+        reader.feed_data(line * count)
+        reader.feed_eof()
+        await server._handle_chat(reader, MockStreamWriter(transport), session)
+        return [json.loads(l) for l in transport.data.decode().splitlines()]
+
+    @pytest.mark.asyncio
+    async def test_drop_policy(self):
+        from cmd_chat.server.config import ServerConfig
+
+        server = ChatServer(
+            "pw", ServerConfig(message_rate=0.001, message_burst=2, inbound_policy="drop")
+        )
+
+        frames = await self._flood(server, 6)
+
+        assert server.message_store.count() == 2
+        assert [f["type"] for f in frames].count("rate_limited") == 1
+        assert server.metrics.rate_limited.value == 4
+
+    @pytest.mark.asyncio
+    async def test_disconnect_policy(self):
+        from cmd_chat.server.config import ServerConfig
+
+        server = ChatServer(
+            "pw",
+            ServerConfig(message_rate=0.001, message_burst=1, inbound_policy="disconnect"),
+        )
+
+        with pytest.raises(ConnectionAbortedError):
+            await self._flood(server, 3)
+        assert server.message_store.count() == 1
+
+    @pytest.mark.asyncio
+    async def test_delay_policy_keeps_everything(self):
+        import time
+        from cmd_chat.server.config import ServerConfig
+
+        server = ChatServer("pw", ServerConfig(message_rate=100, message_burst=2))
+
+        started = time.monotonic()
+        await self._flood(server, 6)
+
+        assert server.message_store.count() == 6
+        assert time.monotonic() - started >= 0.03
+
+    @pytest.mark.asyncio
+    async def test_byte_limit_counts_all_frames(self):
+        from cmd_chat.server.config import ServerConfig
+
+        server = ChatServer(
+            "pw", ServerConfig(byte_rate=0.001, byte_burst=100, inbound_policy="drop")
+        )
+
+        await self._flood(server, 5)
+
+        assert server.message_store.count() == 100 // 33
+
+
+class TestHeartbeat:
+    @pytest.mark.asyncio
+    async def test_ping_silent_and_abort(self):
+        from cmd_chat.server.managers import ConnectionManager
+
+        class AbortableTransport(MockTransport):
+            aborted = False
+
+            def abort(self):
+                self.aborted = True
+
+        manager = ConnectionManager()
+        live, dead = MockTransport(), AbortableTransport()
+        await manager.connect("live", MockStreamWriter(live))
+        await manager.connect("dead", MockStreamWriter(dead))
+        manager.stats["dead"].last_seen -= 60
+        manager.stats["dead"].heartbeat = True
+
+        assert manager.ping() == 2
+        assert json.loads(live.data)["type"] == "ping"
+        assert manager.connection_info("live")["frames_out"] == 1
+        assert manager.silent(30) == ["dead"]
+        manager.stats["live"].last_seen -= 60
+        assert manager.silent(30) == ["dead"]
+        assert manager.abort("dead") and dead.aborted
+        assert not manager.abort("dead")
+        assert list(manager.active_connections) == ["live"]
+
+    @pytest.mark.asyncio
+    async def test_silent_peer_dropped_and_rtt_measured(self):
+        from cmd_chat.client import AsyncChatClient
+        from cmd_chat.server.config import ServerConfig
+
+        server = ChatServer(
+            "testpassword", ServerConfig(heartbeat_interval=0.05, heartbeat_misses=2)
+        )
+        sock = server.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        serving = asyncio.create_task(server.serve(sock))
+        silent = AsyncChatClient("127.0.0.1", port, "silent", "testpassword")
+        legacy = AsyncChatClient(
+            "127.0.0.1", port, "legacy", "testpassword", heartbeat_interval=0
+        )
+        alive = AsyncChatClient(
+            "127.0.0.1", port, "alive", "testpassword", heartbeat_interval=0.05
+        )
+        try:
+            await silent.connect()
+            await legacy.connect()
+            await alive.connect()
+
+            async def until_left():
+                async for event in alive.events():
+                    if event.type == "user_left" and event.data["user_id"] == silent.user_id:
+                        return
+
+            await asyncio.wait_for(until_left(), 2)
+
+            assert set(server.connection_manager.active_connections) == {
+                legacy.user_id,
+                alive.user_id,
+            }
+            assert server.metrics.dead_peers.value == 1
+            assert server.connection_manager.stats[alive.user_id].rtt is not None
+        finally:
+            await silent.close()
+            await legacy.close()
+            await alive.close()
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+            await server.stop()
+
+    @pytest.mark.asyncio
+    async def test_client_gives_up_on_silent_server(self):
+        from cmd_chat.client import AsyncChatClient
+
+        client = AsyncChatClient("x", 0, "u", heartbeat_interval=0.01, heartbeat_misses=2)
+        client.reader = asyncio.StreamReader()
+        client.writer = MockStreamWriter(MockTransport())
+        client.reader.feed_data(b'{"type": "init", "heartbeat": true}\n')
+
+        with pytest.raises(ConnectionError, match="stopped responding"):
+            async for _ in client.events():
+                pass
+        sent = client.writer.transport.data.splitlines()
+        assert [json.loads(line)["type"] for line in sent] == ["ping"]
+
+    @pytest.mark.asyncio
+    async def test_client_keeps_server_that_ignores_pings(self):
+        from cmd_chat.client import AsyncChatClient
+
+        client = AsyncChatClient("x", 0, "u", heartbeat_interval=0.01, heartbeat_misses=2)
+        client.reader = asyncio.StreamReader()
+        client.writer = MockStreamWriter(MockTransport())
+        client.reader.feed_data(b'{"type": "init", "messages": []}\n')
+
+        async def consume():
+            async for _ in client.events():
+                pass
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(consume(), 0.1)
+        sent = client.writer.transport.data.splitlines()
+        assert len(sent) > client.heartbeat_misses
+        assert not client.server_heartbeat
+
+    @pytest.mark.asyncio
+    async def test_client_answers_ping_and_measures_pong(self):
+        import time
+        from cmd_chat.client import AsyncChatClient
+
+        client = AsyncChatClient("x", 0, "u")
+        client.reader = asyncio.StreamReader()
+        client.writer = MockStreamWriter(MockTransport())
+        client.reader.feed_data(b'{"type": "ping", "ts": 7}\n')
+        sent = time.monotonic() - 0.25
+        client.reader.feed_data((json.dumps({"type": "pong", "ts": sent}) + "\n").encode())
+        client.reader.feed_eof()
+
+        types = [event.type async for event in client.events()]
+
+        assert types == ["ping", "pong"]
+        assert json.loads(client.writer.transport.data) == {"type": "pong", "ts": 7}
+        assert client.rtt >= 0.25
+
+
+class TestDeliveryAcks:
+    async def _chat(self, server, lines, since=None):
+        from cmd_chat.server.models import UserSession
+
+        session = UserSession(user_id="u1", ip="127.0.0.1", username="alice", since=since)
+        server.session_store.add(session)
+        transport = MockTransport()
+        reader = asyncio.StreamReader()
+        for line in lines:
+            reader.feed_data((json.dumps(line) + "\n").encode())
+        reader.feed_eof()
+        await server._handle_chat(reader, MockStreamWriter(transport), session)
+        return [json.loads(l) for l in transport.data.decode().splitlines()]
+
+    @pytest.mark.asyncio
+    async def test_ack_moves_cursor_and_records_lag(self, server):
+        frames = await self._chat(
+            server,
+            [
+                {"type": "message", "text": "one"},
+                {"type": "message", "text": "two"},
+                {"type": "ack", "seq": 2, "held": 0.0},
+                {"type": "ack", "seq": 1},
+                {"type": "ack", "seq": 99},
+            ],
+        )
+
+        assert [f["data"]["seq"] for f in frames if f["type"] == "message"] == [1, 2]
+        assert frames[0]["seq"] == 0
+        assert server.metrics.delivery_lag.count == 1
+        assert server.metrics.delivery_lag.sum < 1
+
+    @pytest.mark.asyncio
+    async def test_cursor_and_unacked_in_admin(self, server):
+        from cmd_chat.server.models import Message, UserSession
+
+        for i in range(5):
+            server.message_store.add(Message(text=str(i)))
+        server.session_store.add(UserSession(user_id="u1", ip="127.0.0.1", username="bob"))
+        await server.connection_manager.connect("u1", MockStreamWriter(MockTransport()))
+        server._acknowledged(server.session_store.get("u1"), 3, 0)
+
+        result = await server.admin.execute("conn bob")
+
+        assert result["connection"]["acked"] == 3
+        assert result["connection"]["unacked"] == 2
+        assert server.metrics.delivery_lag.count == 0
+
+    @pytest.mark.asyncio
+    async def test_init_sends_only_unacknowledged_history(self, server):
+        from cmd_chat.server.models import Message
+
+        for i in range(5):
+            server.message_store.add(Message(text=str(i)))
+
+        delta = (await self._chat(server, [], since=3))[0]
+        server.session_store.remove("u1")
+        full = (await self._chat(server, [], since=9))[0]
+
+        assert delta["since"] == 3 and delta["seq"] == 5
+        assert [m["text"] for m in delta["messages"]] == ["3", "4"]
+        assert "since" not in full and len(full["messages"]) == 5
+
+    def test_resume_requires_same_room_and_epoch(self, server):
+        import base64
+
+        token = {"room_salt": base64.b64encode(server.room_salt).decode(), "seq": 7}
+        epoch = server.epoch
+
+        assert server._resume_seq({**token, "epoch": epoch}) == 7
+        assert server._resume_seq(token) is None
+        assert server._resume_seq({**token, "epoch": "stale"}) is None
+        assert server._resume_seq({**token, "epoch": epoch, "room_salt": "x"}) is None
+        assert server._resume_seq({**token, "epoch": epoch, "seq": "7"}) is None
+        assert server._resume_seq(None) is None
+
+    def test_seqs_and_epochs_survive_handoff(self):
+        import base64
+        from cmd_chat.server.models import Message
+
+        old = ChatServer("testpassword")
+        for text in "abcde":
+            old.message_store.add(Message(text=text))
+        old.message_store.clear()
+        old.message_store.add(Message(text="f"))
+        state = old.export_state()
+        header = json.loads(state.header())
+        for text in ("late-1", "late-2"):
+            old.message_store.add(Message(text=text))
+
+        new = ChatServer("")
+        new.restore(state)
+        new.message_store.add(Message(text="g"))
+        salt = base64.b64encode(old.room_salt).decode()
+        resume = lambda epoch, seq: new._resume_seq(
+            {"room_salt": salt, "epoch": epoch, "seq": seq}
+        )
+
+        assert header["base"] == 5 and header["epochs"] == {old.epoch: 6}
+        assert [(m.seq, m.text) for m in new.message_store.get_all()] == [
+            (6, "f"),
+            (7, "g"),
+        ]
+        assert resume(old.epoch, 6) == 6
+        assert [m.text for m in new.message_store.since(resume(old.epoch, 6))] == ["g"]
+        assert resume(old.epoch, 8) is None
+        assert resume(new.epoch, 7) == 7
+
+    @pytest.mark.asyncio
+    async def test_client_batches_acks_and_resumes(self, server, monkeypatch):
+        from cmd_chat.client import AsyncChatClient
+        from cmd_chat.client import core
+
+        monkeypatch.setattr(core, "ACK_BATCH", 4)
+
+        sock = server.listen("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        serving = asyncio.create_task(server.serve(sock))
+        alice = AsyncChatClient("127.0.0.1", port, "alice", "testpassword")
+        bob = AsyncChatClient("127.0.0.1", port, "bob", "testpassword")
+        try:
+            await alice.connect()
+            await bob.connect()
+            bob_events = bob.events()
+            assert (await anext(bob_events)).type == "init"
+            for i in range(core.ACK_BATCH):
+                await alice.send(f"m{i}")
+            while bob.last_seq < core.ACK_BATCH:
+                await asyncio.wait_for(anext(bob_events), 2)
+            await asyncio.sleep(0.05)
+
+            assert bob._acked == core.ACK_BATCH
+            assert server.connection_manager.stats[bob.user_id].acked == core.ACK_BATCH
+            assert server.metrics.delivery_lag.count == 1
+
+            await bob_events.aclose()
+            await bob.reconnect()
+            await alice.send("missed")
+            await alice.send("also missed")
+            await asyncio.sleep(0.05)
+            await bob.reconnect()
+            init = await asyncio.wait_for(anext(bob.events()), 2)
+
+            assert init.data["since"] == core.ACK_BATCH
+            assert [bob.message_text(m) for m in init.data["messages"]] == [
+                "missed",
+                "also missed",
+            ]
+            assert len(bob.messages) == core.ACK_BATCH + 2
+        finally:
+            await alice.close()
+            await bob.close()
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+            await server.stop()
+
+
 class MockTransport:
     def __init__(self):
         self.data = b""
         self.closed = False
+        self.buffer_size = 0
+
+    def get_write_buffer_size(self):
+        return self.buffer_size
 
     def get_extra_info(self, name):
         if name == "peername":
@@ -421,6 +1965,10 @@ class MockStreamWriter:
     def __init__(self, transport):
         self._transport = transport
 
+    @property
+    def transport(self):
+        return self._transport
+
     def write(self, data):
         self._transport.data += data
 